@@ -0,0 +1,177 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from instrumentation import PROFILERS, configure, format_stage_summary, read_stage_records, summarize_stage_records
+from pipeline import JobControl, harmonize_file
+from ustx_harms import CHORD_HARMONY, DEFAULT_CURVE_ABBRS, HarmonyJobCancelled, parse_chord_intervals
+
+harmony_types = {'lower': 1, 'upper': 2, 'both': 3, 'chord': CHORD_HARMONY}
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def collect_input_files(patterns, recursive=False, suffix=None):
+    # Directories and globs skip files whose names end in suffix, the outputs of earlier runs; named files are kept.
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*.ustx') if recursive else os.path.join(pattern, '*.ustx')
+        for file_path in sorted(glob.glob(pattern, recursive=recursive)):
+            if not file_path.lower().endswith('.ustx') or file_path in files:
+                continue
+            if suffix and file_path != pattern and os.path.basename(file_path)[:-5].endswith(suffix):
+                continue
+            files.append(file_path)
+    return files
+
+def output_path_for(input_path, output_dir, suffix):
+    base_name = os.path.splitext(os.path.basename(input_path))[0] + suffix + '.ustx'
+    return os.path.join(output_dir or os.path.dirname(input_path), base_name)
+
+def parse_track_selection(value):
+    if value == 'all':
+        return 'all'
+    return [int(item) if item.strip().isdigit() else item.strip() for item in value.split(',') if item.strip()]
+
+def harmonize_job(ustx_file_path, output_file_path, options, job=None):
+    try:
+        summary, error = harmonize_file(ustx_file_path, output_file_path, **options, job=job)
+    except HarmonyJobCancelled:
+        return {'input': ustx_file_path, 'output': output_file_path, 'status': 'cancelled'}
+    except Exception as e:
+        summary, error = {'input': ustx_file_path, 'output': output_file_path}, f"Unexpected error: {e}"
+    summary['status'] = 'error' if error else 'ok'
+    if error:
+        summary['error'] = error
+    return summary
+
+
+class ProgressRelay:
+    # Sends a job's progress to the process that queued it, at most once per interval for each stage.
+    # Cancellation is checked at the same pace, since the event lives in a manager process.
+
+    def __init__(self, job_id, progress_queue, cancel_event, interval=0.2):
+        self.job_id = job_id
+        self.progress_queue = progress_queue
+        self.cancel_event = cancel_event
+        self.interval = interval
+        self.stage = None
+        self.sent = 0.0
+
+    def __call__(self, stage, done=0, total=0):
+        now = time.monotonic()
+        if stage == self.stage and now - self.sent < self.interval and done != total:
+            return
+        if self.cancel_event.is_set():
+            raise HarmonyJobCancelled()
+        self.stage = stage
+        self.sent = now
+        self.progress_queue.put((self.job_id, stage, done, total))
+
+def queued_job(job_id, ustx_file_path, output_file_path, options, progress_queue, cancel_event):
+    # Entry point for the GUI's job queue.
+    return harmonize_job(ustx_file_path, output_file_path, options, JobControl(ProgressRelay(job_id, progress_queue, cancel_event)))
+
+def add_harmony_arguments(parser):
+    parser.add_argument('-t', '--tracks', type=parse_track_selection, default=[0], help="comma-separated track indices or names, or 'all' (default: 0)")
+    parser.add_argument('--harmony-type', choices=harmony_types, default='lower')
+    parser.add_argument('-c', '--chord', type=parse_chord_intervals, default=[-3], help="diatonic intervals for --harmony-type chord, e.g. '-3,5,-8' for a 3rd below, a 5th above and an octave below")
+    parser.add_argument('-i', '--interval', type=int, default=3, help="semitone interval (default: %(default)s)")
+    parser.add_argument('-k', '--key', help="override key detection with this key, e.g. 'C', 'F#' or 'Bb'")
+    parser.add_argument('-m', '--mode', choices=['major', 'minor'], default='major', help="mode used with --key")
+    parser.add_argument('--curves', nargs='?', const=','.join(DEFAULT_CURVE_ABBRS), help="carry these source curves over to the harmony parts (default: %(const)s)")
+    parser.add_argument('--curve-interval', type=int, help="resample carried curves to one point every this many ticks")
+    parser.add_argument('--curve-tolerance', type=float, default=0, help="drop carried curve points that interpolation reproduces within this value")
+    parser.add_argument('--track-key-changes', action='store_true', help="detect key changes and harmonize each section in its own key")
+    parser.add_argument('--window-bars', type=int, default=16, help="bars per key detection window with --track-key-changes (default: %(default)s)")
+    parser.add_argument('--split-rests', type=float, metavar='BARS', help="cut harmony parts at rests of at least this many bars, so edits re-render less")
+    parser.add_argument('--memo-cache', action='store_true', help="reuse harmony results of unchanged tracks from a .harmony-cache.sqlite file next to each project")
+    parser.add_argument('--sidecar', action='store_true', help="write a .harmony-notes.bin sidecar next to each project that lacks a current one, so later runs skip parsing its YAML")
+
+def harmony_options(parser, args):
+    if args.chord is None:
+        parser.error("--chord expects distinct comma-separated interval numbers between 2 and 15, negative for voices below the melody")
+    options = {
+        'selected_tracks': args.tracks,
+        'harmony_type': harmony_types[args.harmony_type],
+        'semitone_interval': args.interval,
+        'manual_key_selection': args.key is not None,
+        'key_name': args.key,
+        'key_mode': args.mode,
+        'track_key_changes': args.track_key_changes,
+        'window_bars': args.window_bars,
+        'use_cache': False,
+        'chord_intervals': args.chord if args.harmony_type == 'chord' else None,
+        'carry_curves': None,
+        'memo_cache': args.memo_cache,
+        'split_rests': args.split_rests,
+        'write_sidecar': args.sidecar,
+    }
+    if args.curves:
+        options['carry_curves'] = {
+            'abbrs': tuple(abbr.strip() for abbr in args.curves.split(',') if abbr.strip()),
+            'interval': args.curve_interval,
+            'tolerance': args.curve_tolerance,
+        }
+    return options
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate harmony tracks for many USTx projects without the GUI.")
+    parser.add_argument('inputs', nargs='+', help="USTx files, glob patterns or directories")
+    parser.add_argument('-r', '--recursive', action='store_true', help="search directories and ** patterns recursively")
+    parser.add_argument('-o', '--output-dir', help="directory for generated projects (default: next to each input)")
+    parser.add_argument('--suffix', default='_harmony', help="suffix appended to output file names (default: %(default)s)")
+    add_harmony_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=available_cores(), help="worker processes (default: available cores)")
+    parser.add_argument('--summary', help="also write all per-file summaries to this JSON file")
+    parser.add_argument('--profile', nargs='?', const='harmony_profile.jsonl', help="append per-stage timings to this JSONL file (default: %(const)s) and print a stage summary")
+    parser.add_argument('--profiler', choices=PROFILERS, help="also dump a cProfile or pyinstrument profile of every file next to the --profile file")
+    parser.add_argument('--log-level', help="diagnostic log level on stderr, e.g. INFO or DEBUG")
+    args = parser.parse_args(argv)
+
+    options = harmony_options(parser, args)
+
+    files = collect_input_files(args.inputs, args.recursive, args.suffix)
+    if not files:
+        print("No .ustx files matched.", file=sys.stderr)
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.profiler and not args.profile:
+        args.profile = 'harmony_profile.jsonl'
+    logging_options = (args.log_level, args.profile, args.profiler, None, False)
+    configure(*logging_options)
+    started = time.time()
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(files))), initializer=configure, initargs=logging_options) as executor:
+        futures = [
+            executor.submit(harmonize_job, file_path, output_path_for(file_path, args.output_dir, args.suffix), options)
+            for file_path in files
+        ]
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            print(json.dumps(summary, ensure_ascii=False), flush=True)
+
+    if args.summary:
+        summaries.sort(key=lambda summary: summary['input'])
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+
+    if args.profile:
+        records = [record for record in read_stage_records(args.profile, started) if record.get('parent') is not None]
+        print(format_stage_summary(summarize_stage_records(records)), file=sys.stderr)
+
+    return 1 if any(summary['status'] == 'error' for summary in summaries) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
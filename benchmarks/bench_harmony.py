@@ -0,0 +1,63 @@
+import argparse
+import random
+import time
+
+from harmony_engine import generate_harmony_tones
+from benchmarks.reference import generate_harmony_notes
+from ustx_harms import is_note_in_key
+
+def reference_generate_harmony_notes(original_notes_for_track, semitone_interval, harmony_type, key_tone_index, key_mode):
+    # The per-note correction loop generate_harmony_notes used before the vectorized engine.
+    harmony_tracks_notes = []
+    for direction, enabled in ((-1, harmony_type in (1, 3)), (1, harmony_type in (2, 3))):
+        if not enabled:
+            continue
+        harmony_notes = []
+        for note in original_notes_for_track:
+            harmony_tone = note['tone'] + direction * semitone_interval
+            original_tone = harmony_tone
+            correction_attempts = 0
+            while not is_note_in_key(harmony_tone, key_tone_index, key_mode) and correction_attempts < 3:
+                harmony_tone -= direction
+                correction_attempts += 1
+            if not is_note_in_key(harmony_tone, key_tone_index, key_mode):
+                harmony_tone = original_tone
+            harmony_notes.append({**note, 'tone': harmony_tone})
+        harmony_tracks_notes.append(harmony_notes)
+    return harmony_tracks_notes
+
+def best_of(repeat, func, *args):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-note harmony loop with the vectorized engine.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--interval', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'notes':>10} {'loop':>10} {'notes API':>10} {'arrays':>10} {'speedup':>9} {'arrays x':>9}")
+    for size in args.sizes:
+        notes = [{'position': i * 480, 'duration': 480, 'tone': rng.randint(36, 84), 'lyric': 'a'} for i in range(size)]
+        tones = [note['tone'] for note in notes]
+        key_tone_index, key_mode = rng.randrange(12), rng.choice(("major", "minor"))
+        repeat = 1 if size >= 1_000_000 else args.repeat
+
+        loop_time, expected = best_of(repeat, reference_generate_harmony_notes, notes, args.interval, 3, key_tone_index, key_mode)
+        notes_time, actual = best_of(repeat, generate_harmony_notes, notes, args.interval, 3, key_tone_index, key_mode)
+        arrays_time, actual_tones = best_of(repeat, generate_harmony_tones, tones, args.interval, 3, key_tone_index, key_mode)
+
+        assert actual == expected, "vectorized notes differ from the reference loop"
+        assert [t.tolist() for t in actual_tones] == [[note['tone'] for note in part] for part in expected], "vectorized tones differ from the reference loop"
+        print(f"{size:>10} {loop_time:>9.4f}s {notes_time:>9.4f}s {arrays_time:>9.4f}s {loop_time / notes_time:>8.1f}x {loop_time / arrays_time:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
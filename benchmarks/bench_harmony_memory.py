@@ -0,0 +1,73 @@
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.reference import generate_harmony_notes
+from benchmarks.synthetic import write_project
+from project_index import ProjectIndex
+from ustx_harms import add_harmony_tracks_to_ustx
+from ustx_project import load_ustx_project
+from ustx_writer import save_ustx_project
+
+def reference_add_harmony_tracks_to_ustx(ustx_data, selected_track_indices, harmony_type, semitone_interval, key_tone_index, key_mode):
+    # How harmony parts were built before HarmonyPart: shallow track copies and one dict per harmony note.
+    project_index = ProjectIndex.from_project(ustx_data)
+    new_tracks = []
+    harmony_names = ["Lower Harmony", "Upper Harmony"]
+    for track_index in selected_track_indices:
+        original_track = ustx_data['tracks'][track_index]
+        harmony_tracks_notes = generate_harmony_notes(project_index.notes(track_index), semitone_interval, harmony_type, key_tone_index, key_mode, project_index.tones(track_index))
+        voice_names = [name for name, enabled in zip(harmony_names, (harmony_type in (1, 3), harmony_type in (2, 3))) if enabled]
+        for harmony_name, harmony_notes in zip(voice_names, harmony_tracks_notes):
+            new_track = original_track.copy()
+            new_track['track_name'] = f"{original_track['track_name']} - {harmony_name}"
+            ustx_data['voice_parts'].append({
+                'duration': ustx_data['voice_parts'][0]['duration'],
+                'name': f"{new_track['track_name']} Part",
+                'comment': "",
+                'track_no': len(ustx_data['tracks']) + len(new_tracks),
+                'position': 0,
+                'notes': harmony_notes,
+                'curves': [],
+            })
+            new_tracks.append(new_track)
+    ustx_data['tracks'].extend(new_tracks)
+    return ustx_data
+
+def current_add_harmony_tracks_to_ustx(ustx_data, selected_track_indices, harmony_type, semitone_interval, key_tone_index, key_mode):
+    return add_harmony_tracks_to_ustx(ustx_data, selected_track_indices, harmony_type, None, semitone_interval, key_tone_index, key_mode)
+
+def measure(build, source_path, output_path, tracks):
+    project, _ = load_ustx_project(source_path)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    build(project, list(range(tracks)), 3, 3, 0, "major")
+    built_time = time.perf_counter() - start
+    retained, _ = tracemalloc.get_traced_memory()
+    save_ustx_project(project, output_path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return built_time, elapsed, retained, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="tracemalloc comparison of harmony part construction for a 'Both' job.")
+    parser.add_argument('--tracks', type=int, default=4)
+    parser.add_argument('--parts', type=int, default=4, help="parts per track")
+    parser.add_argument('--notes', type=int, default=2000, help="notes per part")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = write_project(os.path.join(temp_dir, 'source.ustx'), tracks=args.tracks, parts_per_track=args.parts, notes_per_part=args.notes, curve_density=0)
+        output_path = os.path.join(temp_dir, 'output.ustx')
+        print(f"{args.tracks} tracks x {args.parts} parts x {args.notes} notes, 'Both' harmony")
+        for name, build in (('dict notes (before)', reference_add_harmony_tracks_to_ustx), ('HarmonyPart (after)', current_add_harmony_tracks_to_ustx)):
+            built_time, elapsed, retained, peak = measure(build, source_path, output_path, args.tracks)
+            print(f"  {name:<20} build {built_time:7.3f} s  build+save {elapsed:7.3f} s  retained after build {retained / 2**20:8.1f} MiB  peak {peak / 2**20:8.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What the command line modes and the pipeline need: YAML and the standard library, never numpy or Qt.
+CORE_MODULES = ('ustx_harms', 'ustx_project', 'ustx_writer', 'pipeline')
+HEAVY_MODULES = ('numpy', 'PyQt6', 'colorama')
+
+FIRST_WINDOW_SCRIPT = """
+import sys
+import main
+app, window = main.create_window(sys.argv[:1])
+app.processEvents()
+print('shown', flush=True)
+"""
+
+def parse_importtime(stderr):
+    # {module: (self us, cumulative us, depth)} from the lines -X importtime writes to stderr.
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+def core_import_time(modules):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True,
+    )
+    imported = parse_importtime(result.stderr)
+    # Top-level entries are the modules imported directly; their cumulative times add up to the whole import.
+    total_us = sum(cumulative for _, cumulative, depth in imported.values() if depth == 0)
+    return total_us / 1e6, imported
+
+def first_window_time(env):
+    # From process start to the main window being shown and painted once, interpreter start-up included.
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', FIRST_WINDOW_SCRIPT], cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        line = process.stdout.readline()
+        elapsed = time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+    if line.strip() != 'shown':
+        raise RuntimeError("the GUI did not start")
+    return elapsed
+
+def interpreter_start_time():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the core modules and the GUI's time to first window.")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--core-target', type=float, default=0.1, help="seconds allowed for importing the core modules (default: %(default)s)")
+    parser.add_argument('--gui-target', type=float, default=1.0, help="seconds allowed from process start to the first window (default: %(default)s)")
+    parser.add_argument('--no-gui', action='store_true', help="skip the GUI measurement, e.g. where PyQt6 is not installed")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    failures = []
+    core_times = []
+    for _ in range(args.rounds):
+        elapsed, imported = core_import_time(CORE_MODULES)
+        core_times.append(elapsed)
+    core_time = statistics.median(core_times)
+    print(f"core import ({', '.join(CORE_MODULES)}): median {core_time * 1000:.1f} ms over {args.rounds} rounds (target {args.core_target * 1000:.0f} ms)")
+    print(f"  {'module':<40} {'self ms':>8} {'cumul. ms':>10}")
+    for name, (self_us, cumulative_us, _) in sorted(imported.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {name:<40} {self_us / 1000:>8.2f} {cumulative_us / 1000:>10.2f}")
+    if core_time > args.core_target:
+        failures.append(f"core import took {core_time * 1000:.1f} ms")
+    heavy = [name for name in HEAVY_MODULES if name in imported]
+    if heavy:
+        failures.append(f"core import loaded {', '.join(heavy)}")
+
+    interpreter_time = statistics.median(interpreter_start_time() for _ in range(args.rounds))
+    print(f"interpreter start-up: median {interpreter_time * 1000:.1f} ms")
+
+    if not args.no_gui:
+        env = dict(os.environ)
+        if sys.platform.startswith('linux') and not env.get('DISPLAY') and not env.get('WAYLAND_DISPLAY'):
+            env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        window_time = statistics.median(first_window_time(env) for _ in range(args.rounds))
+        print(f"GUI time to first window: median {window_time * 1000:.1f} ms (target {args.gui_target * 1000:.0f} ms)")
+        if window_time > args.gui_target:
+            failures.append(f"first window took {window_time * 1000:.1f} ms")
+
+    if failures:
+        print(f"\n{len(failures)} target(s) missed:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import yaml
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from benchmarks.synthetic import write_project
+from ustx_harms import get_ustx_data
+from ustx_project import load_ustx_project
+
+def load_pure_python(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+def load_c_full(file_path):
+    return get_ustx_data(file_path)[0]
+
+def load_lazy(file_path):
+    return load_ustx_project(file_path)[0]
+
+LOADERS = {
+    'safe_load (pure Python)': load_pure_python,
+    'get_ustx_data (CSafeLoader)': load_c_full,
+    'load_ustx_project (lazy)': load_lazy,
+}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS.
+    return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
+
+def measure(name, file_path, queue):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    LOADERS[name](file_path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, baseline, peak_rss_mb()))
+
+def run_isolated(name, file_path):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(name, file_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare USTx load time and peak RSS across loaders.")
+    parser.add_argument('files', nargs='*', help="USTx files to load (default: a generated synthetic project)")
+    parser.add_argument('--notes', type=int, default=5000, help="notes per part for the synthetic project")
+    parser.add_argument('--tracks', type=int, default=4)
+    parser.add_argument('--parts', type=int, default=4, help="parts per track for the synthetic project")
+    args = parser.parse_args()
+
+    files = args.files
+    temp_dir = None
+    if not files:
+        temp_dir = tempfile.TemporaryDirectory()
+        files = [write_project(os.path.join(temp_dir.name, 'synthetic.ustx'), tracks=args.tracks, parts_per_track=args.parts, notes_per_part=args.notes)]
+
+    for file_path in files:
+        print(f"{file_path} ({os.path.getsize(file_path) / (1024 * 1024):.1f} MiB)")
+        for name in LOADERS:
+            elapsed, baseline, peak = run_isolated(name, file_path)
+            rss = f"peak RSS {peak:.0f} MiB (+{peak - baseline:.0f})" if peak is not None else "peak RSS n/a"
+            print(f"  {name:<30} {elapsed:8.3f} s   {rss}")
+
+    if temp_dir:
+        temp_dir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import write_project
+from pipeline import harmonize_file
+from ustx_project import load_ustx_project
+from ustx_sidecar import save_sidecar, sidecar_path_for
+
+# The same song harmonized with different settings, as a batch pipeline would.
+SETTINGS = {
+    'lower': {'harmony_type': 1, 'semitone_interval': 3},
+    'both, key changes': {'harmony_type': 3, 'semitone_interval': 4, 'track_key_changes': True},
+    'chord': {'harmony_type': 4, 'semitone_interval': 3, 'chord_intervals': [-3, 5, -8]},
+}
+
+def run_settings(source_path, output_dir, label):
+    timings = {}
+    for name, settings in SETTINGS.items():
+        output_path = os.path.join(output_dir, f"{label} {name}.ustx")
+        summary, error = harmonize_file(source_path, output_path, 'all', use_cache=False, **settings)
+        if error:
+            raise RuntimeError(f"{name}: {error}")
+        timings[name] = summary['timings']
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Harmonize one project with several settings from its YAML and from its binary sidecar.")
+    parser.add_argument('--tracks', type=int, default=2)
+    parser.add_argument('--parts', type=int, default=4, help="parts per track")
+    parser.add_argument('--notes', type=int, default=2000, help="notes per part")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = write_project(os.path.join(temp_dir, 'source.ustx'), tracks=args.tracks, parts_per_track=args.parts, notes_per_part=args.notes)
+        print(f"{args.tracks} tracks x {args.parts} parts x {args.notes} notes ({os.path.getsize(source_path) / 2**20:.1f} MiB)")
+
+        yaml_timings = run_settings(source_path, temp_dir, 'yaml')
+        start = time.perf_counter()
+        project, _ = load_ustx_project(source_path, use_sidecar=False)
+        stats, error = save_sidecar(project)
+        if error:
+            print(error, file=sys.stderr)
+            return 1
+        print(f"sidecar export {time.perf_counter() - start:.3f} s ({stats['bytes_written'] / 2**20:.2f} MiB at {os.path.basename(sidecar_path_for(source_path))})")
+        sidecar_timings = run_settings(source_path, temp_dir, 'sidecar')
+
+        print(f"  {'settings':<20} {'source':<8} {'load':>8} {'key':>8} {'generate':>9} {'save':>8} {'total':>8}")
+        mismatches = []
+        for name in SETTINGS:
+            for label, timings in (('yaml', yaml_timings[name]), ('sidecar', sidecar_timings[name])):
+                print(f"  {name:<20} {label:<8} {timings['load']:8.3f} {timings['key_detect']:8.3f} {timings['generate']:9.3f} {timings['save']:8.3f} {timings['total']:8.3f}")
+            with open(os.path.join(temp_dir, f"yaml {name}.ustx"), 'rb') as a, open(os.path.join(temp_dir, f"sidecar {name}.ustx"), 'rb') as b:
+                if a.read() != b.read():
+                    mismatches.append(name)
+        if mismatches:
+            print(f"outputs differ between YAML and sidecar runs: {', '.join(mismatches)}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
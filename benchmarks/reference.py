@@ -0,0 +1,11 @@
+from harmony_engine import generate_harmony_tones
+
+
+def generate_harmony_notes(original_notes_for_track, semitone_interval, harmony_type, key_tone_index, key_mode, tones=None, key_ids=None):
+    # How harmony notes were built before HarmonyPart: one copied dict per source note and voice.
+    if tones is None:
+        tones = [note['tone'] for note in original_notes_for_track]
+    harmony_tracks_notes = []
+    for harmony_tones in generate_harmony_tones(tones, semitone_interval, harmony_type, key_tone_index, key_mode, key_ids):
+        harmony_tracks_notes.append([{**note, 'tone': tone} for note, tone in zip(original_notes_for_track, harmony_tones.tolist())])
+    return harmony_tracks_notes
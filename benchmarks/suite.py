@@ -0,0 +1,250 @@
+import argparse
+import copy
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import LYRIC_SCRIPTS, write_project
+from harmony_engine import generate_harmony_tones
+from project_index import ProjectIndex
+from ustx_harms import add_harmony_tracks_to_ustx, get_key_from_notes, get_ustx_data, save_ustx_data
+from ustx_project import load_ustx_project
+from ustx_writer import save_ustx_project
+
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json')
+HISTORY_VERSION = 1
+
+SCENARIOS = {
+    'small': {'tracks': 1, 'parts_per_track': 2, 'notes_per_part': 200, 'curve_density': 2},
+    'medium': {'tracks': 4, 'parts_per_track': 4, 'notes_per_part': 1000, 'curve_density': 4},
+    'large': {'tracks': 8, 'parts_per_track': 8, 'notes_per_part': 2000, 'curve_density': 4},
+    'dense-curves': {'tracks': 2, 'parts_per_track': 2, 'notes_per_part': 500, 'curve_density': 40},
+    'hiragana': {'tracks': 2, 'parts_per_track': 2, 'notes_per_part': 500, 'curve_density': 2, 'lyric_script': 'hiragana'},
+    'hangul': {'tracks': 2, 'parts_per_track': 2, 'notes_per_part': 500, 'curve_density': 2, 'lyric_script': 'hangul'},
+    'mixed-scripts': {'tracks': 2, 'parts_per_track': 2, 'notes_per_part': 500, 'curve_density': 2, 'lyric_script': 'mixed'},
+}
+DEFAULT_SCENARIOS = ['small', 'medium', 'hiragana', 'dense-curves']
+
+HARMONY_TYPE = 3
+INTERVAL = 3
+
+
+class Stage:
+    # One timed step. setup() builds fresh arguments outside the timed region, like pytest-benchmark's pedantic mode.
+
+    def __init__(self, name, func, setup):
+        self.name = name
+        self.func = func
+        self.setup = setup
+
+
+def build_stages(source_path, output_dir):
+    project_data, _ = get_ustx_data(source_path)
+    track_nos = list(range(len(project_data['tracks'])))
+    project_index = ProjectIndex.from_project(project_data)
+    notes = project_index.notes(0)
+    key_tone_index, _, key_mode = get_key_from_notes(notes, verbose=False)
+    harmonized = add_harmony_tracks_to_ustx(copy.deepcopy(project_data), track_nos, HARMONY_TYPE, None, INTERVAL, key_tone_index, key_mode)
+    lazy_harmonized, _ = load_ustx_project(source_path)
+    add_harmony_tracks_to_ustx(lazy_harmonized, track_nos, HARMONY_TYPE, None, INTERVAL, key_tone_index, key_mode)
+    output_path = os.path.join(output_dir, 'output.ustx')
+
+    def no_setup():
+        return ()
+
+    def fresh_data():
+        return (copy.deepcopy(project_data),)
+
+    def add_harmony(ustx_data):
+        return add_harmony_tracks_to_ustx(ustx_data, track_nos, HARMONY_TYPE, None, INTERVAL, key_tone_index, key_mode)
+
+    return [
+        Stage('get_ustx_data', lambda: get_ustx_data(source_path), no_setup),
+        Stage('load_ustx_project', lambda: load_ustx_project(source_path), no_setup),
+        Stage('project_index', lambda: ProjectIndex.from_project(project_data), no_setup),
+        Stage('get_key_from_notes', lambda: get_key_from_notes(notes, verbose=False), no_setup),
+        Stage('generate_harmony_tones', lambda: generate_harmony_tones(project_index.tones(0), INTERVAL, HARMONY_TYPE, key_tone_index, key_mode), no_setup),
+        Stage('add_harmony_tracks_to_ustx', add_harmony, fresh_data),
+        Stage('save_ustx_data', lambda: save_ustx_data(harmonized, output_path), no_setup),
+        Stage('save_ustx_project', lambda: save_ustx_project(lazy_harmonized, output_path), no_setup),
+    ]
+
+def time_stage(stage, rounds, warmup):
+    for _ in range(warmup):
+        stage.func(*stage.setup())
+    timings = []
+    for _ in range(rounds):
+        args = stage.setup()
+        gc.collect()
+        start = time.perf_counter()
+        stage.func(*args)
+        timings.append(time.perf_counter() - start)
+    return {
+        'min': min(timings),
+        'max': max(timings),
+        'mean': statistics.fmean(timings),
+        'median': statistics.median(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': rounds,
+    }
+
+def peak_memory(stage):
+    # Measured in a separate round so tracemalloc overhead never shows up in the timings.
+    args = stage.setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage.func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def machine_info():
+    return {
+        'node': platform.node(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'python_implementation': platform.python_implementation(),
+        'python_version': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def machine_key(info):
+    return (info.get('node'), info.get('machine'), info.get('python_implementation'), info.get('python_version'))
+
+def commit_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(DEFAULT_HISTORY), timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return commit.stdout.strip() or None
+
+def load_history(history_path):
+    if not os.path.exists(history_path):
+        return {'version': HISTORY_VERSION, 'runs': []}
+    with open(history_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_history(history, history_path):
+    temp_path = history_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    os.replace(temp_path, history_path)
+
+def result_key(result):
+    return result['scenario'], json.dumps(result['params'], sort_keys=True), result['stage']
+
+def previous_results(history, info):
+    # Latest result per scenario/stage recorded on this machine and interpreter.
+    baseline = {}
+    for run in history['runs']:
+        if machine_key(run['machine_info']) != machine_key(info):
+            continue
+        for result in run['results']:
+            baseline[result_key(result)] = (run, result)
+    return baseline
+
+def find_regressions(results, baseline, time_threshold, memory_threshold, min_delta):
+    regressions = []
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None:
+            continue
+        run, previous_result = previous
+        old_median = previous_result['stats']['median']
+        new_median = result['stats']['median']
+        if new_median > old_median * (1 + time_threshold) and new_median - old_median > min_delta:
+            regressions.append(f"{result['scenario']}/{result['stage']}: median {old_median * 1000:.2f} ms -> {new_median * 1000:.2f} ms (since {run.get('commit') or run['datetime']})")
+        old_peak = previous_result['peak_memory']
+        new_peak = result['peak_memory']
+        if old_peak and new_peak > old_peak * (1 + memory_threshold):
+            regressions.append(f"{result['scenario']}/{result['stage']}: peak memory {old_peak / 2**20:.2f} MiB -> {new_peak / 2**20:.2f} MiB (since {run.get('commit') or run['datetime']})")
+    return regressions
+
+def print_results(scenario, results):
+    print(f"\n---- {scenario} " + "-" * max(0, 92 - len(scenario)))
+    print(f"{'Name':<28} {'Min (ms)':>10} {'Max (ms)':>10} {'Mean (ms)':>10} {'StdDev':>10} {'Median':>10} {'Rounds':>7} {'Peak MiB':>9}")
+    for result in results:
+        stats = result['stats']
+        print(
+            f"{result['stage']:<28} {stats['min'] * 1000:>10.3f} {stats['max'] * 1000:>10.3f} {stats['mean'] * 1000:>10.3f} "
+            f"{stats['stddev'] * 1000:>10.3f} {stats['median'] * 1000:>10.3f} {stats['rounds']:>7} {result['peak_memory'] / 2**20:>9.2f}"
+        )
+
+def run_scenario(scenario, params, rounds, warmup, stage_filter, seed):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = write_project(os.path.join(temp_dir, 'source.ustx'), seed=seed, **params)
+        for stage in build_stages(source_path, temp_dir):
+            if stage_filter and stage.name not in stage_filter:
+                continue
+            results.append({
+                'scenario': scenario,
+                'params': {**params, 'seed': seed},
+                'stage': stage.name,
+                'stats': time_stage(stage, rounds, warmup),
+                'peak_memory': peak_memory(stage),
+            })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and measure the harmony pipeline stages on synthetic USTx projects.")
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS), help=f"scenario to run, repeatable (default: {', '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument('--tracks', type=int, help="run a custom scenario with this many tracks")
+    parser.add_argument('--parts', type=int, default=2, help="parts per track for the custom scenario")
+    parser.add_argument('--notes', type=int, default=500, help="notes per part for the custom scenario")
+    parser.add_argument('--curve-density', type=int, default=4, help="curve points per note for the custom scenario")
+    parser.add_argument('--lyric-script', choices=sorted(LYRIC_SCRIPTS), default='latin', help="lyric script for the custom scenario")
+    parser.add_argument('--stage', action='append', help="only run this stage, repeatable")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help="JSON history file (default: benchmarks/history.json)")
+    parser.add_argument('--no-save', action='store_true', help="compare against the history without recording this run")
+    parser.add_argument('--time-threshold', type=float, default=0.25, help="allowed median slowdown before failing (default: 0.25 = 25%%)")
+    parser.add_argument('--memory-threshold', type=float, default=0.10, help="allowed peak memory growth before failing (default: 0.10 = 10%%)")
+    parser.add_argument('--min-delta', type=float, default=0.002, help="ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args(argv)
+
+    scenarios = {name: SCENARIOS[name] for name in (args.scenario or ([] if args.tracks else DEFAULT_SCENARIOS))}
+    if args.tracks:
+        scenarios['custom'] = {'tracks': args.tracks, 'parts_per_track': args.parts, 'notes_per_part': args.notes, 'curve_density': args.curve_density, 'lyric_script': args.lyric_script}
+
+    results = []
+    for scenario, params in scenarios.items():
+        scenario_results = run_scenario(scenario, params, args.rounds, args.warmup, args.stage, args.seed)
+        print_results(scenario, scenario_results)
+        results.extend(scenario_results)
+
+    info = machine_info()
+    history = load_history(args.history)
+    regressions = find_regressions(results, previous_results(history, info), args.time_threshold, args.memory_threshold, args.min_delta)
+
+    if not args.no_save:
+        history['runs'].append({
+            'datetime': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit_info(),
+            'machine_info': info,
+            'results': results,
+        })
+        save_history(history, args.history)
+        print(f"\nSaved {len(results)} results to {args.history}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import random
+
+import yaml
+
+from ustx_project import UstxDumper
+
+LYRICS = ['a', 'i', 'u', 'e', 'o', 'ka', 'sa', 'ta', 'na', 'ra']
+
+LYRIC_SCRIPTS = {
+    'latin': LYRICS,
+    'hiragana': ['あ', 'い', 'う', 'え', 'お', 'か', 'さ', 'た', 'な', 'ら', 'ん'],
+    'hangul': ['가', '나', '다', '라', '마', '사', '아', '자', '하', '랑'],
+    'cjk': ['我', '你', '爱', '心', '天', '风', '月', '夜', '梦', '花'],
+    'mixed': ['a', 'ka', 'あ', 'ん', '가', '랑', '爱', '梦', '+', '-'],
+}
+
+def make_note(rng, position, duration, tone, lyrics=LYRICS):
+    return {
+        'position': position,
+        'duration': duration,
+        'tone': tone,
+        'lyric': rng.choice(lyrics),
+        'pitch': {
+            'data': [{'x': -40, 'y': 0, 'shape': 'io'}, {'x': 40, 'y': 0, 'shape': 'io'}],
+            'snap_first': True,
+        },
+        'vibrato': {'length': 0, 'period': 175, 'depth': 25, 'in': 10, 'out': 10, 'shift': 0, 'drift': 0, 'vol_link': 0},
+        'phoneme_expressions': [],
+        'phoneme_overrides': [],
+    }
+
+def make_curve(rng, abbr, duration, points):
+    interval = max(5, duration // max(points, 1) // 5 * 5)
+    xs = list(range(0, duration, interval))
+    ys = [rng.randint(-50, 50) for _ in xs]
+    return {'xs': xs, 'ys': ys, 'abbr': abbr}
+
+def generate_project(tracks=2, parts_per_track=4, notes_per_part=500, curve_density=4, lyric_script='latin', seed=0):
+    rng = random.Random(seed)
+    lyrics = LYRIC_SCRIPTS[lyric_script]
+    scale = [0, 2, 4, 5, 7, 9, 11]
+    project = {
+        'name': 'Synthetic',
+        'comment': '',
+        'output_dir': 'Vocal',
+        'cache_dir': 'UCache',
+        'ustx_version': '0.6',
+        'resolution': 480,
+        'bpm': 120,
+        'beat_per_bar': 4,
+        'beat_unit': 4,
+        'expressions': {},
+        'time_signatures': [{'bar_position': 0, 'beat_per_bar': 4, 'beat_unit': 4}],
+        'tempos': [{'position': 0, 'bpm': 120}],
+        'tracks': [],
+        'voice_parts': [],
+        'wave_parts': [],
+    }
+
+    for track_no in range(tracks):
+        project['tracks'].append({
+            'singer': 'Synthetic Singer',
+            'phonemizer': 'OpenUtau.Core.DefaultPhonemizer',
+            'renderer_settings': {'renderer': 'CLASSIC'},
+            'track_name': f"Track{track_no + 1}",
+            'track_color': 'Blue',
+            'mute': False,
+            'solo': False,
+            'volume': 0,
+            'pan': 0,
+            'voice_color_names': [''],
+        })
+        part_position = 0
+        for part_index in range(parts_per_track):
+            notes = []
+            position = 0
+            for _ in range(notes_per_part):
+                duration = rng.choice((120, 240, 480, 960))
+                tone = 60 + rng.choice(scale) + 12 * rng.randint(-1, 1)
+                notes.append(make_note(rng, position, duration, tone, lyrics))
+                position += duration + rng.choice((0, 0, 0, 240))
+            curves = []
+            if curve_density:
+                curves = [make_curve(rng, abbr, position, curve_density * notes_per_part) for abbr in ('dyn', 'pitd')]
+            project['voice_parts'].append({
+                'duration': position,
+                'name': f"Part {part_index + 1}",
+                'comment': '',
+                'track_no': track_no,
+                'position': part_position,
+                'notes': notes,
+                'curves': curves,
+            })
+            part_position += position
+
+    return project
+
+def write_project(file_path, **kwargs):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        yaml.dump(generate_project(**kwargs), f, Dumper=UstxDumper, allow_unicode=True, indent=2, sort_keys=False)
+    return file_path
@@ -1,27 +1,49 @@
 import os
 import sys
+import time
 
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QLabel, QPushButton, QVBoxLayout, QWidget,
-    QFileDialog, QLineEdit, QListWidget, QRadioButton, QSpinBox, QComboBox,
-    QCheckBox, QGridLayout, QMessageBox, QStatusBar, QMenuBar, QMenu
+    QFileDialog, QLineEdit, QListWidget, QRadioButton, QSpinBox, QDoubleSpinBox, QComboBox,
+    QCheckBox, QGridLayout, QMessageBox, QStatusBar, QMenuBar, QMenu, QTableView, QTabWidget, QHBoxLayout,
+    QAbstractItemView
 )
-from PyQt6.QtCore import Qt, QThreadPool, QLocale, QTranslator, QDir
+from PyQt6.QtCore import Qt, QThreadPool, QLocale, QTranslator, QDir, QTimer
 from PyQt6.QtGui import QIcon
 
-from ustx_harms import get_ustx_data, get_track_names, key_names
+from batch import output_path_for
+from instrumentation import get_logger, read_stage_records, sink_path
+from job_queue import JobQueue, JobQueueModel, QueuedJob
+from preview import HarmonyPreviewModel, PreviewCache, PreviewWorker
+from ustx_harms import CHORD_HARMONY, get_track_names, key_names, parse_chord_intervals
+from project_cache import load_ustx_project_cached
 from worker import HarmonyGeneratorWorker
 
+logger = get_logger("gui")
+
 class HarmonyGeneratorGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("USTx Auto Harmony Generator") 
-        self.setGeometry(100, 100, 600, 500)
+        self.setGeometry(100, 100, 700, 800)
 
         self.threadpool = QThreadPool()
         self.translator = QTranslator()
         self.current_locale = "en_US"
 
+        self.project = None
+        self.project_index = None
+        self.preview_cache = PreviewCache()
+        self.preview_request_key = None
+        self.active_worker = None
+        self.job_started = None
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(250)
+        self.preview_timer.timeout.connect(self.update_preview)
+        self.job_queue = JobQueue(parent=self)
+        self.job_queue.finished.connect(self.queue_finished)
+
         self.init_ui()
         self.load_language(self.current_locale)
 
@@ -92,6 +114,8 @@ class HarmonyGeneratorGUI(QMainWindow):
         track_frame_layout.addWidget(self.harmony_type_radio_lower, 1, 2, 1, 1)
         track_frame_layout.addWidget(self.harmony_type_radio_upper, 2, 2, 1, 1)
         track_frame_layout.addWidget(self.harmony_type_radio_both, 3, 2, 1, 1)
+        self.harmony_type_radio_chord = QRadioButton(self.tr("Chord"))
+        track_frame_layout.addWidget(self.harmony_type_radio_chord, 4, 2, 1, 1)
 
         interval_label = QLabel(self.tr("Interval (semitones):"))
         track_frame_layout.addWidget(interval_label, 4, 0, 1, 1)
@@ -101,6 +125,43 @@ class HarmonyGeneratorGUI(QMainWindow):
         self.semitone_interval_spinbox.setValue(3)
         track_frame_layout.addWidget(self.semitone_interval_spinbox, 4, 1, 1, 1)
 
+        self.chord_intervals_label = QLabel(self.tr("Chord Intervals:"))
+        track_frame_layout.addWidget(self.chord_intervals_label, 5, 0, 1, 1)
+        self.chord_intervals_entry = QLineEdit("-3, 5, -8")
+        self.chord_intervals_entry.setToolTip(self.tr("Diatonic intervals, negative below the melody: -3 = 3rd below, 5 = 5th above, -8 = octave below"))
+        self.chord_intervals_entry.setEnabled(False)
+        track_frame_layout.addWidget(self.chord_intervals_entry, 5, 1, 1, 2)
+
+        self.carry_curves_checkbox = QCheckBox(self.tr("Carry Over Curves"))
+        self.carry_curves_checkbox.setToolTip(self.tr("Copy dynamics, breathiness and pitch deviation curves to the harmony parts"))
+        track_frame_layout.addWidget(self.carry_curves_checkbox, 6, 0, 1, 1)
+        self.curve_tolerance_label = QLabel(self.tr("Curve Tolerance:"))
+        track_frame_layout.addWidget(self.curve_tolerance_label, 6, 1, 1, 1)
+        self.curve_tolerance_spinbox = QSpinBox()
+        self.curve_tolerance_spinbox.setRange(0, 50)
+        self.curve_tolerance_spinbox.setValue(2)
+        self.curve_tolerance_spinbox.setToolTip(self.tr("Drop curve points that stay within this value of the line through their neighbours (0 keeps all points)"))
+        self.curve_tolerance_spinbox.setEnabled(False)
+        self.carry_curves_checkbox.toggled.connect(self.curve_tolerance_spinbox.setEnabled)
+        track_frame_layout.addWidget(self.curve_tolerance_spinbox, 6, 2, 1, 1)
+
+        self.memo_cache_checkbox = QCheckBox(self.tr("Reuse Unchanged Tracks"))
+        self.memo_cache_checkbox.setToolTip(self.tr("Keep harmony results in a cache file next to the project and skip tracks whose notes did not change"))
+        track_frame_layout.addWidget(self.memo_cache_checkbox, 7, 0, 1, 3)
+
+        self.split_rests_checkbox = QCheckBox(self.tr("Split Parts at Rests"))
+        self.split_rests_checkbox.setToolTip(self.tr("Cut harmony parts at long rests so OpenUtau re-renders less after an edit"))
+        track_frame_layout.addWidget(self.split_rests_checkbox, 8, 0, 1, 1)
+        self.split_rests_label = QLabel(self.tr("Rest Length (bars):"))
+        track_frame_layout.addWidget(self.split_rests_label, 8, 1, 1, 1)
+        self.split_rests_spinbox = QDoubleSpinBox()
+        self.split_rests_spinbox.setRange(0.25, 16)
+        self.split_rests_spinbox.setSingleStep(0.25)
+        self.split_rests_spinbox.setValue(1)
+        self.split_rests_spinbox.setEnabled(False)
+        self.split_rests_checkbox.toggled.connect(self.split_rests_spinbox.setEnabled)
+        track_frame_layout.addWidget(self.split_rests_spinbox, 8, 2, 1, 1)
+
         layout.addWidget(track_frame)
 
         key_frame_layout = QGridLayout()
@@ -129,12 +190,91 @@ class HarmonyGeneratorGUI(QMainWindow):
         self.key_mode_combobox.setEnabled(False)
         key_frame_layout.addWidget(self.key_mode_combobox, 2, 1, 1, 1)
 
+        self.track_key_changes_checkbox = QCheckBox(self.tr("Follow Key Changes"))
+        key_frame_layout.addWidget(self.track_key_changes_checkbox, 3, 0, 1, 2)
+
         layout.addWidget(key_frame)
 
+        self.tabs = QTabWidget()
+        layout.addWidget(self.tabs, 1)
+
+        preview_tab = QWidget()
+        preview_layout = QVBoxLayout(preview_tab)
+        self.preview_label = QLabel(self.tr("Preview"))
+        preview_layout.addWidget(self.preview_label)
+
+        self.preview_model = HarmonyPreviewModel(self)
+        self.preview_table = QTableView()
+        self.preview_table.setModel(self.preview_model)
+        self.preview_table.verticalHeader().setDefaultSectionSize(20)
+        preview_layout.addWidget(self.preview_table, 1)
+        self.tabs.addTab(preview_tab, self.tr("Preview"))
+
+        queue_tab = QWidget()
+        queue_layout = QVBoxLayout(queue_tab)
+        self.queue_model = JobQueueModel(self.job_queue, self)
+        self.queue_table = QTableView()
+        self.queue_table.setModel(self.queue_model)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.queue_table.verticalHeader().setDefaultSectionSize(20)
+        self.queue_table.horizontalHeader().setStretchLastSection(True)
+        queue_layout.addWidget(self.queue_table, 1)
+
+        queue_buttons = QHBoxLayout()
+        self.add_job_button = QPushButton(self.tr("Add Current"))
+        self.add_job_button.setToolTip(self.tr("Queue the current file with the selected tracks and settings"))
+        self.add_job_button.clicked.connect(self.add_current_job)
+        queue_buttons.addWidget(self.add_job_button)
+        self.add_files_button = QPushButton(self.tr("Add Files..."))
+        self.add_files_button.setToolTip(self.tr("Queue several files with the current settings; the selected track names are used, or all tracks"))
+        self.add_files_button.clicked.connect(self.add_files_to_queue)
+        queue_buttons.addWidget(self.add_files_button)
+        self.remove_jobs_button = QPushButton(self.tr("Remove"))
+        self.remove_jobs_button.clicked.connect(self.remove_selected_jobs)
+        queue_buttons.addWidget(self.remove_jobs_button)
+        self.clear_finished_button = QPushButton(self.tr("Clear Finished"))
+        self.clear_finished_button.setToolTip(self.tr("Remove jobs that have completed, failed or been cancelled"))
+        self.clear_finished_button.clicked.connect(self.job_queue.clear_finished)
+        queue_buttons.addWidget(self.clear_finished_button)
+        self.parallel_jobs_label = QLabel(self.tr("Parallel Jobs:"))
+        queue_buttons.addWidget(self.parallel_jobs_label)
+        self.parallel_jobs_spinbox = QSpinBox()
+        self.parallel_jobs_spinbox.setRange(1, max(1, os.cpu_count() or 1))
+        self.parallel_jobs_spinbox.setValue(self.job_queue.max_concurrent)
+        self.parallel_jobs_spinbox.valueChanged.connect(self.job_queue.set_max_concurrent)
+        queue_buttons.addWidget(self.parallel_jobs_spinbox)
+        self.start_queue_button = QPushButton(self.tr("Start Queue"))
+        self.start_queue_button.clicked.connect(self.start_queue)
+        queue_buttons.addWidget(self.start_queue_button)
+        self.cancel_queue_button = QPushButton(self.tr("Cancel Queue"))
+        self.cancel_queue_button.clicked.connect(self.cancel_queue)
+        self.cancel_queue_button.setEnabled(False)
+        queue_buttons.addWidget(self.cancel_queue_button)
+        queue_layout.addLayout(queue_buttons)
+        self.tabs.addTab(queue_tab, self.tr("Job Queue"))
+
+        self.track_listbox.itemSelectionChanged.connect(self.schedule_preview)
+        self.harmony_type_radio_lower.toggled.connect(self.schedule_preview)
+        self.harmony_type_radio_upper.toggled.connect(self.schedule_preview)
+        self.harmony_type_radio_both.toggled.connect(self.schedule_preview)
+        self.harmony_type_radio_chord.toggled.connect(self.toggle_chord_mode)
+        self.harmony_type_radio_chord.toggled.connect(self.schedule_preview)
+        self.chord_intervals_entry.textChanged.connect(self.schedule_preview)
+        self.semitone_interval_spinbox.valueChanged.connect(self.schedule_preview)
+        self.manual_key_checkbox.stateChanged.connect(self.schedule_preview)
+        self.key_name_combobox.currentIndexChanged.connect(self.schedule_preview)
+        self.key_mode_combobox.currentIndexChanged.connect(self.schedule_preview)
+        self.track_key_changes_checkbox.stateChanged.connect(self.schedule_preview)
+
         self.generate_button = QPushButton(self.tr("Generate Harmonies"))
         self.generate_button.clicked.connect(self.start_harmony_generation)
         layout.addWidget(self.generate_button)
 
+        self.cancel_button = QPushButton(self.tr("Cancel"))
+        self.cancel_button.clicked.connect(self.cancel_harmony_generation)
+        self.cancel_button.setEnabled(False)
+        layout.addWidget(self.cancel_button)
+
         self.status_bar = QStatusBar(self)
         self.setStatusBar(self.status_bar)
         self.status_bar_label = QLabel(self.tr("Ready"))
@@ -153,63 +293,280 @@ class HarmonyGeneratorGUI(QMainWindow):
             self.output_file_entry.setText(file_path)
 
     def load_track_names(self, ustx_file_path):
-        ustx_data, error_msg = get_ustx_data(ustx_file_path)
+        ustx_data, error_msg = load_ustx_project_cached(ustx_file_path)
         if error_msg:
             QMessageBox.critical(self, self.tr("Error"), self.tr("Error loading USTx file:\n") + error_msg)
             return
 
+        self.project = ustx_data
+        from project_index import ProjectIndex
+        self.project_index = ProjectIndex.from_project(ustx_data)
+        self.preview_cache.clear()
+        self.preview_model.set_preview(None)
+
         track_names = get_track_names(ustx_data)
         self.track_listbox.clear()
         self.track_listbox.addItems(track_names)
 
+    def selected_harmony_type(self):
+        if self.harmony_type_radio_upper.isChecked():
+            return 2
+        if self.harmony_type_radio_both.isChecked():
+            return 3
+        if self.harmony_type_radio_chord.isChecked():
+            return CHORD_HARMONY
+        return 1
+
+    def selected_chord_intervals(self):
+        if self.selected_harmony_type() != CHORD_HARMONY:
+            return None
+        return parse_chord_intervals(self.chord_intervals_entry.text())
+
+    def toggle_chord_mode(self, checked):
+        self.chord_intervals_entry.setEnabled(checked)
+        self.semitone_interval_spinbox.setEnabled(not checked)
+
+    def schedule_preview(self, *args):
+        self.preview_timer.start()
+
+    def update_preview(self):
+        selected_track_indices = [self.track_listbox.row(item) for item in self.track_listbox.selectedItems()]
+        if self.project is None or not selected_track_indices:
+            self.preview_request_key = None
+            self.preview_model.set_preview(None)
+            self.preview_label.setText(self.tr("Preview"))
+            return
+
+        harmony_type = self.selected_harmony_type()
+        chord_intervals = self.selected_chord_intervals()
+        if harmony_type == CHORD_HARMONY and chord_intervals is None:
+            self.preview_request_key = None
+            self.preview_model.set_preview(None)
+            self.preview_label.setText(self.tr("Preview (invalid chord intervals)"))
+            return
+
+        manual_key_selection = self.manual_key_checkbox.isChecked()
+        options = {
+            'selected_track_indices': selected_track_indices,
+            'harmony_type': harmony_type,
+            'semitone_interval': self.semitone_interval_spinbox.value(),
+            'manual_key_selection': manual_key_selection,
+            'key_name': self.key_name_combobox.currentText() if manual_key_selection else None,
+            'key_mode': self.key_mode_combobox.currentText() if manual_key_selection else "major",
+            'track_key_changes': self.track_key_changes_checkbox.isChecked() and not manual_key_selection,
+            'chord_intervals': chord_intervals,
+        }
+        request_key = (tuple(selected_track_indices), options['semitone_interval'], options['harmony_type'], options['key_name'], options['key_mode'], options['track_key_changes'], tuple(chord_intervals or ()))
+        self.preview_request_key = request_key
+
+        preview = self.preview_cache.get(request_key)
+        if preview is not None:
+            self.show_preview(preview)
+            return
+
+        self.preview_label.setText(self.tr("Preview (updating...)"))
+        worker = PreviewWorker(request_key, self.project, self.project_index, options)
+        worker.signals.finished.connect(self.preview_finished)
+        worker.signals.error.connect(self.preview_failed)
+        self.threadpool.start(worker)
+
+    def preview_finished(self, request_key, preview):
+        self.preview_cache.put(request_key, preview)
+        if request_key == self.preview_request_key:
+            self.show_preview(preview)
+
+    def preview_failed(self, request_key, message):
+        if request_key == self.preview_request_key:
+            self.preview_model.set_preview(None)
+            self.preview_label.setText(self.tr("Preview unavailable: ") + message)
+
+    def show_preview(self, preview):
+        self.preview_model.set_preview(preview)
+        self.preview_label.setText(self.tr("Preview - Key: ") + preview['key'])
+
     def toggle_key_selection(self, state):
         self.key_name_combobox.setEnabled(state == Qt.CheckState.Checked.value)
         self.key_mode_combobox.setEnabled(state == Qt.CheckState.Checked.value)
-
-    def start_harmony_generation(self):
-        print("Starting harmony generation.")
+        self.track_key_changes_checkbox.setEnabled(state != Qt.CheckState.Checked.value)
+
+    def generation_options(self):
+        # harmonize_file options from the current settings, or an error message.
+        harmony_type = self.selected_harmony_type()
+        chord_intervals = self.selected_chord_intervals()
+        if harmony_type == CHORD_HARMONY and chord_intervals is None:
+            return None, self.tr("Please enter chord intervals such as -3, 5, -8.")
+        options = {
+            'harmony_type': harmony_type,
+            'semitone_interval': self.semitone_interval_spinbox.value(),
+            'manual_key_selection': self.manual_key_checkbox.isChecked(),
+            'key_name': self.key_name_combobox.currentText(),
+            'key_mode': self.key_mode_combobox.currentText(),
+            'track_key_changes': self.track_key_changes_checkbox.isChecked(),
+            'chord_intervals': chord_intervals,
+            'carry_curves': {'tolerance': self.curve_tolerance_spinbox.value()} if self.carry_curves_checkbox.isChecked() else None,
+            'memo_cache': self.memo_cache_checkbox.isChecked(),
+            'split_rests': self.split_rests_spinbox.value() if self.split_rests_checkbox.isChecked() else None,
+        }
+        return options, None
+
+    def current_job_request(self):
+        # (input, output, selected track indices, options) for the form, or an error message.
         ustx_file_path = self.ustx_file_entry.text()
         output_file_path = self.output_file_entry.text()
-
         if not ustx_file_path:
-            QMessageBox.warning(self, self.tr("Warning"), self.tr("Please select a USTx file."))
-            return
+            return None, self.tr("Please select a USTx file.")
         if not output_file_path:
-            QMessageBox.warning(self, self.tr("Warning"), self.tr("Please select an output file path."))
-            return
-
+            return None, self.tr("Please select an output file path.")
         selected_track_indices = [self.track_listbox.row(item) for item in self.track_listbox.selectedItems()]
         if not selected_track_indices:
-            QMessageBox.warning(self, self.tr("Warning"), self.tr("Please select at least one track."))
-            return
+            return None, self.tr("Please select at least one track.")
+        options, error = self.generation_options()
+        if error:
+            return None, error
+        return (ustx_file_path, output_file_path, selected_track_indices, options), None
 
-        harmony_type = 1
-        if self.harmony_type_radio_upper.isChecked():
-            harmony_type = 2
-        elif self.harmony_type_radio_both.isChecked():
-            harmony_type = 3
-
-        semitone_interval = self.semitone_interval_spinbox.value()
-        manual_key_selection = self.manual_key_checkbox.isChecked()
-        key_name = self.key_name_combobox.currentText()
-        key_mode = self.key_mode_combobox.currentText()
-
-        worker = HarmonyGeneratorWorker(
-            ustx_file_path, output_file_path, selected_track_indices, harmony_type,
-            semitone_interval, manual_key_selection, key_name, key_mode
-        )
+    def start_harmony_generation(self):
+        logger.debug("Starting harmony generation.")
+        if self.active_worker is not None:
+            return
+        request, error = self.current_job_request()
+        if error:
+            QMessageBox.warning(self, self.tr("Warning"), error)
+            return
+        ustx_file_path, output_file_path, selected_track_indices, options = request
+
+        worker = HarmonyGeneratorWorker(ustx_file_path, output_file_path, selected_track_indices, **options)
+        worker.signals.progress.connect(self.generation_progress)
+        worker.signals.finished.connect(self.generation_finished)
+        worker.signals.error.connect(self.generation_failed)
+        worker.signals.cancelled.connect(self.generation_cancelled)
+        self.active_worker = worker
+        self.generate_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
         self.status_bar_label.setText(self.tr("Generating harmonies..."))
-        self.threadpool.start(worker) 
-        self.status_bar_label.setText(self.tr("Ready")) 
-
-
-    def generation_finished(self, message):
-        if "Error" in message or "YAMLError" in message or "FileNotFoundError" in message or "Invalid key" in message:
-            QMessageBox.critical(self, self.tr("Error"), self.tr("Harmony Generation Error:\n") + message)
-            self.status_bar_label.setText(self.tr("Error during harmony generation"))
+        self.job_started = time.time()
+        self.threadpool.start(worker)
+
+    def cancel_harmony_generation(self):
+        if self.active_worker is not None:
+            self.active_worker.cancel()
+            self.cancel_button.setEnabled(False)
+            self.status_bar_label.setText(self.tr("Cancelling..."))
+
+    def generation_done(self):
+        self.active_worker = None
+        self.generate_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def generation_progress(self, stage, done, total):
+        stage_labels = {
+            'load': self.tr("Loading project"),
+            'index': self.tr("Indexing tracks"),
+            'key_detect': self.tr("Detecting key"),
+            'generate': self.tr("Generating notes"),
+            'serialize': self.tr("Serializing"),
+            'write': self.tr("Writing file"),
+        }
+        text = stage_labels.get(stage, stage)
+        if total:
+            # Writing counts reused source characters plus emitted bytes, so it gets no unit of its own.
+            unit = self.tr("written") if stage == 'write' else self.tr("items") if stage == 'serialize' else self.tr("notes")
+            text += f" ({done}/{total} {unit})"
+        if self.active_worker is not None and not self.active_worker.job.cancelled:
+            self.status_bar_label.setText(text + "...")
+
+    def generation_finished(self, summary):
+        self.generation_done()
+        message = self.tr("Harmonies saved to ") + summary['output'] + "\n" + self.tr("Key: ") + summary['key'] + "\n" + self.tr("Harmony notes: ") + str(summary['notes_out'])
+        if 'tracks_reused' in summary:
+            message += "\n" + self.tr("Tracks reused from cache: ") + f"{summary['tracks_reused']}/{summary['tracks_reused'] + summary['tracks_recomputed']}"
+        if summary.get('tracks_replaced'):
+            replaced = [change for change in summary['harmony_changes'] if change['status'] == 'replaced']
+            message += "\n" + self.tr("Harmony tracks replaced: ") + str(len(replaced))
+            for change in replaced:
+                message += "\n  " + change['track'] + ": " + self.tr("{changed} changed, {added} added, {removed} removed").format(**change)
+        self.status_bar_label.setText(self.tr("Harmony generation complete") + f" ({summary['timings']['total']:.2f} s)" + self.stage_breakdown())
+        QMessageBox.information(self, self.tr("Success"), message)
+
+    def stage_breakdown(self):
+        # Per-stage times of the job that just finished, read back from the profiling sink when one is configured.
+        records = [
+            record for record in read_stage_records(sink_path(), self.job_started)
+            if record.get('pid') == os.getpid() and record.get('parent') == 'harmonize_file'
+        ]
+        if not records:
+            return ""
+        return " - " + ", ".join(f"{record['stage']} {record['wall']:.2f} s" for record in records)
+
+    def generation_failed(self, message):
+        self.generation_done()
+        self.status_bar_label.setText(self.tr("Error during harmony generation"))
+        QMessageBox.critical(self, self.tr("Error"), self.tr("Harmony Generation Error:\n") + message)
+
+    def generation_cancelled(self):
+        self.generation_done()
+        self.status_bar_label.setText(self.tr("Harmony generation cancelled"))
+
+    def add_current_job(self):
+        request, error = self.current_job_request()
+        if error:
+            QMessageBox.warning(self, self.tr("Warning"), error)
+            return
+        ustx_file_path, output_file_path, selected_track_indices, options = request
+        track_label = ", ".join(self.track_listbox.item(row).text() for row in selected_track_indices)
+        self.job_queue.add_job(QueuedJob(ustx_file_path, output_file_path, selected_track_indices, options, track_label))
+        self.tabs.setCurrentIndex(1)
+
+    def add_files_to_queue(self):
+        options, error = self.generation_options()
+        if error:
+            QMessageBox.warning(self, self.tr("Warning"), error)
+            return
+        file_paths, _ = QFileDialog.getOpenFileNames(self, self.tr("Select USTx Files"), "", self.tr("USTx Files (*.ustx);;All Files (*.*)"))
+        # Other projects are matched by track name; with nothing selected every track is harmonized.
+        selected_tracks = [item.text() for item in self.track_listbox.selectedItems()] or 'all'
+        for file_path in file_paths:
+            self.job_queue.add_job(QueuedJob(file_path, output_path_for(file_path, None, '_harmony'), selected_tracks, dict(options)))
+        if file_paths:
+            self.tabs.setCurrentIndex(1)
+
+    def remove_selected_jobs(self):
+        self.job_queue.remove_jobs({index.row() for index in self.queue_table.selectionModel().selectedRows()})
+
+    def start_queue(self):
+        if self.job_queue.start():
+            self.start_queue_button.setEnabled(False)
+            self.cancel_queue_button.setEnabled(True)
+            self.status_bar_label.setText(self.tr("Running job queue..."))
+
+    def cancel_queue(self):
+        self.job_queue.cancel()
+        self.cancel_queue_button.setEnabled(False)
+        self.status_bar_label.setText(self.tr("Cancelling job queue..."))
+
+    def queue_finished(self, results):
+        self.start_queue_button.setEnabled(True)
+        self.cancel_queue_button.setEnabled(False)
+        speedup = results['job_time'] / results['wall_time'] if results['wall_time'] else 0
+        self.status_bar_label.setText(self.tr("Job queue complete") + f" ({results['wall_time']:.2f} s)")
+        message = (
+            self.tr("Jobs: ") + str(results['jobs']) + "\n"
+            + self.tr("Succeeded: ") + str(results['ok']) + "\n"
+            + self.tr("Failed: ") + str(results['errors']) + "\n"
+            + self.tr("Cancelled: ") + str(results['cancelled']) + "\n"
+            + self.tr("Harmony notes: ") + str(results['notes_out']) + "\n"
+            + self.tr("Total time: ") + f"{results['wall_time']:.2f} s ({speedup:.1f}x)"
+        )
+        for file_path, error in results['failures']:
+            message += "\n" + os.path.basename(file_path) + ": " + error
+        if results['errors']:
+            QMessageBox.warning(self, self.tr("Job Queue"), message)
         else:
-            QMessageBox.information(self, self.tr("Success"), self.tr(message))
-            self.status_bar_label.setText(self.tr("Harmony generation complete"))
+            QMessageBox.information(self, self.tr("Job Queue"), message)
+
+    def closeEvent(self, event):
+        self.job_queue.shutdown()
+        super().closeEvent(event)
 
     def load_language(self, locale_code):
         app = QApplication.instance()
@@ -230,7 +587,7 @@ class HarmonyGeneratorGUI(QMainWindow):
             self.retranslate_ui()
 
     def retranslate_ui(self):
-        print("Retranslating UI...")
+        logger.debug("Retranslating UI...")
 
         self.setWindowTitle(self.tr("USTx Auto Harmony Generator"))
         self.menuBar().clear()
@@ -262,6 +619,13 @@ class HarmonyGeneratorGUI(QMainWindow):
         self.harmony_type_radio_lower.setText(self.tr("Lower"))
         self.harmony_type_radio_upper.setText(self.tr("Upper"))
         self.harmony_type_radio_both.setText(self.tr("Both"))
+        self.harmony_type_radio_chord.setText(self.tr("Chord"))
+        self.chord_intervals_label.setText(self.tr("Chord Intervals:"))
+        self.carry_curves_checkbox.setText(self.tr("Carry Over Curves"))
+        self.curve_tolerance_label.setText(self.tr("Curve Tolerance:"))
+        self.memo_cache_checkbox.setText(self.tr("Reuse Unchanged Tracks"))
+        self.split_rests_checkbox.setText(self.tr("Split Parts at Rests"))
+        self.split_rests_label.setText(self.tr("Rest Length (bars):"))
         interval_label = track_frame.findChild(QLabel)
         interval_label.setText(self.tr("Interval (semitones):"))
 
@@ -269,10 +633,22 @@ class HarmonyGeneratorGUI(QMainWindow):
         manual_key_checkbox = key_frame.findChild(QCheckBox)
         if manual_key_checkbox:
             manual_key_checkbox.setText(self.tr("Manual Key Selection"))
+        self.track_key_changes_checkbox.setText(self.tr("Follow Key Changes"))
         key_label = key_frame.findChild(QLabel)
         key_label.setText(self.tr("Key:"))
         mode_label = key_frame.findChild(QLabel)
         mode_label.setText(self.tr("Mode:"))
 
+        self.tabs.setTabText(0, self.tr("Preview"))
+        self.tabs.setTabText(1, self.tr("Job Queue"))
+        self.add_job_button.setText(self.tr("Add Current"))
+        self.add_files_button.setText(self.tr("Add Files..."))
+        self.remove_jobs_button.setText(self.tr("Remove"))
+        self.clear_finished_button.setText(self.tr("Clear Finished"))
+        self.parallel_jobs_label.setText(self.tr("Parallel Jobs:"))
+        self.start_queue_button.setText(self.tr("Start Queue"))
+        self.cancel_queue_button.setText(self.tr("Cancel Queue"))
+
         self.generate_button.setText(self.tr("Generate Harmonies"))
+        self.cancel_button.setText(self.tr("Cancel"))
         self.status_bar_label.setText(self.tr("Ready"))
\ No newline at end of file
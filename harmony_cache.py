@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from harmony_engine import ALGORITHM_VERSION
+from instrumentation import get_logger
+
+logger = get_logger("harmony_cache")
+
+CACHE_SUFFIX = '.harmony-cache.sqlite'
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+class ToneCache:
+    # Harmony tones per track keyed on the track's note hash and the harmony settings. Lookups and stores are
+    # both remembered in `used`, so a caller can keep exactly the entries the last run needed.
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        tones = self.entries.get(key)
+        if tones is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used[key] = tones
+        return tones
+
+    def put(self, key, tones):
+        self.entries[key] = tones
+        self.used[key] = tones
+
+def harmony_cache_key(note_hash, harmony_type, semitone_interval, chord_intervals, key_tone_index, key_mode, key_timeline=None):
+    timeline = None
+    if key_timeline is not None:
+        timeline = (tuple(key_timeline.starts.tolist()), tuple(key_timeline.key_ids.tolist()))
+    return (ALGORITHM_VERSION, note_hash, harmony_type, semitone_interval, tuple(chord_intervals or ()), key_tone_index, key_mode, timeline)
+
+
+class SqliteToneCache:
+    # The same interface as ToneCache, persisted in a small SQLite file next to the project. Each row holds
+    # the int32 tones of every voice for one track; the least recently used rows go once max_bytes is exceeded.
+    # New rows and last_used updates are kept in memory and written in one transaction by close(), so jobs
+    # sharing the file only hold its write lock for that moment, not for a whole run.
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        self._new_rows = {}
+        self._touched = {}
+        self.connection = sqlite3.connect(path, timeout=10)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS harmony (key TEXT PRIMARY KEY, voices INTEGER NOT NULL, data BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+
+    @classmethod
+    def for_project(cls, ustx_file_path, max_bytes=DEFAULT_MAX_BYTES):
+        path = os.path.splitext(os.path.abspath(ustx_file_path))[0] + CACHE_SUFFIX
+        try:
+            return cls(path, max_bytes)
+        except sqlite3.Error as e:
+            logger.warning("Harmony cache %s unavailable: %s", path, e)
+            return None
+
+    @staticmethod
+    def row_key(key):
+        return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        row_key = self.row_key(key)
+        row = self._new_rows.get(row_key)
+        if row is None:
+            row = self.connection.execute("SELECT voices, data FROM harmony WHERE key = ?", (row_key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        voices, data = row
+        tones = list(np.frombuffer(data, dtype=np.int32).reshape(voices, -1)) if voices else []
+        self._touched[row_key] = time.time()
+        self.hits += 1
+        self.used[key] = tones
+        return tones
+
+    def put(self, key, tones):
+        data = np.stack([np.asarray(voice, dtype=np.int32) for voice in tones]).tobytes() if len(tones) else b''
+        self._new_rows[self.row_key(key)] = (len(tones), data)
+        self.used[key] = tones
+
+    def total_bytes(self):
+        return self.connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM harmony").fetchone()[0]
+
+    def evict(self):
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        evicted = []
+        for row_key, size in self.connection.execute("SELECT key, LENGTH(data) FROM harmony ORDER BY last_used"):
+            if excess <= 0:
+                break
+            evicted.append((row_key,))
+            excess -= size
+        self.connection.executemany("DELETE FROM harmony WHERE key = ?", evicted)
+        return len(evicted)
+
+    def flush(self):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO harmony (key, voices, data, last_used) VALUES (?, ?, ?, ?)",
+                [(row_key, voices, data, now) for row_key, (voices, data) in self._new_rows.items()]
+            )
+            self.connection.executemany("UPDATE harmony SET last_used = ? WHERE key = ?", [(used, row_key) for row_key, used in self._touched.items()])
+            self.evict()
+        self._new_rows.clear()
+        self._touched.clear()
+
+    def close(self):
+        # The harmonies are already written, so a cache that cannot be updated is only reported.
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            logger.warning("Harmony cache %s not updated: %s", self.path, e)
+        finally:
+            self.connection.close()
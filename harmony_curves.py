@@ -0,0 +1,119 @@
+import numpy as np
+
+from ustx_harms import DEFAULT_CURVE_ABBRS
+from ustx_project import UstxDumper
+
+
+class CurvePoints(list):
+    # Written as a flow sequence, the way OpenUtau stores curve xs and ys.
+    pass
+
+
+def represent_curve_points(dumper, points):
+    return dumper.represent_sequence('tag:yaml.org,2002:seq', points, flow_style=True)
+
+UstxDumper.add_representer(CurvePoints, represent_curve_points)
+
+def curve_arrays(voice_part, abbrs):
+    for curve in voice_part.get('curves') or []:
+        abbr = curve.get('abbr')
+        xs = curve.get('xs') or []
+        ys = curve.get('ys') or []
+        if abbr in abbrs and xs and len(xs) == len(ys):
+            yield abbr, np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.float64)
+
+def merge_points(xs, ys):
+    # Sorted by x; where parts overlap the later part's point wins.
+    order = np.argsort(xs, kind='stable')
+    xs, ys = xs[order], ys[order]
+    last = np.append(xs[1:] != xs[:-1], True)
+    return xs[last], ys[last]
+
+def curve_value(xs, ys, x):
+    # The merged curve's value at x, interpolated between the two points around it only.
+    i = int(np.searchsorted(xs, x, side='right'))
+    around = slice(max(i - 1, 0), i + 1)
+    return np.interp(x, xs[around], ys[around])
+
+def clip_curve(xs, ys, start, end):
+    # Points within [start, end], plus the curve's values at both ends so its shape up to the edges is kept.
+    # xs must be sorted; the window is found by binary search, so its cost does not grow with the curve.
+    first = np.searchsorted(xs, start, side='right')
+    stop = max(first, np.searchsorted(xs, end, side='left'))
+    head = [start] if xs[0] <= start else []
+    tail = [end] if xs[-1] >= end else []
+    return (
+        np.concatenate([np.array(head, dtype=np.int64), xs[first:stop], np.array(tail, dtype=np.int64)]),
+        np.concatenate([[curve_value(xs, ys, x) for x in head], ys[first:stop], [curve_value(xs, ys, x) for x in tail]]),
+    )
+
+def resample_curve(xs, ys, interval):
+    if len(xs) < 2:
+        return xs, ys
+    grid = np.arange(-(-xs[0] // interval) * interval, xs[-1] + 1, interval, dtype=np.int64)
+    return grid, np.interp(grid, xs, ys)
+
+def thin_curve(xs, ys, tolerance):
+    # Ramer-Douglas-Peucker on the value axis: drops points that linear interpolation between the kept
+    # neighbours reproduces within tolerance. Each segment is checked with one array operation.
+    if len(xs) < 3:
+        return xs, ys
+    keep = np.zeros(len(xs), dtype=bool)
+    keep[0] = keep[-1] = True
+    segments = [(0, len(xs) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        inner_xs = xs[start + 1:end]
+        line = ys[start] + (ys[end] - ys[start]) * (inner_xs - xs[start]) / (xs[end] - xs[start])
+        deviation = np.abs(ys[start + 1:end] - line)
+        worst = int(np.argmax(deviation))
+        if deviation[worst] > tolerance:
+            split = start + 1 + worst
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+    return xs[keep], ys[keep]
+
+def merged_curves(source_parts, offsets, abbrs):
+    # (abbr, xs, ys) per expression: curves of source_parts moved by their offsets (ticks added to each x),
+    # merged and sorted by x.
+    collected = {}
+    for voice_part, offset in zip(source_parts, offsets):
+        for abbr, xs, ys in curve_arrays(voice_part, abbrs):
+            collected.setdefault(abbr, []).append((xs + offset, ys))
+    merged = []
+    for abbr in abbrs:
+        if abbr in collected:
+            xs, ys = merge_points(np.concatenate([xs for xs, _ in collected[abbr]]), np.concatenate([ys for _, ys in collected[abbr]]))
+            merged.append((abbr, xs, ys))
+    return merged
+
+def finish_curves(merged, interval=None, tolerance=0, window=None, shift=0):
+    # Curve dicts from merged_curves output: clipped to window, then moved by shift ticks, resampled and thinned.
+    curves = []
+    for abbr, xs, ys in merged:
+        if window is not None:
+            xs, ys = clip_curve(xs, ys, *window)
+            if not len(xs):
+                continue
+        if shift:
+            xs = xs + shift
+        if interval:
+            xs, ys = resample_curve(xs, ys, interval)
+        if tolerance:
+            xs, ys = thin_curve(xs, ys, tolerance)
+        curves.append({'xs': CurvePoints(xs.tolist()), 'ys': CurvePoints(np.rint(ys).astype(np.int64).tolist()), 'abbr': abbr})
+    return curves
+
+def transform_curves(source_parts, offsets, abbrs=DEFAULT_CURVE_ABBRS, interval=None, tolerance=0, window=None):
+    # Curves of source_parts moved by their offsets (ticks added to each x) and merged per expression.
+    # window, a (start, end) tick range after the move, keeps only that stretch of each curve.
+    return finish_curves(merged_curves(source_parts, offsets, abbrs), interval, tolerance, window)
+
+def window_curves(voice_part, windows, abbrs=DEFAULT_CURVE_ABBRS, interval=None, tolerance=0):
+    # One curve list per (offset, duration) window of voice_part, moved to start at 0. The part's curves are
+    # merged once and each window is cut out of them, so cutting a part into many windows stays linear.
+    merged = merged_curves([voice_part], [0], abbrs)
+    return [finish_curves(merged, interval, tolerance, (offset, offset + duration), -offset) for offset, duration in windows]
@@ -0,0 +1,149 @@
+from functools import lru_cache
+
+import numpy as np
+
+from ustx_harms import get_scale_intervals
+
+# Bump whenever generated tones change for the same input, so cached harmony results are not reused.
+ALGORITHM_VERSION = 1
+MAX_CORRECTION_ATTEMPTS = 3
+LOWER = -1
+UPPER = 1
+DEFAULT_VOICE_RANGE = (36, 84)
+FIFTH = 7
+
+# Scale degrees per mode (0 major, 1 minor, as in key ids) and the degree at or below every pitch class.
+SCALE_OFFSETS = np.array([get_scale_intervals(0, "major"), get_scale_intervals(0, "minor")], dtype=np.int64)
+DEGREE_TABLE = np.array([[np.searchsorted(offsets, pitch_class, side='right') - 1 for pitch_class in range(12)] for offsets in SCALE_OFFSETS], dtype=np.int64)
+
+@lru_cache(maxsize=None)
+def snap_table(key_tone_index, mode, direction):
+    # Offset that moves each pitch class onto the scale, searching in `direction` like the
+    # per-note correction loop did; 0 when no scale tone is reachable within the attempts.
+    scale = set(get_scale_intervals(key_tone_index, mode))
+    table = np.zeros(12, dtype=np.int32)
+    for pitch_class in range(12):
+        for attempt in range(MAX_CORRECTION_ATTEMPTS + 1):
+            if (pitch_class + direction * attempt) % 12 in scale:
+                table[pitch_class] = direction * attempt
+                break
+    table.flags.writeable = False
+    return table
+
+@lru_cache(maxsize=None)
+def snap_tables(direction):
+    # One snap table per key id (2 * key tone + minor), as numbered by key_tracker.
+    tables = np.stack([snap_table(key_id // 2, ("major", "minor")[key_id % 2], direction) for key_id in range(24)])
+    tables.flags.writeable = False
+    return tables
+
+def as_tone_array(tones):
+    if isinstance(tones, np.ndarray):
+        return tones
+    if hasattr(tones, 'typecode'):
+        return np.frombuffer(tones, dtype=np.int32) if tones.itemsize == 4 else np.asarray(tones)
+    return np.fromiter(tones, dtype=np.int32)
+
+def harmony_tones(tones, semitone_interval, direction, key_tone_index, key_mode, key_ids=None):
+    tones = as_tone_array(tones)
+    # A lower harmony is corrected upwards and an upper harmony downwards, back towards the melody.
+    shifted = tones + direction * semitone_interval
+    if key_ids is not None:
+        return shifted + snap_tables(-direction)[key_ids, shifted % 12]
+    return shifted + snap_table(key_tone_index, key_mode, -direction)[shifted % 12]
+
+def generate_harmony_tones(tones, semitone_interval, harmony_type, key_tone_index, key_mode, key_ids=None):
+    tones = as_tone_array(tones)
+    harmony_tracks_tones = []
+    if harmony_type in (1, 3):
+        harmony_tracks_tones.append(harmony_tones(tones, semitone_interval, LOWER, key_tone_index, key_mode, key_ids))
+    if harmony_type in (2, 3):
+        harmony_tracks_tones.append(harmony_tones(tones, semitone_interval, UPPER, key_tone_index, key_mode, key_ids))
+    return harmony_tracks_tones
+
+def diatonic_steps(interval):
+    # Signed interval number (3 = a 3rd above, -8 = an octave below) to scale steps.
+    return (abs(interval) - 1) * (1 if interval > 0 else -1)
+
+def scale_positions(tones, key_tones, modes):
+    relative = tones - key_tones
+    return relative // 12 * 7 + DEGREE_TABLE[modes, relative % 12]
+
+def position_tones(positions, key_tones, modes):
+    return key_tones + positions // 7 * 12 + SCALE_OFFSETS[modes, positions % 7]
+
+def is_parallel_fifth(previous_a, previous_b, a, b):
+    return a != previous_a and b != previous_b and abs(previous_b - previous_a) % 12 == FIFTH and abs(b - a) % 12 == FIFTH
+
+def fold_into_range(positions, key_tones, modes, voice_range):
+    low, high = voice_range
+    tones = position_tones(positions, key_tones, modes)
+    positions = positions + 7 * -((tones - low) // 12).clip(max=0)
+    tones = position_tones(positions, key_tones, modes)
+    return positions - 7 * ((tones - high + 11) // 12).clip(min=0)
+
+def avoid_parallel_fifths(positions, tones, key_tones, modes, voice_range):
+    # Parallel fifths are found for all voice pairs at once; only the flagged notes are revisited one by one,
+    # moving the later voice a scale step (contrary to the melody first) when that breaks the fifth.
+    voice_count, note_count = positions.shape
+    if note_count < 2:
+        return positions
+    key_tones = np.broadcast_to(key_tones, (note_count,))
+    modes = np.broadcast_to(modes, (note_count,))
+    all_tones = np.vstack([tones, position_tones(positions, key_tones, modes)])
+    low, high = voice_range
+    pairs = [(a, b) for b in range(1, voice_count + 1) for a in range(b)]
+
+    flagged = set()
+    for a, b in pairs:
+        fifths = np.abs(all_tones[b] - all_tones[a]) % 12 == FIFTH
+        moved = (np.diff(all_tones[a]) != 0) & (np.diff(all_tones[b]) != 0)
+        for index in np.flatnonzero(fifths[1:] & fifths[:-1] & moved).tolist():
+            flagged.add((index + 1, b))
+
+    # The fix-up loop is sequential, so it runs on plain lists rather than array scalars.
+    tone_rows = all_tones.tolist()
+    position_rows = positions.tolist()
+    key_tone_list = key_tones.tolist()
+    mode_list = modes.tolist()
+    scale_offsets = SCALE_OFFSETS.tolist()
+
+    def creates_fifth(index, voice, tone):
+        row = tone_rows[voice]
+        for other in range(voice_count + 1):
+            if other == voice:
+                continue
+            other_row = tone_rows[other]
+            if index > 0 and is_parallel_fifth(other_row[index - 1], row[index - 1], other_row[index], tone):
+                return True
+            if index + 1 < note_count and is_parallel_fifth(other_row[index], tone, other_row[index + 1], row[index + 1]):
+                return True
+        return False
+
+    for index, voice in sorted(flagged):
+        if not creates_fifth(index, voice, tone_rows[voice][index]):
+            continue
+        melody_step = tone_rows[0][index] - tone_rows[0][index - 1]
+        for step in ((-1, 1) if melody_step > 0 else (1, -1)):
+            position = position_rows[voice - 1][index] + step
+            candidate = key_tone_list[index] + position // 7 * 12 + scale_offsets[mode_list[index]][position % 7]
+            if low <= candidate <= high and not creates_fifth(index, voice, candidate):
+                position_rows[voice - 1][index] = position
+                tone_rows[voice][index] = candidate
+                break
+    positions[:] = position_rows
+    return positions
+
+def chord_tones(tones, intervals, key_tone_index, key_mode, key_ids=None, voice_range=DEFAULT_VOICE_RANGE):
+    # One voice per diatonic interval, all computed in a single pass over the note array.
+    tones = as_tone_array(tones).astype(np.int64)
+    if key_ids is not None:
+        key_ids = np.asarray(key_ids, dtype=np.int64)
+        key_tones, modes = key_ids // 2, key_ids % 2
+    else:
+        key_tones, modes = key_tone_index, ("major", "minor").index(key_mode)
+    steps = np.array([diatonic_steps(interval) for interval in intervals], dtype=np.int64)
+    positions = scale_positions(tones, key_tones, modes)[np.newaxis, :] + steps[:, np.newaxis]
+    positions = fold_into_range(positions, key_tones, modes, voice_range)
+    positions = avoid_parallel_fifths(positions, tones, key_tones, modes, voice_range)
+    return [voice.astype(np.int32) for voice in position_tones(positions, key_tones, modes)]
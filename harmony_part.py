@@ -0,0 +1,198 @@
+from collections.abc import MutableMapping
+
+import numpy as np
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+from ustx_project import NOTE_SPAN_FIELDS, UstxDumper
+
+PART_KEYS = ('duration', 'name', 'comment', 'track_no', 'position', 'notes', 'curves')
+INT_TAG = 'tag:yaml.org,2002:int'
+SEQ_TAG = 'tag:yaml.org,2002:seq'
+
+def copy_node(node):
+    if isinstance(node, ScalarNode):
+        return ScalarNode(node.tag, node.value, style=node.style)
+    if isinstance(node, SequenceNode):
+        return SequenceNode(node.tag, [copy_node(item) for item in node.value], flow_style=node.flow_style)
+    return MappingNode(node.tag, [(copy_node(key), copy_node(value)) for key, value in node.value], flow_style=node.flow_style)
+
+def source_tones(voice_part):
+    note_array = getattr(voice_part, 'note_array', None)
+    if note_array is not None:
+        return np.frombuffer(note_array.tone, dtype=np.int32)
+    notes = voice_part.get('notes', [])
+    return np.fromiter((note['tone'] for note in notes), dtype=np.int32, count=len(notes))
+
+def rest_splits(positions, durations, min_rest):
+    # Note indices that follow a rest of at least min_rest ticks, and the tick in the middle of each of those rests.
+    if len(positions) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    ends = np.maximum.accumulate(positions + np.asarray(durations, dtype=np.int64))
+    splits = np.flatnonzero(positions[1:] - ends[:-1] >= min_rest) + 1
+    return splits, (ends[splits - 1] + positions[splits]) // 2
+
+
+class HarmonyPart(MutableMapping):
+    # A harmony voice part that stores only a tone delta per note and points at the source parts for
+    # everything else. Notes are expanded when the part is serialized, or on demand through part['notes'].
+    # note_range limits it to a slice of the source notes, whose positions are moved back by offset ticks.
+    # original_tones, the source tones inside note_range, spares concatenating the source parts' tones again
+    # when a caller cuts many parts from the same ones.
+    __slots__ = ('source_parts', 'tone_deltas', 'fields', 'note_range', 'offset')
+
+    def __init__(self, source_parts, harmony_tones, note_range=None, offset=0, original_tones=None, **fields):
+        self.source_parts = list(source_parts)
+        if original_tones is None:
+            all_tones = np.concatenate([source_tones(part) for part in self.source_parts]) if self.source_parts else np.zeros(0, dtype=np.int32)
+            self.note_range = note_range or (0, len(all_tones))
+            original_tones = all_tones[self.note_range[0]:self.note_range[1]]
+        else:
+            self.note_range = note_range or (0, len(original_tones))
+        self.offset = offset
+        self.tone_deltas = (np.asarray(harmony_tones) - original_tones).astype(np.int16)
+        self.fields = {key: fields.get(key) for key in PART_KEYS if key != 'notes'}
+
+    def __getitem__(self, key):
+        if key == 'notes':
+            return list(self.iter_notes())
+        return self.fields[key]
+
+    def __setitem__(self, key, value):
+        if key == 'notes':
+            raise TypeError("HarmonyPart notes are derived from the source parts")
+        self.fields[key] = value
+
+    def __delitem__(self, key):
+        raise TypeError("HarmonyPart keys cannot be removed")
+
+    def __iter__(self):
+        return iter(PART_KEYS)
+
+    def __len__(self):
+        return len(PART_KEYS)
+
+    def __repr__(self):
+        return f"HarmonyPart({self.fields['name']!r}, {len(self.tone_deltas)} notes)"
+
+    def note_count(self):
+        return len(self.tone_deltas)
+
+    def columns(self):
+        # Only the notes inside note_range are gathered, so parts cut from one long source part stay cheap.
+        positions, durations, tones = [], [], []
+        for part, first, last in self.part_ranges():
+            note_array = getattr(part, 'note_array', None)
+            if note_array is not None:
+                positions.append(np.frombuffer(note_array.position, dtype=np.int32)[first:last])
+                durations.append(np.frombuffer(note_array.duration, dtype=np.int32)[first:last])
+            else:
+                notes = part.get('notes', [])[first:last]
+                positions.append(np.fromiter((note['position'] for note in notes), dtype=np.int32, count=len(notes)))
+                durations.append(np.fromiter((note['duration'] for note in notes), dtype=np.int32, count=len(notes)))
+            tones.append(source_tones(part)[first:last])
+        if not tones:
+            empty = np.zeros(0, dtype=np.int32)
+            return empty, empty, empty
+        return np.concatenate(positions) - self.offset, np.concatenate(durations), np.concatenate(tones) + self.tone_deltas
+
+    def part_ranges(self):
+        # (part, first, last) note indices of each source part that fall inside note_range.
+        start, stop = self.note_range
+        base = 0
+        for part in self.source_parts:
+            note_array = getattr(part, 'note_array', None)
+            count = len(note_array) if note_array is not None else len(part.get('notes', []))
+            first, last = max(start - base, 0), min(stop - base, count)
+            if first < last:
+                yield part, first, last
+            base += count
+
+    def iter_notes(self):
+        deltas = self.tone_deltas.tolist()
+        i = 0
+        for part, first, last in self.part_ranges():
+            for note in part.get('notes', [])[first:last]:
+                yield {**note, 'position': note['position'] - self.offset, 'tone': note['tone'] + deltas[i]}
+                i += 1
+
+    def iter_note_nodes(self, dumper):
+        deltas = self.tone_deltas.tolist()
+        i = 0
+        for part, first, last in self.part_ranges():
+            note_nodes = getattr(part, 'note_nodes', None)
+            if note_nodes is None:
+                for note in part.get('notes', [])[first:last]:
+                    yield dumper.represent_data({**note, 'position': note['position'] - self.offset, 'tone': note['tone'] + deltas[i]})
+                    i += 1
+                continue
+            part_note_nodes = note_nodes()
+            tones = part.note_array.tone
+            positions = part.note_array.position
+            for note_index in range(first, last):
+                # Reuse the parsed source note, swapping in the new tone, instead of building a dict.
+                replacements = {'tone': ScalarNode(INT_TAG, str(tones[note_index] + deltas[i]))}
+                if self.offset:
+                    replacements['position'] = ScalarNode(INT_TAG, str(positions[note_index] - self.offset))
+                yield self.note_node(part_note_nodes[note_index], replacements)
+                i += 1
+
+    def note_text(self, column, line_break='\n'):
+        # The notes as their source text with new tones and positions swapped in, when every source part can
+        # give its notes' text spans (see VoicePart.note_spans) at this column. Otherwise None.
+        # A note that ends the source file without a final newline gets line_break, so more keys can follow it.
+        ranges = list(self.part_ranges())
+        sources = []
+        for part, _, _ in ranges:
+            note_spans = getattr(part, 'note_spans', None)
+            source = note_spans() if note_spans is not None else None
+            if source is None or source[2] != column:
+                return None
+            sources.append(source)
+        chunks = []
+        i = 0
+        for (part, first, last), (text, spans, _) in zip(ranges, sources):
+            spans = np.frombuffer(spans, dtype=np.int64).reshape(-1, NOTE_SPAN_FIELDS)[first:last].tolist()
+            tones = (np.frombuffer(part.note_array.tone, dtype=np.int32)[first:last] + self.tone_deltas[i:i + last - first]).tolist()
+            positions = (np.frombuffer(part.note_array.position, dtype=np.int32)[first:last] - self.offset).tolist()
+            for (start, end, tone_start, tone_end, position_start, position_end), tone, position in zip(spans, tones, positions):
+                values = [(tone_start, tone_end, str(tone))]
+                if self.offset:
+                    values.append((position_start, position_end, str(position)))
+                cursor = start
+                for value_start, value_end, value in sorted(values):
+                    chunks.append(text[cursor:value_start])
+                    chunks.append(value)
+                    cursor = value_end
+                chunks.append(text[cursor:end])
+                if text[end - 1] != '\n':
+                    chunks.append(line_break)
+            i += last - first
+        return ''.join(chunks)
+
+    @staticmethod
+    def note_node(note_node, replacements):
+        value = []
+        missing = dict(replacements)
+        for key_node, value_node in note_node.value:
+            if key_node.value in missing:
+                value.append((copy_node(key_node), missing.pop(key_node.value)))
+            else:
+                value.append((copy_node(key_node), copy_node(value_node)))
+        for key, value_node in missing.items():
+            value.append((ScalarNode('tag:yaml.org,2002:str', key), value_node))
+        return MappingNode(note_node.tag, value, flow_style=note_node.flow_style)
+
+
+def represent_harmony_part(dumper, part):
+    value = []
+    for key in part:
+        key_node = dumper.represent_data(key)
+        if key == 'notes':
+            value_node = SequenceNode(SEQ_TAG, list(part.iter_note_nodes(dumper)), flow_style=False)
+        else:
+            value_node = dumper.represent_data(part.fields[key])
+        value.append((key_node, value_node))
+    return MappingNode('tag:yaml.org,2002:map', value, flow_style=False)
+
+UstxDumper.add_representer(HarmonyPart, represent_harmony_part)
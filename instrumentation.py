@@ -0,0 +1,221 @@
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LOGGER_NAME = "harmony"
+STAGE_LOGGER_NAME = LOGGER_NAME + ".stages"
+PROFILERS = ('cprofile', 'pyinstrument')
+
+stage_logger = logging.getLogger(STAGE_LOGGER_NAME)
+# Stage records are off until configure() attaches a sink, and never reach the console.
+stage_logger.setLevel(logging.WARNING)
+stage_logger.propagate = False
+
+_settings = {'profiler': None, 'profile_dir': None, 'sink': None}
+_local = threading.local()
+_profile_counter = itertools.count(1)
+
+def get_logger(name):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+logger = get_logger("instrumentation")
+
+def default_log_dir():
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'ustx_harms')
+
+def error_log_path():
+    return os.environ.get('USTX_HARMS_ERROR_LOG') or os.path.join(default_log_dir(), 'error_log.txt')
+
+
+class JsonlHandler(logging.Handler):
+    # Appends one JSON object per stage record. Lines are written whole, so several batch processes can share a file.
+
+    def __init__(self, path):
+        super().__init__(logging.DEBUG)
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def emit(self, record):
+        entry = getattr(record, 'stage_record', None)
+        if entry is None:
+            return
+        try:
+            line = json.dumps(entry, ensure_ascii=False) + "\n"
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except Exception:
+            self.handleError(record)
+
+
+def configure(log_level=None, sink=None, profiler=None, profile_dir=None, error_log=True):
+    # log_level controls console diagnostics; sink enables stage records; profiler dumps the outermost stage of each job.
+    root = logging.getLogger(LOGGER_NAME)
+    if log_level is not None:
+        root.setLevel(log_level.upper() if isinstance(log_level, str) else log_level)
+        if not any(isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler) for handler in root.handlers):
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+            root.addHandler(handler)
+    if error_log and not any(isinstance(handler, logging.FileHandler) for handler in root.handlers):
+        try:
+            os.makedirs(os.path.dirname(error_log_path()), exist_ok=True)
+            handler = logging.FileHandler(error_log_path(), encoding='utf-8', delay=True)
+        except OSError as e:
+            logger.warning("Cannot open error log %s: %s", error_log_path(), e)
+        else:
+            handler.setLevel(logging.ERROR)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(name)s: %(message)s"))
+            root.addHandler(handler)
+    if sink is not None:
+        for handler in list(stage_logger.handlers):
+            stage_logger.removeHandler(handler)
+            handler.close()
+        stage_logger.addHandler(JsonlHandler(sink))
+        stage_logger.setLevel(logging.INFO)
+        _settings['sink'] = os.path.abspath(sink)
+    if profiler is not None:
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {profiler}")
+        if _settings['sink'] is None:
+            # Profiles are only taken around recorded stages.
+            return configure(sink=os.path.join(default_log_dir(), 'stages.jsonl'), profiler=profiler, profile_dir=profile_dir, error_log=False)
+        _settings['profiler'] = profiler
+        _settings['profile_dir'] = os.path.abspath(profile_dir or os.path.dirname(_settings['sink'] or error_log_path()))
+    return _settings['sink']
+
+def configure_from_env():
+    # USTX_HARMS_LOG_LEVEL, USTX_HARMS_PROFILE (JSONL sink) and USTX_HARMS_PROFILER (cprofile or pyinstrument).
+    return configure(
+        os.environ.get('USTX_HARMS_LOG_LEVEL'),
+        os.environ.get('USTX_HARMS_PROFILE') or None,
+        os.environ.get('USTX_HARMS_PROFILER') or None,
+        os.environ.get('USTX_HARMS_PROFILE_DIR') or None,
+    )
+
+def stages_enabled():
+    return stage_logger.isEnabledFor(logging.INFO)
+
+def sink_path():
+    return _settings['sink']
+
+
+class Profiler:
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.profiler = None
+
+    def start(self):
+        if self.kind == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler as PyinstrumentProfiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed, falling back to cProfile")
+                self.kind = 'cprofile'
+            else:
+                self.profiler = PyinstrumentProfiler()
+                self.profiler.start()
+                return
+        import cProfile
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self):
+        os.makedirs(_settings['profile_dir'], exist_ok=True)
+        base_name = os.path.join(_settings['profile_dir'], f"{self.name}-{os.getpid()}-{next(_profile_counter)}")
+        if self.kind == 'pyinstrument':
+            self.profiler.stop()
+            path = base_name + '.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.profiler.output_html())
+        else:
+            self.profiler.disable()
+            path = base_name + '.prof'
+            self.profiler.dump_stats(path)
+        return path
+
+
+@contextmanager
+def stage(name, **fields):
+    # Yields a dict the caller can fill with 'notes', 'bytes' or other fields. Wall time is always measured
+    # (callers use it for their summaries); everything else only happens when stage records are enabled.
+    record = {'stage': name, **fields}
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    enabled = stages_enabled()
+    profiler = None
+    if enabled:
+        record['parent'] = stack[-1] if stack else None
+        if _settings['profiler'] and not stack:
+            profiler = Profiler(_settings['profiler'], name)
+            profiler.start()
+        cpu_start = time.thread_time()
+    stack.append(name)
+    wall_start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['wall'] = time.perf_counter() - wall_start
+        stack.pop()
+        if enabled:
+            record['cpu'] = time.thread_time() - cpu_start
+            if profiler is not None:
+                record['profile'] = profiler.stop()
+            record['ts'] = time.time()
+            record['pid'] = os.getpid()
+            record['thread'] = threading.current_thread().name
+            stage_logger.info("%s %.6f s", name, record['wall'], extra={'stage_record': record})
+
+def instrumented(name=None):
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def read_stage_records(path, since=None):
+    records = []
+    if not path or not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since is None or record.get('ts', 0) >= since:
+                records.append(record)
+    return records
+
+def summarize_stage_records(records):
+    # Totals per stage name, in first-seen order.
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record['stage'], {'stage': record['stage'], 'count': 0, 'wall': 0.0, 'cpu': 0.0, 'notes': 0, 'bytes': 0})
+        total['count'] += 1
+        total['wall'] += record.get('wall', 0.0)
+        total['cpu'] += record.get('cpu', 0.0)
+        total['notes'] += record.get('notes') or 0
+        total['bytes'] += record.get('bytes') or 0
+    return list(totals.values())
+
+def format_stage_summary(totals):
+    lines = [f"{'stage':<16} {'count':>6} {'wall s':>10} {'cpu s':>10} {'notes':>10} {'bytes':>12}"]
+    for total in totals:
+        lines.append(f"{total['stage']:<16} {total['count']:>6} {total['wall']:>10.3f} {total['cpu']:>10.3f} {total['notes']:>10} {total['bytes']:>12}")
+    return "\n".join(lines)
@@ -0,0 +1,291 @@
+import itertools
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, QTimer, pyqtSignal
+
+from batch import available_cores, queued_job
+from instrumentation import get_logger
+from pipeline import harmony_type_names
+from ustx_harms import CHORD_HARMONY
+
+logger = get_logger("job_queue")
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'ok'
+STATUS_ERROR = 'error'
+STATUS_CANCELLED = 'cancelled'
+FINISHED_STATUSES = (STATUS_DONE, STATUS_ERROR, STATUS_CANCELLED)
+
+_job_ids = itertools.count(1)
+
+def describe_options(options):
+    harmony_type = options['harmony_type']
+    if harmony_type == CHORD_HARMONY:
+        text = "chord " + ",".join(str(interval) for interval in options['chord_intervals'])
+    else:
+        text = f"{harmony_type_names.get(harmony_type, harmony_type)} {options['semitone_interval']:+d}"
+    text += ", " + (f"{options['key_name']} {options['key_mode']}" if options['manual_key_selection'] else "auto key")
+    flags = [
+        name for name, enabled in (
+            ("key changes", options.get('track_key_changes') and not options['manual_key_selection']),
+            ("curves", options.get('carry_curves') is not None),
+            ("split rests", options.get('split_rests')),
+            ("cache", options.get('memo_cache')),
+        ) if enabled
+    ]
+    if flags:
+        text += ", " + ", ".join(flags)
+    return text
+
+
+class QueuedJob:
+    # One input/output pair with its own track selection and harmonize_file options.
+
+    def __init__(self, ustx_file_path, output_file_path, selected_tracks, options, track_label=None):
+        self.job_id = next(_job_ids)
+        self.ustx_file_path = ustx_file_path
+        self.output_file_path = output_file_path
+        self.selected_tracks = selected_tracks
+        self.options = options
+        self.track_label = track_label or ("all" if selected_tracks == 'all' else ", ".join(str(track) for track in selected_tracks))
+        self.status = STATUS_QUEUED
+        self.progress = None
+        self.started = None
+        self.finished = None
+        self.summary = None
+        self.future = None
+        self.cancel_event = None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+
+class JobQueueModel(QAbstractTableModel):
+
+    def __init__(self, job_queue, parent=None):
+        super().__init__(parent)
+        self.job_queue = job_queue
+        job_queue.jobs_reset.connect(self.reset)
+        job_queue.job_changed.connect(self.job_changed)
+
+    def reset(self):
+        self.beginResetModel()
+        self.endResetModel()
+
+    def job_changed(self, row):
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def headers(self):
+        return [self.tr("File"), self.tr("Tracks"), self.tr("Settings"), self.tr("Status"), self.tr("Elapsed")]
+
+    def status_text(self, job):
+        labels = {
+            STATUS_QUEUED: self.tr("Queued"),
+            STATUS_RUNNING: self.tr("Running"),
+            STATUS_DONE: self.tr("Done"),
+            STATUS_ERROR: self.tr("Error"),
+            STATUS_CANCELLED: self.tr("Cancelled"),
+        }
+        text = labels[job.status]
+        if job.status == STATUS_RUNNING and job.progress:
+            stage, done, total = job.progress
+            text += f" - {stage}" + (f" {done}/{total}" if total else "")
+        elif job.status == STATUS_ERROR and job.summary:
+            text += ": " + job.summary.get('error', '')
+        return text
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.job_queue.jobs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 5
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        job = self.job_queue.jobs[index.row()]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"{job.ustx_file_path}\n-> {job.output_file_path}"
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        column = index.column()
+        if column == 0:
+            return job.ustx_file_path.replace('\\', '/').rsplit('/', 1)[-1]
+        if column == 1:
+            return job.track_label
+        if column == 2:
+            return describe_options(job.options)
+        if column == 3:
+            return self.status_text(job)
+        elapsed = job.elapsed
+        return "" if elapsed is None else f"{elapsed:.1f} s"
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            headers = self.headers()
+            return headers[section] if section < len(headers) else None
+        return str(section + 1)
+
+
+class JobQueue(QObject):
+    # Runs queued jobs in worker processes, at most max_concurrent at a time. A timer on the GUI thread
+    # starts jobs, collects results and drains the progress the workers send back.
+    jobs_reset = pyqtSignal()
+    job_changed = pyqtSignal(int)
+    finished = pyqtSignal(object)
+
+    def __init__(self, max_concurrent=None, parent=None, poll_interval=200):
+        super().__init__(parent)
+        self.jobs = []
+        self.max_concurrent = max_concurrent or available_cores()
+        self.running = False
+        self.run_started = None
+        self.run_jobs = []
+        self.executor = None
+        self.manager = None
+        self.progress_queue = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(poll_interval)
+        self.timer.timeout.connect(self.poll)
+
+    def add_job(self, job):
+        # Jobs added while the queue runs join the current run.
+        self.jobs.append(job)
+        if self.running:
+            self.run_jobs.append(job)
+        self.jobs_reset.emit()
+        return job
+
+    def remove_jobs(self, rows):
+        # Only jobs that are not running can be removed.
+        for row in sorted(rows, reverse=True):
+            if 0 <= row < len(self.jobs) and self.jobs[row].status != STATUS_RUNNING:
+                job = self.jobs.pop(row)
+                if job in self.run_jobs:
+                    self.run_jobs.remove(job)
+        self.jobs_reset.emit()
+
+    def clear_finished(self):
+        self.jobs = [job for job in self.jobs if job.status not in FINISHED_STATUSES]
+        self.jobs_reset.emit()
+
+    def set_max_concurrent(self, max_concurrent):
+        self.max_concurrent = max(1, max_concurrent)
+
+    def ensure_workers(self):
+        # Spawned rather than forked, so workers never inherit the GUI's Qt state.
+        if self.executor is None:
+            context = multiprocessing.get_context('spawn')
+            self.manager = context.Manager()
+            self.progress_queue = self.manager.Queue()
+            self.executor = ProcessPoolExecutor(max_workers=available_cores(), mp_context=context)
+
+    def start(self):
+        if self.running or not any(job.status == STATUS_QUEUED for job in self.jobs):
+            return False
+        self.ensure_workers()
+        self.running = True
+        self.run_started = time.monotonic()
+        self.run_jobs = [job for job in self.jobs if job.status == STATUS_QUEUED]
+        self.poll()
+        self.timer.start()
+        return True
+
+    def cancel(self):
+        for row, job in enumerate(self.jobs):
+            if job.status == STATUS_QUEUED and self.running:
+                job.status = STATUS_CANCELLED
+                self.job_changed.emit(row)
+            elif job.status == STATUS_RUNNING:
+                job.cancel_event.set()
+
+    def running_count(self):
+        return sum(job.status == STATUS_RUNNING for job in self.jobs)
+
+    def dispatch(self, row, job):
+        job.cancel_event = self.manager.Event()
+        options = {'selected_tracks': job.selected_tracks, **job.options, 'use_cache': False}
+        job.future = self.executor.submit(queued_job, job.job_id, job.ustx_file_path, job.output_file_path, options, self.progress_queue, job.cancel_event)
+        job.status = STATUS_RUNNING
+        job.started = time.monotonic()
+        self.job_changed.emit(row)
+
+    def poll(self):
+        rows = {job.job_id: row for row, job in enumerate(self.jobs)}
+        while True:
+            try:
+                job_id, stage, done, total = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            row = rows.get(job_id)
+            if row is not None and self.jobs[row].status == STATUS_RUNNING:
+                self.jobs[row].progress = (stage, done, total)
+
+        for row, job in enumerate(self.jobs):
+            if job.status != STATUS_RUNNING:
+                continue
+            if job.future.done():
+                try:
+                    job.summary = job.future.result()
+                except Exception as e:
+                    job.summary = {'input': job.ustx_file_path, 'output': job.output_file_path, 'status': STATUS_ERROR, 'error': f"Unexpected error: {e}"}
+                job.status = job.summary['status']
+                job.finished = time.monotonic()
+                job.future = None
+                job.cancel_event = None
+                logger.info("%s: %s in %.2f s", job.ustx_file_path, job.status, job.elapsed)
+            # Elapsed time and progress change on every tick.
+            self.job_changed.emit(row)
+
+        free = self.max_concurrent - self.running_count() if self.running else 0
+        for row, job in enumerate(self.jobs):
+            if free <= 0:
+                break
+            if job.status == STATUS_QUEUED:
+                self.dispatch(row, job)
+                free -= 1
+
+        if self.running and not any(job.status in (STATUS_QUEUED, STATUS_RUNNING) for job in self.run_jobs):
+            self.timer.stop()
+            self.running = False
+            self.finished.emit(aggregate_results(self.run_jobs, time.monotonic() - self.run_started))
+
+    def shutdown(self):
+        self.cancel()
+        self.timer.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
+def aggregate_results(jobs, wall_time):
+    # Totals for one run of the queue. job_time adds up every job's own time, so job_time / wall_time is the speed-up.
+    summaries = [job.summary for job in jobs if job.summary is not None]
+    counts = {status: 0 for status in (STATUS_DONE, STATUS_ERROR, STATUS_CANCELLED)}
+    for job in jobs:
+        if job.status in counts:
+            counts[job.status] += 1
+    return {
+        'jobs': len(jobs),
+        'ok': counts[STATUS_DONE],
+        'errors': counts[STATUS_ERROR],
+        'cancelled': counts[STATUS_CANCELLED],
+        'notes_in': sum(summary.get('notes_in') or 0 for summary in summaries),
+        'notes_out': sum(summary.get('notes_out') or 0 for summary in summaries),
+        'bytes_written': sum(summary.get('bytes_written') or 0 for summary in summaries),
+        'wall_time': wall_time,
+        'job_time': sum(job.elapsed or 0 for job in jobs if job.finished is not None),
+        'failures': [(job.ustx_file_path, job.summary.get('error', '')) for job in jobs if job.status == STATUS_ERROR],
+        'summaries': summaries,
+    }
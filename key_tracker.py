@@ -0,0 +1,114 @@
+import numpy as np
+
+from ustx_harms import key_names, major_profile, minor_profile
+
+MODES = ("major", "minor")
+
+def key_id(key_tone_index, mode):
+    # Keys are numbered C major, C minor, C# major, ... to keep the tie order of get_key_from_histogram.
+    return 2 * key_tone_index + MODES.index(mode)
+
+def key_from_id(key_id_value):
+    return key_id_value // 2, MODES[key_id_value % 2]
+
+def build_profile_matrix():
+    # matrix[pitch_class, key_id] is the profile weight of pitch_class in that key.
+    matrix = np.zeros((12, 24))
+    for key_tone_index in range(12):
+        for offset in range(12):
+            pitch_class = (key_tone_index + offset) % 12
+            matrix[pitch_class, key_id(key_tone_index, "major")] = major_profile[offset]
+            matrix[pitch_class, key_id(key_tone_index, "minor")] = minor_profile[offset]
+    return matrix
+
+PROFILE_MATRIX = build_profile_matrix()
+
+def ticks_per_bar(ustx_data):
+    resolution = int(ustx_data.get('resolution', 480))
+    beat_per_bar = int(ustx_data.get('beat_per_bar', 4))
+    beat_unit = int(ustx_data.get('beat_unit', 4))
+    time_signatures = ustx_data.get('time_signatures') or []
+    if time_signatures:
+        beat_per_bar = int(time_signatures[0].get('beat_per_bar', beat_per_bar))
+        beat_unit = int(time_signatures[0].get('beat_unit', beat_unit))
+    return max(1, resolution * 4 * beat_per_bar // beat_unit)
+
+
+class KeyTimeline:
+
+    def __init__(self, starts, key_ids):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.key_ids = np.asarray(key_ids, dtype=np.int64)
+
+    @classmethod
+    def constant(cls, key_tone_index, mode):
+        return cls([0], [key_id(key_tone_index, mode)])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def key_ids_at(self, positions):
+        segment = np.searchsorted(self.starts, np.asarray(positions), side='right') - 1
+        return self.key_ids[np.clip(segment, 0, len(self.starts) - 1)]
+
+    def segments(self):
+        result = []
+        for start, key_id_value in zip(self.starts.tolist(), self.key_ids.tolist()):
+            key_tone_index, mode = key_from_id(key_id_value)
+            result.append({'position': start, 'key_tone_index': key_tone_index, 'key': key_names[key_tone_index], 'mode': mode})
+        return result
+
+
+def detect_key_timeline(positions, tones, bar_ticks, window_bars=16, min_segment_bars=4, switch_margin=0.1):
+    positions = np.asarray(positions, dtype=np.int64)
+    tones = np.asarray(tones, dtype=np.int64)
+    if not len(tones):
+        return KeyTimeline.constant(0, "major")
+
+    bars = np.maximum(positions, 0) // bar_ticks
+    bar_count = int(bars.max()) + 1
+    bar_histograms = np.bincount(bars * 12 + tones % 12, minlength=bar_count * 12).reshape(bar_count, 12)
+
+    # Histogram of the window centred on every bar, from a running sum over bars.
+    cumulative = np.zeros((bar_count + 1, 12), dtype=np.int64)
+    np.cumsum(bar_histograms, axis=0, out=cumulative[1:])
+    half_before = window_bars // 2
+    first = np.clip(np.arange(bar_count) - half_before, 0, bar_count)
+    last = np.clip(np.arange(bar_count) - half_before + window_bars, 0, bar_count)
+    window_histograms = cumulative[last] - cumulative[first]
+
+    scores = window_histograms @ PROFILE_MATRIX
+    bar_keys = np.argmax(scores, axis=1)
+    active_bars = np.flatnonzero(window_histograms.sum(axis=1))
+    if not len(active_bars):
+        return KeyTimeline.constant(0, "major")
+
+    # A new key only takes over once it has clearly outscored the current one for min_segment_bars bars.
+    starts = [0]
+    key_ids = [int(bar_keys[active_bars[0]])]
+    candidate = None
+    candidate_start = 0
+    for bar in active_bars.tolist():
+        bar_key = int(bar_keys[bar])
+        current = key_ids[-1]
+        if bar_key == current or scores[bar, bar_key] <= scores[bar, current] * (1 + switch_margin):
+            candidate = None
+            continue
+        if bar_key != candidate:
+            candidate, candidate_start = bar_key, bar
+        if bar - candidate_start + 1 >= min_segment_bars:
+            starts.append(candidate_start * bar_ticks)
+            key_ids.append(candidate)
+            candidate = None
+    return KeyTimeline(starts, key_ids)
+
+def detect_track_key_timeline(ustx_data, project_index, track_no, window_bars=16, min_segment_bars=4):
+    # Projects mapped from a sidecar carry the timelines detected when it was written.
+    stored_key_timeline = getattr(ustx_data, 'stored_key_timeline', None)
+    stored = stored_key_timeline(track_no, window_bars, min_segment_bars) if stored_key_timeline is not None else None
+    if stored is not None:
+        return KeyTimeline(*stored)
+    return detect_key_timeline(
+        project_index.positions(track_no), project_index.tones(track_no), ticks_per_bar(ustx_data),
+        window_bars, min_segment_bars
+    )
@@ -1,21 +1,57 @@
+import argparse
 import sys
 import os
-from colorama import init
-from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import QDir
+import threading
 
-from gui import HarmonyGeneratorGUI
+from instrumentation import PROFILERS, configure, configure_from_env
 
-init() 
+CLI_COMMANDS = ('batch', 'watch')
+# numpy and the harmony modules are only needed once a project is opened; they are imported in the
+# background after the window is shown.
+PRELOAD_MODULES = ('numpy', 'project_index', 'key_tracker', 'harmony_engine', 'harmony_part')
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
+def run_cli(command, argv):
+    # Command line modes never import Qt.
+    if command == 'batch':
+        from batch import main as command_main
+    else:
+        from watch import main as command_main
+    return command_main(argv)
+
+def preload_modules():
+    for module_name in PRELOAD_MODULES:
+        try:
+            __import__(module_name)
+        except ImportError:
+            pass
+
+def create_window(qt_argv):
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QDir
+
+    app = QApplication(qt_argv)
 
     translations_dir = QDir.currentPath() + "/i18n"
     if not QDir(translations_dir).exists():
         os.makedirs("i18n", exist_ok=True)
 
+    from gui import HarmonyGeneratorGUI
     gui = HarmonyGeneratorGUI()
     gui.show()
+    threading.Thread(target=preload_modules, name="preload", daemon=True).start()
+    return app, gui
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(run_cli(sys.argv[1], sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--profile', nargs='?', const='harmony_profile.jsonl', help="record stage timings to this JSONL file")
+    parser.add_argument('--profiler', choices=PROFILERS, help="also dump a cProfile or pyinstrument profile of every job")
+    parser.add_argument('--log-level', help="console log level, e.g. INFO or DEBUG")
+    args, qt_args = parser.parse_known_args()
+    configure_from_env()
+    configure(args.log_level, args.profile, args.profiler)
 
+    app, gui = create_window(sys.argv[:1] + qt_args)
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,234 @@
+import os
+import threading
+
+from instrumentation import get_logger, stage
+from project_cache import load_ustx_project_cached
+from ustx_harms import CHORD_HARMONY, HarmonyJobCancelled, find_harmony_tracks, get_track_names, interval_name, get_key_from_histogram, add_harmony_tracks_to_ustx, key_names, parse_key_name, resolve_track_selection
+from ustx_project import load_ustx_project
+from ustx_writer import save_ustx_project
+
+logger = get_logger("pipeline")
+
+harmony_type_names = {1: "lower", 2: "upper", 3: "both", CHORD_HARMONY: "chord"}
+
+class JobControl:
+    # Progress reporting and cooperative cancellation for one harmonize_file run.
+
+    def __init__(self, progress=None, cancel_event=None):
+        self.progress = progress
+        self.cancel_event = cancel_event or threading.Event()
+        self.notes_total = 0
+        self.notes_done = 0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise HarmonyJobCancelled()
+
+    def report(self, stage, done=0, total=0):
+        self.check()
+        if self.progress:
+            self.progress(stage, done, total)
+
+    def notes_processed(self, count):
+        self.notes_done += count
+        self.report('generate', self.notes_done, self.notes_total)
+
+def resolve_key(ustx_data, project_index, key_track_no, manual_key_selection=False, key_name=None, key_mode="major", track_key_changes=False, window_bars=16, verbose=False):
+    detected_key_tone_index, detected_key_name, detected_key_mode = get_key_from_histogram(project_index.histogram(key_track_no), verbose=verbose)
+    key_info = {'detected_key': f"{detected_key_name} {detected_key_mode}", 'key_timeline': None}
+    if manual_key_selection:
+        key_tone_index = parse_key_name(key_name) if key_name is not None else None
+        if key_tone_index is None:
+            return key_info, f"Invalid key name: {key_name}"
+        key_name = key_names[key_tone_index]
+    else:
+        key_tone_index, key_name, key_mode = detected_key_tone_index, detected_key_name, detected_key_mode
+    key_info.update({'key_tone_index': key_tone_index, 'key_mode': key_mode, 'key': f"{key_name} {key_mode}"})
+
+    if track_key_changes and not manual_key_selection:
+        # Modules that need numpy are imported where they are used, so importing the pipeline stays
+        # cheap for the GUI's first window and for command line help.
+        from key_tracker import detect_track_key_timeline
+        key_timeline = detect_track_key_timeline(ustx_data, project_index, key_track_no, window_bars)
+        key_info['key_timeline'] = key_timeline
+        key_info['key_segments'] = [
+            {'position': segment['position'], 'key': f"{segment['key']} {segment['mode']}"}
+            for segment in key_timeline.segments()
+        ]
+    return key_info, None
+
+def harmony_voice_names(harmony_type, chord_intervals=None):
+    if harmony_type == CHORD_HARMONY:
+        return [interval_name(interval) for interval in chord_intervals or ()]
+    return [name for name, enabled in (("lower", harmony_type in (1, 3)), ("upper", harmony_type in (2, 3))) if enabled]
+
+def preview_harmony(ustx_data, project_index, selected_track_indices, harmony_type, semitone_interval, manual_key_selection=False, key_name=None, key_mode="major", track_key_changes=False, window_bars=16, chord_intervals=None):
+    # Harmony tones for the selected tracks computed from the index alone, without building or saving any parts.
+    from harmony_engine import chord_tones, generate_harmony_tones
+
+    if harmony_type == CHORD_HARMONY and not chord_intervals:
+        return None, f"Invalid chord intervals: {chord_intervals}"
+
+    key_info, key_error = resolve_key(ustx_data, project_index, selected_track_indices[0], manual_key_selection, key_name, key_mode, track_key_changes, window_bars)
+    if key_error:
+        return None, key_error
+    key_timeline = key_info['key_timeline']
+    track_names = get_track_names(ustx_data)
+    preview = {'key': key_info['key'], 'key_segments': key_info.get('key_segments', []), 'tracks': []}
+    for track_no in selected_track_indices:
+        positions = project_index.positions(track_no)
+        tones = project_index.tones(track_no)
+        key_ids = key_timeline.key_ids_at(positions) if key_timeline is not None else None
+        if harmony_type == CHORD_HARMONY:
+            harmonies = chord_tones(tones, chord_intervals, key_info['key_tone_index'], key_info['key_mode'], key_ids)
+        else:
+            harmonies = generate_harmony_tones(tones, semitone_interval, harmony_type, key_info['key_tone_index'], key_info['key_mode'], key_ids)
+        preview['tracks'].append({
+            'track_no': track_no,
+            'track_name': track_names[track_no] if track_no < len(track_names) else f"Track {track_no + 1}",
+            'positions': positions,
+            'lyrics': project_index.lyrics(track_no),
+            'tones': tones,
+            'harmonies': dict(zip(harmony_voice_names(harmony_type, chord_intervals), harmonies)),
+        })
+    return preview, None
+
+def harmonize_file(ustx_file_path, output_file_path, selected_tracks, harmony_type, semitone_interval, manual_key_selection=False, key_name=None, key_mode="major", track_key_changes=False, window_bars=16, verbose=False, job=None, use_cache=True, chord_intervals=None, carry_curves=None, tone_cache=None, memo_cache=False, split_rests=None, write_sidecar=False):
+    # Raises HarmonyJobCancelled when job is cancelled; every other failure is returned as the error string.
+    # memo_cache keeps per-track harmony results in a SQLite file next to the project (see harmony_cache).
+    # split_rests cuts harmony parts at rests of at least that many bars.
+    # write_sidecar exports the project's note data next to it after parsing the YAML, so later runs map it instead.
+    disk_cache = None
+    if memo_cache and tone_cache is None:
+        from harmony_cache import SqliteToneCache
+        tone_cache = disk_cache = SqliteToneCache.for_project(ustx_file_path)
+    with stage('harmonize_file', input=ustx_file_path) as record:
+        try:
+            summary, error = run_harmonize_file(
+                ustx_file_path, output_file_path, selected_tracks, harmony_type, semitone_interval, manual_key_selection,
+                key_name, key_mode, track_key_changes, window_bars, verbose, job or JobControl(), use_cache, chord_intervals, carry_curves, tone_cache, split_rests,
+                write_sidecar
+            )
+        finally:
+            if disk_cache is not None:
+                disk_cache.close()
+        record['notes'] = summary.get('notes_in')
+        record['bytes'] = summary.get('bytes_written')
+        record['error'] = error
+    summary['timings']['total'] = record['wall']
+    return summary, error
+
+def run_harmonize_file(ustx_file_path, output_file_path, selected_tracks, harmony_type, semitone_interval, manual_key_selection, key_name, key_mode, track_key_changes, window_bars, verbose, job, use_cache, chord_intervals=None, carry_curves=None, tone_cache=None, split_rests=None, write_sidecar=False):
+    from key_tracker import ticks_per_bar
+    from project_index import ProjectIndex
+
+    summary = {
+        'input': ustx_file_path,
+        'output': output_file_path,
+        'harmony_type': harmony_type_names.get(harmony_type, harmony_type),
+        'semitone_interval': semitone_interval,
+        'timings': {},
+    }
+    timings = summary['timings']
+    if harmony_type == CHORD_HARMONY:
+        if not chord_intervals:
+            return summary, f"Invalid chord intervals: {chord_intervals}"
+        summary['chord_intervals'] = list(chord_intervals)
+
+    job.report('load')
+    with stage('load') as record:
+        ustx_data, error_ustx = (load_ustx_project_cached if use_cache else load_ustx_project)(ustx_file_path)
+        if not error_ustx:
+            record['notes'] = ustx_data.note_count
+            record['bytes'] = os.path.getsize(ustx_data.path)
+            record['sidecar'] = ustx_data.from_sidecar
+    timings['load'] = record['wall']
+    if error_ustx:
+        return summary, f"Error loading USTx file: {error_ustx}"
+    summary['sidecar'] = 'loaded' if ustx_data.from_sidecar else None
+    if write_sidecar and not ustx_data.from_sidecar:
+        from ustx_sidecar import save_sidecar
+        with stage('sidecar') as record:
+            sidecar_stats, sidecar_error = save_sidecar(ustx_data)
+            if not sidecar_error:
+                record['bytes'] = sidecar_stats['bytes_written']
+        # The harmonies do not depend on the sidecar, so failing to write one is only reported.
+        if sidecar_error:
+            logger.warning("%s: %s", ustx_file_path, sidecar_error)
+        else:
+            summary['sidecar'] = 'written'
+
+    job.report('index')
+    with stage('index') as record:
+        project_index = ProjectIndex.from_project(ustx_data)
+        record['notes'] = project_index.note_count()
+    timings['index'] = record['wall']
+
+    track_names = get_track_names(ustx_data)
+    selected_track_indices = resolve_track_selection(track_names, selected_tracks)
+    if not selected_track_indices:
+        return summary, f"Invalid track selection: {selected_tracks}"
+    # Tracks generated by an earlier run are never harmonized again; they are replaced instead.
+    harmony_tracks = find_harmony_tracks(ustx_data)
+    selected_track_indices = [track_no for track_no in selected_track_indices if track_no not in harmony_tracks]
+    if not selected_track_indices:
+        return summary, "Only generated harmony tracks were selected"
+    summary['tracks'] = [track_names[i] for i in selected_track_indices]
+    summary['notes_in'] = project_index.note_count(selected_track_indices)
+
+    job.report('key_detect')
+    with stage('key_detect', notes=project_index.note_count(selected_track_indices[:1])) as record:
+        key_info, key_error = resolve_key(ustx_data, project_index, selected_track_indices[0], manual_key_selection, key_name, key_mode, track_key_changes, window_bars, verbose)
+    summary['detected_key'] = key_info['detected_key']
+    if key_error:
+        return summary, key_error
+    key_tone_index, key_mode, key_timeline = key_info['key_tone_index'], key_info['key_mode'], key_info['key_timeline']
+    summary['key'] = key_info['key']
+    if key_timeline is not None:
+        summary['key_timeline'] = key_info['key_segments']
+    timings['key_detect'] = record['wall']
+
+    harmony_voice_count = len(harmony_voice_names(harmony_type, chord_intervals))
+    job.notes_total = summary['notes_in'] * harmony_voice_count
+    job.report('generate', 0, job.notes_total)
+    with stage('generate') as record:
+        changes = []
+        split_rest_ticks = int(split_rests * ticks_per_bar(ustx_data)) if split_rests else None
+        modified_ustx_data = add_harmony_tracks_to_ustx(
+            ustx_data, selected_track_indices, harmony_type, track_names,
+            semitone_interval, key_tone_index, key_mode, project_index, key_timeline, job.notes_processed, chord_intervals, carry_curves, tone_cache, changes,
+            split_rest_ticks
+        )
+        new_track_nos = [change['track_no'] for change in changes]
+        summary['tracks_added'] = sum(change['status'] == 'added' for change in changes)
+        summary['tracks_replaced'] = sum(change['status'] == 'replaced' for change in changes)
+        summary['harmony_changes'] = changes
+        summary['harmony_parts'] = sum(len(project_index.parts(track_no)) for track_no in new_track_nos)
+        summary['notes_out'] = record['notes'] = project_index.note_count(new_track_nos)
+        if tone_cache is not None:
+            summary['tracks_reused'] = record['cache_hits'] = tone_cache.hits
+            summary['tracks_recomputed'] = record['cache_misses'] = tone_cache.misses
+            logger.info("Harmony cache: %d track(s) reused, %d recomputed", tone_cache.hits, tone_cache.misses)
+        if carry_curves is not None:
+            summary['curve_points'] = sum(len(curve['xs']) for track_no in new_track_nos for part in project_index.parts(track_no) for curve in part['curves'])
+    timings['generate'] = record['wall']
+
+    job.report('serialize')
+    with stage('save', notes=summary['notes_out']) as record:
+        save_stats, save_error = save_ustx_project(modified_ustx_data, output_file_path, job.report)
+        if not save_error:
+            record['bytes'] = save_stats['bytes_written']
+            record['mode'] = save_stats['mode']
+    if save_error:
+        return summary, save_error
+    timings['save'] = save_stats['elapsed']
+    summary['bytes_written'] = save_stats['bytes_written']
+    summary['save_mode'] = save_stats['mode']
+    return summary, None
@@ -0,0 +1,115 @@
+from bisect import bisect_right
+from collections import OrderedDict
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QObject, QRunnable, Qt, pyqtSignal, pyqtSlot
+
+from pipeline import preview_harmony
+from ustx_harms import key_names
+
+def tone_name(tone):
+    return f"{key_names[tone % 12].split('/')[0]}{tone // 12 - 1}"
+
+class PreviewCache:
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        preview = self._entries.get(key)
+        if preview is not None:
+            self._entries.move_to_end(key)
+        return preview
+
+    def put(self, key, preview):
+        self._entries[key] = preview
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class PreviewSignals(QObject):
+    finished = pyqtSignal(object, object)
+    error = pyqtSignal(object, str)
+
+
+class PreviewWorker(QRunnable):
+
+    def __init__(self, request_key, ustx_data, project_index, options):
+        super().__init__()
+        self.request_key = request_key
+        self.ustx_data = ustx_data
+        self.project_index = project_index
+        self.options = options
+        self.signals = PreviewSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            preview, error = preview_harmony(self.ustx_data, self.project_index, **self.options)
+        except Exception as e:
+            preview, error = None, f"Unexpected error: {e}"
+        if error:
+            self.signals.error.emit(self.request_key, error)
+        else:
+            self.signals.finished.emit(self.request_key, preview)
+
+
+class HarmonyPreviewModel(QAbstractTableModel):
+    # Serves rows straight from the preview arrays, so only the visible notes are ever formatted.
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tracks = []
+        self.row_offsets = []
+        self.harmony_names = []
+        self.total_rows = 0
+
+    def set_preview(self, preview):
+        self.beginResetModel()
+        self.tracks = preview['tracks'] if preview else []
+        self.harmony_names = list(self.tracks[0]['harmonies']) if self.tracks else []
+        self.row_offsets = []
+        self.total_rows = 0
+        for track in self.tracks:
+            self.row_offsets.append(self.total_rows)
+            self.total_rows += len(track['tones'])
+        self.endResetModel()
+
+    def headers(self):
+        titles = {'lower': self.tr("Lower"), 'upper': self.tr("Upper")}
+        return [self.tr("Track"), self.tr("Position"), self.tr("Lyric"), self.tr("Original")] + [titles.get(name, name) for name in self.harmony_names]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.total_rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 4 + len(self.harmony_names)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        track_offset = bisect_right(self.row_offsets, index.row()) - 1
+        track = self.tracks[track_offset]
+        row = index.row() - self.row_offsets[track_offset]
+        column = index.column()
+        if column == 0:
+            return track['track_name']
+        if column == 1:
+            return str(int(track['positions'][row]))
+        if column == 2:
+            return track['lyrics'][row]
+        if column == 3:
+            return tone_name(int(track['tones'][row]))
+        return tone_name(int(track['harmonies'][self.harmony_names[column - 4]][row]))
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            headers = self.headers()
+            return headers[section] if section < len(headers) else None
+        return str(section + 1)
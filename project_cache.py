@@ -0,0 +1,65 @@
+import os
+import threading
+from collections import OrderedDict
+
+from ustx_project import load_ustx_project
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+class ProjectCache:
+    # Parsed projects keyed on (absolute path, mtime, size), evicted least recently used first.
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def load(self, file_path):
+        if not file_path.lower().endswith(".ustx"):
+            file_path += ".ustx"
+        file_path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None, "FileNotFoundError"
+        key = (file_path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            project = self._entries.get(key)
+            if project is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return project.view(), False
+            self.misses += 1
+
+        project, error = load_ustx_project(file_path)
+        if error:
+            return None, error
+
+        with self._lock:
+            for stale_key in [k for k in self._entries if k[0] == file_path]:
+                self._remove(stale_key)
+            size = project.estimated_size
+            if size <= self.max_bytes:
+                self._entries[key] = project
+                self._sizes[key] = size
+                while self.total_bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+        return project.view(), False
+
+    def _remove(self, key):
+        del self._entries[key]
+        del self._sizes[key]
+
+
+project_cache = ProjectCache()
+
+def load_ustx_project_cached(file_path):
+    return project_cache.load(file_path)
@@ -0,0 +1,157 @@
+import hashlib
+
+import numpy as np
+
+class TrackIndex:
+    __slots__ = ('track_no', 'parts', 'histogram', 'start', 'end', 'note_count', '_columns')
+
+    def __init__(self, track_no):
+        self.track_no = track_no
+        self.parts = []
+        self.histogram = np.zeros(12, dtype=np.int64)
+        self.start = None
+        self.end = None
+        self.note_count = 0
+        self._columns = None
+
+    def add_part(self, voice_part):
+        positions, durations, tones = part_columns(voice_part)
+        part_position = int(voice_part.get('position', 0))
+        self.parts.append(voice_part)
+        self.note_count += len(tones)
+        self._columns = None
+        if not len(tones):
+            return
+        self.histogram += np.bincount(tones % 12, minlength=12)
+        start = part_position + int(positions.min())
+        end = part_position + int((positions + durations).max())
+        self.start = start if self.start is None else min(self.start, start)
+        self.end = end if self.end is None else max(self.end, end)
+
+    def notes(self):
+        notes = []
+        for voice_part in self.parts:
+            notes.extend(voice_part.get('notes', []))
+        return notes
+
+    def columns(self):
+        # Absolute note positions and tones of the whole track, concatenated in part order.
+        if self._columns is None:
+            positions = []
+            tones = []
+            for voice_part in self.parts:
+                part_positions, _, part_tones = part_columns(voice_part)
+                positions.append(part_positions.astype(np.int64) + int(voice_part.get('position', 0)))
+                tones.append(part_tones)
+            if positions:
+                self._columns = np.concatenate(positions), np.concatenate(tones)
+            else:
+                self._columns = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        return self._columns
+
+    def positions(self):
+        return self.columns()[0]
+
+    def lyrics(self):
+        lyrics = []
+        for voice_part in self.parts:
+            lyrics.extend(part_lyrics(voice_part))
+        return lyrics
+
+    def tones(self):
+        return self.columns()[1]
+
+    def note_hash(self):
+        # Changes whenever a note of the track is added, removed, moved, resized or retuned.
+        digest = hashlib.blake2b(digest_size=16)
+        for voice_part in self.parts:
+            positions, durations, tones = part_columns(voice_part)
+            digest.update(int(voice_part.get('position', 0)).to_bytes(8, 'little', signed=True))
+            digest.update(len(tones).to_bytes(8, 'little'))
+            for column in (positions, durations, tones):
+                digest.update(np.ascontiguousarray(column, dtype=np.int32).tobytes())
+        return digest.hexdigest()
+
+
+def part_lyrics(voice_part, first=0, last=None):
+    # Lyrics of the part's notes first:last; for a harmony part, only those of its source notes in note_range.
+    part_ranges = getattr(voice_part, 'part_ranges', None)
+    if part_ranges is not None:
+        return [lyric for source_part, part_first, part_last in part_ranges() for lyric in part_lyrics(source_part, part_first, part_last)]
+    note_array = getattr(voice_part, 'note_array', None)
+    if note_array is not None:
+        return [note_array.lyrics[i] for i in note_array.lyric_index[first:last]]
+    return [note.get('lyric', '') for note in voice_part.get('notes', [])[first:last]]
+
+def part_columns(voice_part):
+    if hasattr(voice_part, 'columns'):
+        return voice_part.columns()
+    note_array = getattr(voice_part, 'note_array', None)
+    if note_array is not None:
+        return (
+            np.frombuffer(note_array.position, dtype=np.int32),
+            np.frombuffer(note_array.duration, dtype=np.int32),
+            np.frombuffer(note_array.tone, dtype=np.int32),
+        )
+    notes = voice_part.get('notes', [])
+    return (
+        np.fromiter((note['position'] for note in notes), dtype=np.int32, count=len(notes)),
+        np.fromiter((note['duration'] for note in notes), dtype=np.int32, count=len(notes)),
+        np.fromiter((note['tone'] for note in notes), dtype=np.int32, count=len(notes)),
+    )
+
+
+class ProjectIndex:
+
+    def __init__(self, voice_parts=()):
+        self.tracks = {}
+        for voice_part in voice_parts:
+            self.add_part(voice_part)
+
+    @classmethod
+    def from_project(cls, ustx_data):
+        return cls(ustx_data.get('voice_parts', []))
+
+    def add_part(self, voice_part):
+        track_no = int(voice_part.get('track_no', 0))
+        track = self.tracks.get(track_no)
+        if track is None:
+            track = self.tracks[track_no] = TrackIndex(track_no)
+        track.add_part(voice_part)
+        return track
+
+    def remove_track(self, track_no):
+        self.tracks.pop(track_no, None)
+
+    def track(self, track_no):
+        return self.tracks.get(track_no) or TrackIndex(track_no)
+
+    def parts(self, track_no):
+        return self.track(track_no).parts
+
+    def notes(self, track_no):
+        return self.track(track_no).notes()
+
+    def tones(self, track_no):
+        return self.track(track_no).tones()
+
+    def positions(self, track_no):
+        return self.track(track_no).positions()
+
+    def lyrics(self, track_no):
+        return self.track(track_no).lyrics()
+
+    def note_hash(self, track_no):
+        return self.track(track_no).note_hash()
+
+    def histogram(self, track_no):
+        return self.track(track_no).histogram
+
+    def time_bounds(self, track_no):
+        track = self.track(track_no)
+        return track.start, track.end
+
+    def note_count(self, track_nos=None):
+        if track_nos is None:
+            track_nos = self.tracks
+        return sum(self.track(track_no).note_count for track_no in track_nos)
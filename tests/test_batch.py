@@ -0,0 +1,27 @@
+import os
+
+from batch import collect_input_files
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('name: Test\n')
+    return path
+
+
+def test_earlier_outputs_are_skipped(tmp_path):
+    song = touch(str(tmp_path / 'song.ustx'))
+    touch(str(tmp_path / 'song_harmony.ustx'))
+    nested = touch(str(tmp_path / 'album' / 'track.ustx'))
+    touch(str(tmp_path / 'album' / 'track_harmony.ustx'))
+
+    assert collect_input_files([str(tmp_path)], suffix='_harmony') == [song]
+    assert collect_input_files([str(tmp_path)], recursive=True, suffix='_harmony') == [nested, song]
+    assert collect_input_files([str(tmp_path / '**' / '*.ustx')], recursive=True, suffix='_harmony') == [nested, song]
+
+def test_named_outputs_and_other_suffixes_are_kept(tmp_path):
+    song = touch(str(tmp_path / 'song.ustx'))
+    output = touch(str(tmp_path / 'song_harmony.ustx'))
+
+    assert collect_input_files([output], suffix='_harmony') == [output]
+    assert collect_input_files([str(tmp_path)], suffix='_voices') == [song, output]
@@ -0,0 +1,83 @@
+import itertools
+
+import numpy as np
+
+import harmony_cache
+from harmony_cache import SqliteToneCache, ToneCache, harmony_cache_key
+
+def cache_key(note_hash, interval=4):
+    return harmony_cache_key(note_hash, 1, interval, None, 0, 'major')
+
+def voices(*tones):
+    return [np.array(tones, dtype=np.int32)]
+
+
+def test_tone_cache_hit_and_miss():
+    cache = ToneCache({cache_key('a'): voices(60, 62)})
+
+    assert cache.get(cache_key('b')) is None
+    cache.put(cache_key('b'), voices(64))
+
+    assert cache.get(cache_key('a'))[0].tolist() == [60, 62]
+    assert cache.get(cache_key('b'))[0].tolist() == [64]
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert set(cache.used) == {cache_key('a'), cache_key('b')}
+
+def test_cache_key_follows_settings():
+    assert cache_key('a') == cache_key('a')
+    assert cache_key('a') != cache_key('a', interval=3)
+    assert cache_key('a') != cache_key('b')
+
+def test_sqlite_cache_persists_across_runs(tmp_path):
+    path = str(tmp_path / 'song.harmony-cache.sqlite')
+    cache = SqliteToneCache(path)
+    assert cache.get(cache_key('a')) is None
+    cache.put(cache_key('a'), [np.array([57, 59]), np.array([64, 65])])
+    assert cache.get(cache_key('a'))[1].tolist() == [64, 65]
+    cache.close()
+
+    cache = SqliteToneCache(path)
+    tones = cache.get(cache_key('a'))
+    cache.close()
+
+    assert [voice.tolist() for voice in tones] == [[57, 59], [64, 65]]
+    assert (cache.hits, cache.misses) == (1, 0)
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = itertools.count(1)
+    monkeypatch.setattr(harmony_cache.time, 'time', lambda: next(clock))
+    path = str(tmp_path / 'song.harmony-cache.sqlite')
+    for note_hash in 'ab':
+        cache = SqliteToneCache(path)
+        cache.put(cache_key(note_hash), voices(*range(10)))
+        cache.close()
+    cache = SqliteToneCache(path)
+    cache.get(cache_key('a'))
+    cache.close()
+
+    # Room for two rows of 40 bytes: 'b' was used least recently, so it goes.
+    cache = SqliteToneCache(path, max_bytes=80)
+    cache.put(cache_key('c'), voices(*range(10)))
+    cache.close()
+
+    cache = SqliteToneCache(path)
+    present = [note_hash for note_hash in 'abc' if cache.get(cache_key(note_hash)) is not None]
+    cache.close()
+    assert present == ['a', 'c']
+
+def test_sqlite_cache_holds_no_lock_while_open(tmp_path):
+    # A job that has read and stored rows must not block another job on the same project from saving.
+    path = str(tmp_path / 'song.harmony-cache.sqlite')
+    first = SqliteToneCache(path)
+    first.get(cache_key('a'))
+    first.put(cache_key('a'), voices(60))
+    second = SqliteToneCache(path)
+    second.connection.execute("PRAGMA busy_timeout = 0")
+    second.put(cache_key('b'), voices(62))
+    second.flush()
+    second.close()
+    first.close()
+
+    cache = SqliteToneCache(path)
+    assert cache.get(cache_key('a')) is not None and cache.get(cache_key('b')) is not None
+    cache.close()
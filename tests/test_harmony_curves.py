@@ -0,0 +1,54 @@
+import numpy as np
+import yaml
+
+from harmony_curves import clip_curve, resample_curve, thin_curve, transform_curves, window_curves
+from ustx_project import UstxDumper
+
+def curve_part(xs, ys, abbr='dyn'):
+    return {'position': 0, 'notes': [], 'curves': [{'xs': list(xs), 'ys': list(ys), 'abbr': abbr}]}
+
+
+def test_window_curves_match_transforming_each_window():
+    rng = np.random.default_rng(0)
+    xs = np.sort(rng.choice(20000, 2000, replace=False))
+    part = curve_part(xs.tolist(), rng.integers(-100, 100, len(xs)).tolist())
+    windows = [(0, 500), (480, 3000), (7000, 1), (12345, 6000), (19990, 100), (25000, 100)]
+
+    for options in ({}, {'interval': 5}, {'interval': 10, 'tolerance': 3}):
+        expected = [transform_curves([part], [-offset], window=(0, duration), **options) for offset, duration in windows]
+        assert window_curves(part, windows, **options) == expected
+
+def test_resample_curve_on_interval_grid():
+    xs, ys = resample_curve(np.array([3, 20, 41]), np.array([0.0, 17.0, 38.0]), 10)
+
+    assert xs.tolist() == [10, 20, 30, 40]
+    assert ys.tolist() == [7.0, 17.0, 27.0, 37.0]
+
+def test_thin_curve_keeps_points_outside_tolerance():
+    xs, ys = np.array([0, 10, 20, 30, 40]), np.array([0.0, 10.0, 20.0, 31.0, 0.0])
+
+    assert thin_curve(xs, ys, 2)[0].tolist() == [0, 30, 40]
+    assert thin_curve(xs, ys, 0.5)[0].tolist() == [0, 20, 30, 40]
+    assert thin_curve(xs, ys, 0)[0].tolist() == [0, 20, 30, 40]
+
+def test_clip_curve_interpolates_at_the_edges():
+    xs, ys = clip_curve(np.array([0, 100, 200]), np.array([0.0, 100.0, 0.0]), 50, 150)
+
+    assert xs.tolist() == [50, 100, 150]
+    assert ys.tolist() == [50.0, 100.0, 50.0]
+    # No value is made up past the curve's own ends.
+    assert clip_curve(np.array([0, 100]), np.array([0.0, 100.0]), 25, 200)[0].tolist() == [25, 100]
+
+def test_transform_curves_moves_and_merges_parts():
+    first = {'curves': [{'xs': [0, 10], 'ys': [1, 1], 'abbr': 'dyn'}]}
+    second = {'curves': [{'xs': [0, 5], 'ys': [9, 9], 'abbr': 'dyn'}, {'xs': [0], 'ys': [3], 'abbr': 'vel'}]}
+
+    curves = transform_curves([first, second], [0, 10])
+
+    # The later part wins where both have a point, and expressions not asked for are left out.
+    assert curves == [{'xs': [0, 10, 15], 'ys': [1, 9, 9], 'abbr': 'dyn'}]
+
+def test_curve_points_are_written_in_flow_style():
+    curves = transform_curves([curve_part([0, 480], [10, -10])], [0])
+
+    assert yaml.dump(curves, Dumper=UstxDumper, sort_keys=False) == "- xs: [0, 480]\n  ys: [10, -10]\n  abbr: dyn\n"
@@ -0,0 +1,101 @@
+from array import array
+
+import numpy as np
+
+from benchmarks.bench_harmony import reference_generate_harmony_notes
+from harmony_engine import DEFAULT_VOICE_RANGE, as_tone_array, chord_tones, generate_harmony_tones, is_parallel_fifth, position_tones, scale_positions, snap_table
+from key_tracker import key_id
+from ustx_harms import is_note_in_key
+
+TONES = list(range(36, 97))
+C_MAJOR_TONES = [tone for tone in range(55, 80) if tone % 12 in (0, 2, 4, 5, 7, 9, 11)]
+
+
+def test_snap_tables_match_the_per_note_loop():
+    notes = [{'position': 0, 'tone': tone} for tone in TONES]
+    for key_tone_index in range(12):
+        for key_mode in ("major", "minor"):
+            for interval in (1, 3, 4, 7):
+                expected = reference_generate_harmony_notes(notes, interval, 3, key_tone_index, key_mode)
+                actual = generate_harmony_tones(TONES, interval, 3, key_tone_index, key_mode)
+                assert [voice.tolist() for voice in actual] == [[note['tone'] for note in voice] for voice in expected]
+
+def test_harmony_tones_are_in_key():
+    lower, upper = generate_harmony_tones(TONES, 4, 3, 9, "minor")
+
+    assert all(is_note_in_key(tone, 9, "minor") for tone in lower.tolist() + upper.tolist())
+    # Lower voices are corrected upwards and upper voices downwards, never past the melody.
+    assert (lower < np.array(TONES)).all() and (upper > np.array(TONES)).all()
+
+def test_harmony_type_selects_voices():
+    assert len(generate_harmony_tones(TONES, 3, 1, 0, "major")) == 1
+    assert len(generate_harmony_tones(TONES, 3, 2, 0, "major")) == 1
+    assert len(generate_harmony_tones(TONES, 3, 3, 0, "major")) == 2
+
+def test_per_note_keys_match_fixed_keys():
+    # Each half of the notes snapped with its own key, in one call.
+    key_ids = np.array([key_id(0, "major")] * 30 + [key_id(8, "minor")] * (len(TONES) - 30))
+
+    lower, = generate_harmony_tones(TONES, 3, 1, 0, "major", key_ids)
+
+    assert lower[:30].tolist() == generate_harmony_tones(TONES[:30], 3, 1, 0, "major")[0].tolist()
+    assert lower[30:].tolist() == generate_harmony_tones(TONES[30:], 3, 1, 8, "minor")[0].tolist()
+
+def test_snap_table_is_shared_and_read_only():
+    table = snap_table(0, "major", 1)
+
+    assert snap_table(0, "major", 1) is table
+    assert not table.flags.writeable
+    # C#, D#, F#, G# and A# go up a semitone in C major; scale tones stay.
+    assert table.tolist() == [0, 1, 0, 1, 0, 0, 1, 0, 1, 0, 1, 0]
+
+def test_tone_columns_are_read_without_copying():
+    column = array('i', [60, 62, 64])
+
+    tones = as_tone_array(column)
+
+    assert tones.tolist() == [60, 62, 64]
+    assert np.shares_memory(tones, np.frombuffer(column, dtype=np.int32))
+    assert as_tone_array([60, 61]).dtype == np.int32
+
+def parallel_fifths(voices):
+    return [
+        (a, b, i) for a in range(len(voices)) for b in range(a + 1, len(voices)) for i in range(1, len(voices[0]))
+        if is_parallel_fifth(voices[a][i - 1], voices[b][i - 1], voices[a][i], voices[b][i])
+    ]
+
+def test_chord_voices_follow_diatonic_intervals():
+    third_below, sixth_above = chord_tones([60, 62, 64], [-3, 6], 0, "major")
+
+    assert third_below.tolist() == [57, 59, 60]
+    assert sixth_above.tolist() == [69, 71, 72]
+
+def test_chord_voices_avoid_parallel_fifths():
+    melody = np.array([60, 62, 64, 65])
+    plain_fifths = position_tones(scale_positions(melody, 0, 0) + 4, 0, 0)
+    assert parallel_fifths([melody.tolist(), plain_fifths.tolist()])
+
+    fifth_above, = chord_tones(melody, [5], 0, "major")
+
+    assert not parallel_fifths([melody.tolist(), fifth_above.tolist()])
+
+def test_chord_voices_stay_in_key_and_range():
+    rng = np.random.default_rng(1)
+    low, high = DEFAULT_VOICE_RANGE
+    for _ in range(20):
+        melody = rng.choice(np.array(C_MAJOR_TONES), 64)
+
+        voices = chord_tones(melody, [-3, 5, -8], 0, "major")
+
+        assert not parallel_fifths([melody.tolist()] + [voice.tolist() for voice in voices])
+        for voice in voices:
+            assert all(is_note_in_key(tone, 0, "major") for tone in voice.tolist())
+            assert low <= voice.min() and voice.max() <= high
+
+def test_chord_voices_follow_key_changes():
+    key_ids = np.array([key_id(0, "major")] * 3 + [key_id(9, "minor")] * 3)
+
+    third_below, = chord_tones([60, 62, 64, 60, 62, 64], [-3], 0, "major", key_ids)
+
+    assert third_below.tolist()[:3] == chord_tones([60, 62, 64], [-3], 0, "major")[0].tolist()
+    assert third_below.tolist()[3:] == chord_tones([60, 62, 64], [-3], 9, "minor")[0].tolist()
@@ -0,0 +1,55 @@
+import numpy as np
+
+from key_tracker import KeyTimeline, detect_key_timeline, key_id, ticks_per_bar
+
+BAR = 1920
+C_MAJOR = [60, 62, 64, 65, 67, 69, 71, 72]
+A_FLAT_MAJOR = [68, 70, 72, 73, 75, 77, 79, 80]
+
+def scale_bars(scale, bars, first_bar=0):
+    # Eight eighth notes per bar running up the scale.
+    positions = [(first_bar + bar) * BAR + i * 240 for bar in range(bars) for i in range(8)]
+    return positions, scale * bars
+
+
+def test_single_key():
+    positions, tones = scale_bars(C_MAJOR, 32)
+
+    timeline = detect_key_timeline(positions, tones, BAR)
+
+    assert timeline.starts.tolist() == [0]
+    assert timeline.key_ids.tolist() == [key_id(0, "major")]
+
+def test_modulation_starts_a_new_segment():
+    positions, tones = scale_bars(C_MAJOR, 32)
+    later_positions, later_tones = scale_bars(A_FLAT_MAJOR, 32, first_bar=32)
+
+    timeline = detect_key_timeline(positions + later_positions, tones + later_tones, BAR)
+
+    assert [segment['key'] + " " + segment['mode'] for segment in timeline.segments()] == ["C major", "G#/Ab major"]
+    # The change is placed from a 16-bar window, so within half a window of where it really happens.
+    assert 24 * BAR <= timeline.starts[1] <= 40 * BAR
+    assert timeline.key_ids_at([0, 40 * BAR]).tolist() == [key_id(0, "major"), key_id(8, "major")]
+
+def test_short_excursion_is_ignored():
+    positions, tones = scale_bars(C_MAJOR, 16)
+    excursion_positions, excursion_tones = scale_bars(A_FLAT_MAJOR, 2, first_bar=16)
+    later_positions, later_tones = scale_bars(C_MAJOR, 16, first_bar=18)
+
+    timeline = detect_key_timeline(positions + excursion_positions + later_positions, tones + excursion_tones + later_tones, BAR, window_bars=4, min_segment_bars=4)
+
+    assert timeline.key_ids.tolist() == [key_id(0, "major")]
+
+def test_no_notes_is_c_major():
+    timeline = detect_key_timeline([], [], BAR)
+
+    assert timeline.key_ids.tolist() == [key_id(0, "major")]
+
+def test_key_ids_at_clamps_before_first_segment():
+    timeline = KeyTimeline([0, 4 * BAR], [key_id(0, "major"), key_id(9, "minor")])
+
+    assert timeline.key_ids_at(np.array([-10, 0, 4 * BAR - 1, 4 * BAR, 100 * BAR])).tolist() == [0, 0, 0, 19, 19]
+
+def test_ticks_per_bar_follows_time_signature():
+    assert ticks_per_bar({'resolution': 480}) == 1920
+    assert ticks_per_bar({'resolution': 480, 'time_signatures': [{'beat_per_bar': 6, 'beat_unit': 8}]}) == 1440
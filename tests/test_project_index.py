@@ -0,0 +1,12 @@
+from project_index import ProjectIndex, part_lyrics
+from test_ustx_writer import harmonize, write_source
+
+
+def test_split_harmony_lyrics_line_up_with_notes(tmp_path):
+    project = harmonize(write_source(tmp_path / 'song.ustx', 'default'), split_rest_ticks=480)
+    project_index = ProjectIndex.from_project(project)
+
+    assert len(project_index.parts(1)) == 2
+    assert len(project_index.lyrics(1)) == len(project_index.tones(1)) == len(project_index.positions(1))
+    assert project_index.lyrics(1) == project_index.lyrics(0) == ['a', 'b', 'c']
+    assert [part_lyrics(part) for part in project_index.parts(1)] == [['a', 'b'], ['c']]
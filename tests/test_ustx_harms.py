@@ -0,0 +1,58 @@
+import numpy as np
+
+from test_ustx_writer import LOWER_HARMONY, harmonize, write_source
+from ustx_harms import CHORD_HARMONY, add_harmony_tracks_to_ustx, find_harmony_tracks, get_track_names, note_diff, parse_chord_intervals
+
+def regenerate(project, harmony_type=LOWER_HARMONY, semitone_interval=4, chord_intervals=None):
+    changes = []
+    add_harmony_tracks_to_ustx(project, [0], harmony_type, get_track_names(project), semitone_interval, 0, 'major', chord_intervals=chord_intervals, changes=changes)
+    return changes
+
+
+def test_parse_chord_intervals():
+    assert parse_chord_intervals("-3, 5; -8") == [-3, 5, -8]
+    assert parse_chord_intervals("3, -3") == [3, -3]
+
+def test_parse_chord_intervals_rejects_bad_input():
+    for text in ("", "1", "16", "third", "-3,-3", "5, 5"):
+        assert parse_chord_intervals(text) is None
+
+def test_note_diff_matches_notes_by_position():
+    # Two notes stacked at 0 are matched in order; the note at 960 moved to 1440.
+    old_positions, old_tones = np.array([0, 0, 480, 960]), np.array([60, 64, 62, 65])
+    new_positions, new_tones = np.array([0, 0, 480, 1440]), np.array([60, 65, 62, 67])
+
+    assert note_diff(old_positions, old_tones, new_positions, new_tones) == {'changed': 1, 'added': 1, 'removed': 1}
+    assert note_diff(old_positions, old_tones, old_positions, old_tones) == {'changed': 0, 'added': 0, 'removed': 0}
+
+def test_regeneration_replaces_harmony_track(tmp_path):
+    project = harmonize(write_source(tmp_path / 'song.ustx', 'default'))
+    project['tracks'][1]['mute'] = True
+
+    changes = regenerate(project, semitone_interval=3)
+
+    assert len(project['tracks']) == 2 and len(project['voice_parts']) == 2
+    assert changes == [{
+        'track_no': 1, 'track': 'Lead - Lower Harmony', 'source_track': 'Lead', 'voice': 'Lower Harmony', 'parts': 1,
+        'status': 'replaced', 'changed': 1, 'added': 0, 'removed': 0,
+    }]
+    # Settings made on the harmony track survive regeneration.
+    assert project['tracks'][1]['mute'] is True
+    assert [note['tone'] for note in project['voice_parts'][1]['notes']] == [57, 62, 64]
+
+def test_regenerating_unchanged_harmony_reports_no_changes(tmp_path):
+    project = harmonize(write_source(tmp_path / 'song.ustx', 'default'))
+
+    changes = regenerate(project)
+
+    assert (changes[0]['status'], changes[0]['changed'], changes[0]['added'], changes[0]['removed']) == ('replaced', 0, 0, 0)
+    assert list(find_harmony_tracks(project)) == [1]
+
+def test_regenerating_chord_keeps_each_voice(tmp_path):
+    project = harmonize(write_source(tmp_path / 'song.ustx', 'default'))
+    regenerate(project, CHORD_HARMONY, chord_intervals=[-3, 5])
+
+    changes = regenerate(project, CHORD_HARMONY, chord_intervals=[-3, 5])
+
+    assert [change['status'] for change in changes] == ['replaced', 'replaced']
+    assert [track['track_name'] for track in project['tracks']] == ['Lead', 'Lead - Lower Harmony', 'Lead - 3rd Below', 'Lead - 5th Above']
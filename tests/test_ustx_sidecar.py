@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+from test_ustx_writer import export_sidecar, harmonize, make_project, write_source
+from ustx_project import load_ustx_project
+from ustx_sidecar import HEADER, load_sidecar, sidecar_path_for
+from ustx_writer import save_ustx_project
+
+def note_columns(project):
+    return [
+        (list(part.note_array.position), list(part.note_array.duration), list(part.note_array.tone), [part.note_array.lyric(i) for i in range(len(part.note_array))])
+        for part in project.parts
+    ]
+
+def shifted_project(semitones):
+    data = make_project()
+    for note in data['voice_parts'][0]['notes']:
+        note['tone'] += semitones
+    return data
+
+@pytest.fixture
+def source_path(tmp_path):
+    path = write_source(tmp_path / 'song.ustx', 'default')
+    export_sidecar(path)
+    return path
+
+
+def test_sidecar_matches_yaml(source_path):
+    yaml_project, _ = load_ustx_project(str(source_path), use_sidecar=False)
+    project, error = load_sidecar(str(source_path))
+
+    assert error is False
+    assert note_columns(project) == note_columns(yaml_project)
+    assert project['tracks'] == yaml_project['tracks']
+    assert dict(project.parts[0]) == dict(yaml_project.parts[0])
+
+def test_changed_source_falls_back_to_yaml(source_path):
+    # Transposing by an octave adds a character per tone, so the size changes too.
+    write_source(source_path, 'default', shifted_project(40))
+
+    _, error = load_sidecar(str(source_path))
+    project, _ = load_ustx_project(str(source_path))
+
+    assert error == "Sidecar is out of date"
+    assert not project.from_sidecar
+    assert list(project.parts[0].note_array.tone) == [100, 104, 107]
+
+def test_touched_source_falls_back_to_yaml(source_path):
+    # Same size, newer mtime: the sidecar cannot tell the content is unchanged, so it is not used.
+    write_source(source_path, 'default', shifted_project(1))
+    stat = os.stat(source_path)
+    os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    project, _ = load_ustx_project(str(source_path))
+
+    assert not project.from_sidecar
+    assert list(project.parts[0].note_array.tone) == [61, 65, 68]
+
+@pytest.mark.parametrize('damage', ['truncated', 'magic', 'metadata', 'columns'])
+def test_corrupt_sidecar_falls_back_to_yaml(source_path, damage):
+    sidecar_path = sidecar_path_for(str(source_path))
+    with open(sidecar_path, 'rb') as f:
+        data = bytearray(f.read())
+    if damage == 'truncated':
+        data = data[:HEADER.size - 1]
+    elif damage == 'magic':
+        data[:8] = b'NOTUSTX!'
+    elif damage == 'metadata':
+        data[-20:] = b'\xff' * 20
+    else:
+        # Well-formed metadata whose tone column points past the column data.
+        header = list(HEADER.unpack(data[:HEADER.size]))
+        meta_offset, meta_length = header[4:]
+        meta = json.loads(data[meta_offset:meta_offset + meta_length])
+        meta['columns']['tone'][0] = meta_offset
+        meta_bytes = json.dumps(meta).encode('utf-8')
+        header[5] = len(meta_bytes)
+        data = HEADER.pack(*header) + data[HEADER.size:meta_offset] + meta_bytes
+    with open(sidecar_path, 'wb') as f:
+        f.write(data)
+
+    sidecar_project, error = load_sidecar(str(source_path))
+    project, _ = load_ustx_project(str(source_path))
+
+    assert sidecar_project is None and error
+    assert not project.from_sidecar
+    assert list(project.parts[0].note_array.tone) == [60, 64, 67]
+
+def test_source_changed_after_sidecar_load(source_path, tmp_path):
+    # The writer needs the source text; if it no longer matches the sidecar, saving fails instead of splicing into it.
+    project = harmonize(source_path, sidecar=True)
+    write_source(source_path, 'default', shifted_project(40))
+
+    stats, error = save_ustx_project(project, str(tmp_path / 'out.ustx'))
+
+    assert stats is None
+    assert "changed after its sidecar was loaded" in error
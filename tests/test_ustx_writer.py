@@ -0,0 +1,172 @@
+import difflib
+import os
+
+import pytest
+import yaml
+
+import ustx_writer
+from ustx_harms import add_harmony_tracks_to_ustx, get_track_names
+from ustx_project import UstxDumper, load_ustx_project
+from ustx_sidecar import save_sidecar
+from ustx_writer import save_ustx_project
+
+LOWER_HARMONY = 1
+
+def make_project(notes_last=False):
+    # notes_last leaves the last part's notes as the end of the document, with no keys or parts after them.
+    notes = [
+        {'position': 0, 'duration': 480, 'tone': 60, 'lyric': 'a'},
+        {'position': 480, 'duration': 480, 'tone': 64, 'lyric': 'b'},
+        {'position': 1440, 'duration': 480, 'tone': 67, 'lyric': 'c'},
+    ]
+    part = {'name': 'verse', 'comment': '', 'track_no': 0, 'position': 1920, 'duration': 1920, 'notes': notes}
+    if not notes_last:
+        part['curves'] = [{'xs': [0, 480], 'ys': [10, -10], 'abbr': 'dyn'}]
+    project = {
+        'name': 'Test',
+        'resolution': 480,
+        'bpm': 120,
+        'beat_per_bar': 4,
+        'beat_unit': 4,
+        'time_signatures': [{'bar_position': 0, 'beat_per_bar': 4, 'beat_unit': 4}],
+        'tempos': [{'position': 0, 'bpm': 120}],
+        'tracks': [{'track_name': 'Lead', 'mute': False}],
+        'voice_parts': [part],
+    }
+    if not notes_last:
+        project['wave_parts'] = []
+    return project
+
+def dump(data, **kwargs):
+    return yaml.dump(data, Dumper=UstxDumper, allow_unicode=True, sort_keys=False, **kwargs)
+
+def add_comments(text):
+    lines = text.splitlines(keepends=True)
+    commented = ['# generated for tests\n']
+    for line in lines:
+        if line.lstrip().startswith('- position:'):
+            commented.append(line[:len(line) - len(line.lstrip())] + '# next note\n')
+        if line.lstrip().startswith('tone:'):
+            line = line.rstrip('\n') + '  # source tone\n'
+        commented.append(line)
+    commented.append('# end of project\n')
+    return ''.join(commented)
+
+# Source text for each input style the writer has to splice into.
+STYLES = {
+    'default': lambda data: dump(data),
+    'crlf': lambda data: dump(data, line_break='\r\n'),
+    'indent4': lambda data: dump(data, indent=4),
+    'flow_leaves': lambda data: dump(data, default_flow_style=None),
+    'flow': lambda data: dump(data, default_flow_style=True),
+    'comments': lambda data: add_comments(dump(data)),
+    'no_eol': lambda data: dump(data).rstrip('\n'),
+    'no_eol_crlf': lambda data: dump(data, line_break='\r\n').rstrip('\r\n'),
+}
+
+def write_source(path, style, data=None):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(STYLES[style](data or make_project()))
+    return path
+
+def export_sidecar(path):
+    project, error = load_ustx_project(str(path), use_sidecar=False)
+    assert not error
+    _, error = save_sidecar(project)
+    assert error is None
+
+def harmonize(path, sidecar=False, split_rest_ticks=None):
+    # With sidecar the project is first exported to its sidecar and then read back from it.
+    if sidecar:
+        export_sidecar(path)
+    project, error = load_ustx_project(str(path))
+    assert not error
+    assert project.from_sidecar == sidecar
+    add_harmony_tracks_to_ustx(project, [0], LOWER_HARMONY, get_track_names(project), 4, 0, 'major', split_rest_ticks=split_rest_ticks)
+    return project
+
+def check_save(project, output_path):
+    # The written file must read back as the same data a full dump of the project gives.
+    stats, error = save_ustx_project(project, str(output_path))
+    assert error is None
+    with open(output_path, encoding='utf-8', newline='') as f:
+        text = f.read()
+    assert yaml.safe_load(text) == yaml.safe_load(dump(project))
+    return stats, text
+
+@pytest.fixture(params=[False, True], ids=['yaml', 'sidecar'])
+def sidecar(request):
+    return request.param
+
+
+def test_part_notes_ending_the_file_without_newline(tmp_path, sidecar):
+    source_path = tmp_path / 'song.ustx'
+    source_path.write_text(dump(make_project(notes_last=True)).rstrip('\n'), encoding='utf-8')
+    project = harmonize(source_path, sidecar)
+
+    stats, text = check_save(project, tmp_path / 'out.ustx')
+
+    assert stats['mode'] == 'incremental'
+    assert "lyric: c\n  curves: []\n" in text
+
+
+@pytest.mark.parametrize('style', STYLES)
+def test_save_appended_harmony(tmp_path, style, sidecar):
+    project = harmonize(write_source(tmp_path / 'song.ustx', style), sidecar)
+
+    stats, text = check_save(project, tmp_path / 'out.ustx')
+
+    assert len(yaml.safe_load(text)['voice_parts']) == 2
+    if style.endswith('crlf') and stats['mode'] == 'incremental':
+        assert '\n' not in text.replace('\r\n', '')
+
+@pytest.mark.parametrize('style', STYLES)
+def test_save_split_harmony_parts(tmp_path, style, sidecar):
+    # Parts cut at the rest start later than their source part, so note positions are rewritten too.
+    project = harmonize(write_source(tmp_path / 'song.ustx', style), sidecar, split_rest_ticks=480)
+
+    _, text = check_save(project, tmp_path / 'out.ustx')
+
+    harmony_parts = yaml.safe_load(text)['voice_parts'][1:]
+    assert [[note['position'] for note in part['notes']] for part in harmony_parts] == [[0, 480], [240]]
+
+@pytest.mark.parametrize('style', STYLES)
+def test_save_regenerated_harmony_in_place(tmp_path, style, sidecar):
+    first_path = tmp_path / 'first.ustx'
+    check_save(harmonize(write_source(tmp_path / 'song.ustx', style), sidecar), first_path)
+    project = harmonize(first_path, sidecar)
+    project['tracks'][0]['mute'] = True
+
+    _, text = check_save(project, tmp_path / 'out.ustx')
+
+    data = yaml.safe_load(text)
+    assert len(data['tracks']) == 2 and len(data['voice_parts']) == 2
+    assert data['tracks'][0]['mute'] is True
+
+def test_unchanged_text_is_kept(tmp_path, sidecar):
+    source_path = write_source(tmp_path / 'song.ustx', 'comments')
+    source_text = source_path.read_text(encoding='utf-8')
+    project = harmonize(source_path, sidecar)
+
+    stats, text = check_save(project, tmp_path / 'out.ustx')
+
+    assert stats['mode'] == 'incremental'
+    # Only insertions: every source line, comments included, is still there unchanged.
+    diff = difflib.ndiff(source_text.splitlines(keepends=True), text.splitlines(keepends=True))
+    assert not [line for line in diff if line.startswith(('- ', '? '))]
+
+def test_new_file_mode_follows_umask(tmp_path, monkeypatch):
+    monkeypatch.setattr(ustx_writer, 'NEW_FILE_MODE', 0o640)
+    output_path = tmp_path / 'out.ustx'
+
+    check_save(harmonize(write_source(tmp_path / 'song.ustx', 'default')), output_path)
+
+    assert output_path.stat().st_mode & 0o777 == 0o640
+
+def test_umask_is_read_without_changing_it():
+    umask = os.umask(0o027)
+    try:
+        assert ustx_writer.read_umask() == 0o027
+        assert os.umask(umask) == 0o027
+    finally:
+        os.umask(umask)
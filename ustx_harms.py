@@ -1,27 +1,43 @@
+import copy
+import itertools
+import json
+import logging
+
 import yaml
-from colorama import Fore, Style
 
-def colored_print(text, color=Fore.WHITE, style=Style.NORMAL):
-    print(style + color + text + Style.RESET_ALL)
+from instrumentation import get_logger, instrumented
+from ustx_project import Loader, UstxDumper
+
+logger = get_logger("ustx_harms")
+
+CHORD_HARMONY = 4
+PROVENANCE_KEY = 'ustx_harms'
+# Dynamics, breathiness and pitch deviation. Their values are relative to the note (percent or cents),
+# so they carry over to a harmony voice unchanged; only their timing is moved onto the harmony part.
+DEFAULT_CURVE_ABBRS = ('dyn', 'brec', 'pitd')
 
+class HarmonyJobCancelled(Exception):
+    pass
+
+@instrumented()
 def get_ustx_data(file_path):
     if not file_path.lower().endswith(".ustx"):
         file_path += ".ustx"
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f), False
+            return yaml.load(f, Loader=Loader), False
     except FileNotFoundError:
         return None, "FileNotFoundError"
     except yaml.YAMLError as e:
         return None, f"YAMLError: {e}"
-    return yaml.safe_load(f), False
 
+@instrumented()
 def save_ustx_data(ustx_data, output_file_path):
     if not output_file_path.lower().endswith(".ustx"):
         output_file_path += ".ustx"
     try:
         with open(output_file_path, 'w', encoding='utf-8') as f:
-            yaml.dump(ustx_data, f, allow_unicode=True, indent=2, sort_keys=False)
+            yaml.dump(ustx_data, f, Dumper=UstxDumper, allow_unicode=True, indent=2, sort_keys=False)
     except Exception as e:
         return f"Error saving file: {e}"
     return None
@@ -31,18 +47,66 @@ def get_track_names(ustx_data):
 
 key_names = ['C', 'C#/Db', 'D', 'D#/Eb', 'E', 'F', 'F#/Gb', 'G', 'G#/Ab', 'A', 'A#/Bb', 'B']
 
-def get_key_from_notes(notes):
-    note_counts = {}
+major_profile = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 3.78, 2.14, 4.04, 2.0, 3.5]
+minor_profile = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 2.53, 4.48, 2.42, 3.17, 2.35]
+
+def parse_key_name(name):
+    for key_tone_index, key_name in enumerate(key_names):
+        if name == key_name or name in key_name.split('/'):
+            return key_tone_index
+    return None
+
+interval_names = {1: "Unison", 2: "2nd", 3: "3rd", 4: "4th", 5: "5th", 6: "6th", 7: "7th", 8: "Octave"}
+
+def parse_chord_intervals(text):
+    # "-3, 5, -8" -> [-3, 5, -8]: signed diatonic interval numbers, negative below the melody. Each interval
+    # names its voice, so a repeated one is rejected rather than giving two voices the same track.
+    intervals = []
+    for item in str(text).replace(';', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            interval = int(item)
+        except ValueError:
+            return None
+        if abs(interval) < 2 or abs(interval) > 15 or interval in intervals:
+            return None
+        intervals.append(interval)
+    return intervals or None
+
+def interval_name(interval):
+    name = interval_names.get(abs(interval), f"{abs(interval)}th")
+    return f"{name} {'Above' if interval > 0 else 'Below'}"
+
+def resolve_track_selection(track_names, selection):
+    if selection == 'all':
+        return list(range(len(track_names)))
+    indices = []
+    for item in selection:
+        if isinstance(item, int) or str(item).isdigit():
+            index = int(item)
+        elif item in track_names:
+            index = track_names.index(item)
+        else:
+            return None
+        if not 0 <= index < len(track_names):
+            return None
+        if index not in indices:
+            indices.append(index)
+    return indices
+
+def get_key_from_notes(notes, verbose=True):
+    note_counts = [0] * 12
     for note in notes:
-        tone = note['tone'] % 12
-        note_counts[tone] = note_counts.get(tone, 0) + 1
+        note_counts[note['tone'] % 12] += 1
+    return get_key_from_histogram(note_counts, verbose)
 
-    if not note_counts:
+def get_key_from_histogram(note_counts, verbose=True):
+    note_counts = [int(count) for count in note_counts]
+    if not any(note_counts):
         return 0, key_names[0], "major"
 
-    major_profile = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 3.78, 2.14, 4.04, 2.0, 3.5]
-    minor_profile = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 2.53, 4.48, 2.42, 3.17, 2.35]
-
     best_key_index = 0
     best_mode = "major"
     max_score = -float('inf')
@@ -52,14 +116,14 @@ def get_key_from_notes(notes):
         major_score = 0
         for i in range(12):
             note_index = (key_tone_index + i) % 12
-            major_score += note_counts.get(note_index, 0) * major_profile[i]
+            major_score += note_counts[note_index] * major_profile[i]
 
         scores.append({'key': key_names[key_tone_index] + " Major", 'score': major_score})
 
         minor_score = 0
         for i in range(12):
             note_index = (key_tone_index + i) % 12
-            minor_score += note_counts.get(note_index, 0) * minor_profile[i]
+            minor_score += note_counts[note_index] * minor_profile[i]
         scores.append({'key': key_names[key_tone_index] + " Minor", 'score': minor_score})
 
     scores.sort(key=lambda x: x['score'], reverse=True)
@@ -68,9 +132,8 @@ def get_key_from_notes(notes):
     best_mode = scores[0]['key'].split(" ")[1].lower()
     max_score = scores[0]['score']
 
-    print(f"{Fore.CYAN}Key Detection Scores (Top 5):{Style.RESET_ALL}")
-    for i in range(min(5, len(scores))):
-        print(f"  {scores[i]['key']}: {scores[i]['score']:.2f}", Fore.WHITE if i > 0 else Fore.GREEN)
+    if verbose and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Key detection scores (top 5): %s", ", ".join(f"{score['key']}: {score['score']:.2f}" for score in scores[:5]))
 
     return best_key_index, key_names[best_key_index], best_mode
 
@@ -91,95 +154,194 @@ def is_note_in_key(note_tone, key_tone_index, mode):
     note_class = note_tone % 12
     return note_class in scale_intervals
 
-def generate_harmony_notes(original_notes_for_track, semitone_interval, harmony_type, key_tone_index, key_mode):
-    harmony_tracks_notes = []
-
-    if harmony_type in (1, 3):
-        lower_harmony_notes = []
-        for note in original_notes_for_track:
-            harmony_tone = note['tone'] - semitone_interval
-            original_tone = harmony_tone
-
-            correction_attempts = 0
-            while not is_note_in_key(harmony_tone, key_tone_index, key_mode) and correction_attempts < 3:
-                harmony_tone += 1
-                correction_attempts += 1
-
-            if not is_note_in_key(harmony_tone, key_tone_index, key_mode):
-                harmony_tone = original_tone
-
-            lower_harmony_notes.append({**note, 'tone': harmony_tone})
-        harmony_tracks_notes.append(lower_harmony_notes)
-
-    if harmony_type in (2, 3):
-        upper_harmony_notes = []
-        for note in original_notes_for_track:
-            harmony_tone = note['tone'] + semitone_interval
-            original_tone = harmony_tone
-
-            correction_attempts = 0
-            while not is_note_in_key(harmony_tone, key_tone_index, key_mode) and correction_attempts < 3:
-                harmony_tone -= 1
-                correction_attempts += 1
-
-            if not is_note_in_key(harmony_tone, key_tone_index, key_mode):
-                harmony_tone = original_tone
-
-            upper_harmony_notes.append({**note, 'tone': harmony_tone})
-        harmony_tracks_notes.append(upper_harmony_notes)
-
-    return harmony_tracks_notes
+def harmony_provenance(voice_part):
+    # Generated parts carry their settings as JSON in the part comment, so a later run can find and replace them.
+    comment = voice_part.get('comment')
+    if not isinstance(comment, str) or not comment.startswith('{'):
+        return None
+    try:
+        data = json.loads(comment)
+    except ValueError:
+        return None
+    provenance = data.get(PROVENANCE_KEY) if isinstance(data, dict) else None
+    return provenance if isinstance(provenance, dict) else None
+
+def find_harmony_tracks(ustx_data):
+    # {track_no: provenance} for every track that holds generated harmony parts.
+    harmony_tracks = {}
+    for voice_part in ustx_data.get('voice_parts', []):
+        provenance = harmony_provenance(voice_part)
+        if provenance is not None:
+            harmony_tracks.setdefault(int(voice_part.get('track_no', 0)), provenance)
+    return harmony_tracks
+
+def note_keys(positions):
+    # Position plus occurrence number among notes at that position, so stacked notes are matched one to one.
+    import numpy as np
+    positions = np.asarray(positions, dtype=np.int64)
+    order = np.argsort(positions, kind='stable')
+    sorted_positions = positions[order]
+    starts = np.flatnonzero(np.append(True, sorted_positions[1:] != sorted_positions[:-1]))
+    ranks = np.arange(len(positions)) - np.repeat(starts, np.diff(np.append(starts, len(positions))))
+    keys = np.empty(len(positions), dtype=np.int64)
+    keys[order] = (sorted_positions << 20) + ranks
+    return keys
+
+def note_diff(old_positions, old_tones, new_positions, new_tones):
+    # Notes are matched by position: a matched note with another tone is changed, the rest were added or removed.
+    import numpy as np
+    common, old_indices, new_indices = np.intersect1d(note_keys(old_positions), note_keys(new_positions), assume_unique=True, return_indices=True)
+    return {
+        'changed': int(np.count_nonzero(old_tones[old_indices] != new_tones[new_indices])),
+        'added': len(new_positions) - len(common),
+        'removed': len(old_positions) - len(common),
+    }
+
+def add_harmony_tracks_to_ustx(ustx_data, selected_track_indices, harmony_type, track_names, semitone_interval, key_tone_index, key_mode, project_index=None, key_timeline=None, progress=None, chord_intervals=None, carry_curves=None, tone_cache=None, changes=None, split_rest_ticks=None):
+    # carry_curves: None, or a dict with optional 'abbrs', 'interval' and 'tolerance' for harmony_curves.window_curves.
+    # Every source part gets its own harmony part at the same position; split_rest_ticks also cuts them at rests that long.
+    # Harmony tracks generated earlier for the same source track and voice are replaced in place, so running again
+    # on an output file updates it instead of stacking more tracks. changes, if given, receives one entry per voice.
+    from harmony_cache import harmony_cache_key
+    from harmony_curves import window_curves
+    from harmony_engine import ALGORITHM_VERSION, chord_tones, generate_harmony_tones
+    from harmony_part import HarmonyPart
+    from project_index import ProjectIndex
 
-def add_harmony_tracks_to_ustx(ustx_data, selected_track_indices, harmony_type, track_names, semitone_interval, key_tone_index, key_mode):
     new_tracks = []
     harmony_names = ["Lower Harmony", "Upper Harmony"]
+    if project_index is None:
+        project_index = ProjectIndex.from_project(ustx_data)
+    harmony_tracks = find_harmony_tracks(ustx_data)
+    existing_tracks = {(provenance.get('source_track_no'), provenance.get('voice')): track_no for track_no, provenance in harmony_tracks.items()}
 
     for track_index in selected_track_indices:
+        if track_index in harmony_tracks:
+            logger.info("Skipping track %d: it holds generated harmony parts", track_index)
+            continue
         original_track = ustx_data['tracks'][track_index]
         original_track_name = original_track['track_name']
-        original_notes_for_track = []
-        for voice_part in ustx_data.get('voice_parts', []):
-            if int(voice_part.get('track_no', 0)) == track_index:
-                original_notes_for_track.extend(voice_part.get('notes', []))
-
-        harmony_tracks_notes = generate_harmony_notes(original_notes_for_track, semitone_interval, harmony_type, key_tone_index, key_mode)
-
-        if harmony_type in (1, 3):
-            lower_harmony_notes = harmony_tracks_notes[0] if harmony_tracks_notes else []
-            new_track = original_track.copy()
-            new_track_name = f"{original_track_name} - {harmony_names[0]}"
-            new_track['track_name'] = new_track_name
-
-            new_voice_part = {
-                'duration': ustx_data['voice_parts'][0]['duration'] if ustx_data['voice_parts'] else 0,
-                'name': f"{new_track_name} Part",
-                'comment': "",
-                'track_no': len(ustx_data['tracks']) + len(new_tracks),
-                'position': 0,
-                'notes': lower_harmony_notes,
-                'curves': []
-            }
-            ustx_data['voice_parts'].append(new_voice_part)
-            new_tracks.append(new_track)
-
-
-        if harmony_type in (2, 3):
-            upper_harmony_notes = harmony_tracks_notes[1] if harmony_type == 3 and len(harmony_tracks_notes) > 1 else harmony_tracks_notes[0] if harmony_type == 2 and harmony_tracks_notes else []
-            new_track = original_track.copy()
-            new_track_name = f"{original_track_name} - {harmony_names[1]}"
-            new_track['track_name'] = new_track_name
-
-            new_voice_part = {
-                'duration': ustx_data['voice_parts'][0]['duration'] if ustx_data['voice_parts'] else 0,
-                'name': f"{new_track_name} Part",
-                'comment': "",
-                'track_no': len(ustx_data['tracks']) + len(new_tracks),
-                'position': 0,
-                'notes': upper_harmony_notes,
-                'curves': []
+        source_parts = list(project_index.parts(track_index))
+        segments = part_segments(source_parts, split_rest_ticks)
+        segment_curves = [[] for _ in segments]
+        if carry_curves is not None:
+            # Curves move with the notes: each harmony part gets the stretch of its source part's curves it covers.
+            # Segments of one source part are consecutive, and their windows are cut from one merge of its curves.
+            segment_curves = []
+            for _, part_segments_group in itertools.groupby(segments, key=lambda segment: id(segment[0])):
+                part_segments_group = list(part_segments_group)
+                windows = [(offset, duration) for _, _, _, _, offset, duration in part_segments_group]
+                segment_curves.extend(window_curves(part_segments_group[0][0], windows, **carry_curves))
+        source_track_tones = project_index.tones(track_index)
+
+        harmony_tracks_tones = None
+        if tone_cache is not None:
+            cache_key = harmony_cache_key(project_index.note_hash(track_index), harmony_type, semitone_interval, chord_intervals, key_tone_index, key_mode, key_timeline)
+            harmony_tracks_tones = tone_cache.get(cache_key)
+        if harmony_tracks_tones is None:
+            # With a key timeline every note is snapped to the key in force at its position.
+            key_ids = key_timeline.key_ids_at(project_index.positions(track_index)) if key_timeline is not None else None
+            if harmony_type == CHORD_HARMONY:
+                # Every chord voice comes from one pass, so voice leading can look at all of them together.
+                harmony_tracks_tones = chord_tones(project_index.tones(track_index), chord_intervals, key_tone_index, key_mode, key_ids)
+            else:
+                harmony_tracks_tones = generate_harmony_tones(project_index.tones(track_index), semitone_interval, harmony_type, key_tone_index, key_mode, key_ids)
+            if tone_cache is not None:
+                tone_cache.put(cache_key, harmony_tracks_tones)
+        if harmony_type == CHORD_HARMONY:
+            voice_names = [interval_name(interval) for interval in chord_intervals]
+        else:
+            voice_names = [name for name, enabled in zip(harmony_names, (harmony_type in (1, 3), harmony_type in (2, 3))) if enabled]
+
+        for harmony_name, harmony_tones in zip(voice_names, harmony_tracks_tones):
+            new_track_name = f"{original_track_name} - {harmony_name}"
+            provenance = {
+                'source_track_no': track_index,
+                'source_track': original_track_name,
+                'voice': harmony_name,
+                'harmony_type': harmony_type,
+                'semitone_interval': semitone_interval,
+                'chord_intervals': list(chord_intervals) if chord_intervals else None,
+                'key': f"{key_names[key_tone_index]} {key_mode}",
+                'key_changes': key_timeline is not None,
+                'algorithm': ALGORITHM_VERSION,
             }
-            ustx_data['voice_parts'].append(new_voice_part)
-            new_tracks.append(new_track)
+            harmony_track_no = existing_tracks.get((track_index, harmony_name))
+            if harmony_track_no is None and not segments:
+                logger.info("Skipping track %d: it has no notes to harmonize", track_index)
+                continue
+            if harmony_track_no is None:
+                harmony_track_no = len(ustx_data['tracks']) + len(new_tracks)
+                new_track = copy.deepcopy(original_track)
+                new_track['track_name'] = new_track_name
+                new_tracks.append(new_track)
+                old_positions = old_tones = None
+            else:
+                # Mixer and singer settings made on the harmony track are kept; only its name follows the source.
+                if ustx_data['tracks'][harmony_track_no].get('track_name') != new_track_name:
+                    ustx_data['tracks'][harmony_track_no] = {**ustx_data['tracks'][harmony_track_no], 'track_name': new_track_name}
+                old_positions, old_tones = project_index.track(harmony_track_no).columns()
+                project_index.remove_track(harmony_track_no)
+
+            comment = json.dumps({PROVENANCE_KEY: provenance}, ensure_ascii=False, sort_keys=True)
+            new_voice_parts = []
+            for (part, base, first, stop, offset, duration), curves in zip(segments, segment_curves):
+                new_voice_parts.append(HarmonyPart(
+                    [part], harmony_tones[base + first:base + stop], (first, stop), offset,
+                    original_tones=source_track_tones[base + first:base + stop],
+                    duration=duration,
+                    name=f"{new_track_name} Part",
+                    comment=comment,
+                    track_no=harmony_track_no,
+                    position=int(part.get('position', 0)) + offset,
+                    curves=[dict(curve) for curve in curves],
+                ))
+                # Reported per part, so a cancelled job stops between parts of a long track.
+                if progress:
+                    progress(stop - first)
+            replace_track_parts(ustx_data['voice_parts'], harmony_track_no, new_voice_parts)
+            for new_voice_part in new_voice_parts:
+                project_index.add_part(new_voice_part)
+            if changes is not None:
+                change = {'track_no': harmony_track_no, 'track': new_track_name, 'source_track': original_track_name, 'voice': harmony_name, 'parts': len(new_voice_parts)}
+                if old_positions is None:
+                    change.update(status='added', changed=0, added=len(harmony_tones), removed=0)
+                else:
+                    new_positions, new_tones = project_index.track(harmony_track_no).columns()
+                    change.update(status='replaced', **note_diff(old_positions, old_tones, new_positions, new_tones))
+                changes.append(change)
 
     ustx_data['tracks'].extend(new_tracks)
-    return ustx_data
\ No newline at end of file
+    return ustx_data
+
+def part_segments(source_parts, min_rest=None):
+    # (part, base, first, stop, offset, duration) per harmony part: notes first:stop of a source part whose
+    # notes start at index base of the track, placed offset ticks into it. Without min_rest every source
+    # part with notes is mirrored whole; with it, parts are also cut in the middle of rests that long.
+    from harmony_part import rest_splits
+    from project_index import part_columns
+
+    segments = []
+    base = 0
+    for voice_part in source_parts:
+        positions, durations, _ = part_columns(voice_part)
+        count = len(positions)
+        if count:
+            part_duration = max(int(voice_part.get('duration', 0)), int((positions + durations).max()))
+            splits, cuts = rest_splits(positions, durations, min_rest) if min_rest else ((), ())
+            firsts = [0, *(int(split) for split in splits)]
+            stops = firsts[1:] + [count]
+            bounds = [0, *(int(cut) for cut in cuts), part_duration]
+            for i, (first, stop) in enumerate(zip(firsts, stops)):
+                segments.append((voice_part, base, first, stop, bounds[i], bounds[i + 1] - bounds[i]))
+        base += count
+    return segments
+
+def replace_track_parts(voice_parts, track_no, new_parts):
+    # New parts take the list slots of the track's old parts, so unchanged parts keep their places in the file.
+    slots = [i for i, voice_part in enumerate(voice_parts) if int(voice_part.get('track_no', 0)) == track_no]
+    for slot, new_part in zip(slots, new_parts):
+        voice_parts[slot] = new_part
+    for slot in reversed(slots[len(new_parts):]):
+        del voice_parts[slot]
+    voice_parts.extend(new_parts[len(slots):])
\ No newline at end of file
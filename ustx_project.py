@@ -0,0 +1,321 @@
+import copy
+import os
+from array import array
+from collections.abc import MutableMapping
+
+import yaml
+from yaml.constructor import SafeConstructor
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+BaseDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+INT_TAG = 'tag:yaml.org,2002:int'
+# Per note: start and end of its lines, then start and end of its tone and of its position value.
+NOTE_SPAN_FIELDS = 6
+
+def construct_node(node):
+    if node is None:
+        return None
+    return SafeConstructor().construct_document(node)
+
+def scalar_int(node, default=0):
+    if node is None:
+        return default
+    if node.tag == INT_TAG:
+        try:
+            return int(node.value)
+        except ValueError:
+            pass
+    value = construct_node(node)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def mapping_nodes(node):
+    if not isinstance(node, MappingNode):
+        return {}
+    return {key_node.value: value_node for key_node, value_node in node.value}
+
+def sequence_items(node):
+    if not isinstance(node, SequenceNode):
+        return []
+    return node.value
+
+def item_span(text, item_node):
+    # The full lines of a block sequence item, from its "- " up to the line the next item starts on.
+    start = item_node.start_mark.index - item_node.start_mark.column
+    if text[start:item_node.start_mark.index].strip() != '-' or item_node.end_mark.column != 0:
+        return None
+    return start, item_node.end_mark.index
+
+def note_text_spans(text, note_nodes):
+    # (spans, column) locating every note in the source text, so harmony notes can be copied from it with
+    # new values swapped in; None unless all notes are block mappings at one column with plain int values.
+    spans = array('q')
+    column = None
+    for note_node in note_nodes:
+        if not isinstance(note_node, MappingNode) or note_node.flow_style:
+            return None
+        start_mark, end_mark = note_node.start_mark, note_node.end_mark
+        column = start_mark.column if column is None else column
+        line_start = start_mark.index - column
+        # A note ends where the next token's line starts, or at the end of the text, which may lack a final newline.
+        end = end_mark.index - end_mark.column
+        if start_mark.column != column or column < 2 or text[line_start:start_mark.index] != ' ' * (column - 2) + '- ' or text[end:end_mark.index].strip():
+            return None
+        spans.extend((line_start, end))
+        fields = mapping_nodes(note_node)
+        for key in ('tone', 'position'):
+            value_node = fields.get(key)
+            if not isinstance(value_node, ScalarNode) or value_node.tag != INT_TAG or value_node.style:
+                return None
+            spans.extend((value_node.start_mark.index, value_node.end_mark.index))
+    return spans, column
+
+
+class LazyMapping(MutableMapping):
+    # A YAML mapping whose values are only constructed when they are first read.
+
+    def __init__(self, node):
+        self._nodes = mapping_nodes(node)
+        self._values = {}
+
+    def _construct(self, key, node):
+        return construct_node(node)
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        value = self._construct(key, self._nodes[key])
+        self._values[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self._nodes:
+            self._nodes[key] = None
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        del self._nodes[key]
+        self._values.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self._nodes)})"
+
+    def node(self, key):
+        return self._nodes.get(key)
+
+    def is_loaded(self, key):
+        return key in self._values
+
+
+class PartNotes:
+    # Columnar view of a voice part's notes: one int32 array per field, lyrics interned.
+    __slots__ = ('position', 'duration', 'tone', 'lyric_index', 'lyrics')
+
+    def __init__(self):
+        self.position = array('i')
+        self.duration = array('i')
+        self.tone = array('i')
+        self.lyric_index = array('i')
+        self.lyrics = []
+
+    @classmethod
+    def from_columns(cls, position, duration, tone, lyric_index, lyrics):
+        # Columns may be any int32 buffers, e.g. memoryviews into a mapped sidecar.
+        part_notes = cls.__new__(cls)
+        part_notes.position = position
+        part_notes.duration = duration
+        part_notes.tone = tone
+        part_notes.lyric_index = lyric_index
+        part_notes.lyrics = lyrics
+        return part_notes
+
+    @classmethod
+    def from_nodes(cls, note_nodes):
+        part_notes = cls()
+        position_append = part_notes.position.append
+        duration_append = part_notes.duration.append
+        tone_append = part_notes.tone.append
+        lyric_append = part_notes.lyric_index.append
+        lyric_lookup = {}
+
+        for note_node in note_nodes:
+            fields = mapping_nodes(note_node)
+            position_append(scalar_int(fields.get('position')))
+            duration_append(scalar_int(fields.get('duration')))
+            tone_append(scalar_int(fields.get('tone')))
+
+            lyric_node = fields.get('lyric')
+            lyric = lyric_node.value if lyric_node is not None and lyric_node.tag.endswith(':str') else construct_node(lyric_node)
+            lyric = "" if lyric is None else str(lyric)
+            lyric_index = lyric_lookup.get(lyric)
+            if lyric_index is None:
+                lyric_index = lyric_lookup[lyric] = len(part_notes.lyrics)
+                part_notes.lyrics.append(lyric)
+            lyric_append(lyric_index)
+
+        return part_notes
+
+    def __len__(self):
+        return len(self.tone)
+
+    def lyric(self, i):
+        return self.lyrics[self.lyric_index[i]]
+
+    @property
+    def nbytes(self):
+        arrays = (self.position, self.duration, self.tone, self.lyric_index)
+        return sum(len(a) * a.itemsize for a in arrays) + sum(len(lyric) for lyric in self.lyrics)
+
+
+class VoicePart(LazyMapping):
+
+    def __init__(self, node, text=None):
+        super().__init__(node)
+        self.node_ref = node
+        self.text = text
+        self.note_array = PartNotes.from_nodes(sequence_items(self._nodes.get('notes')))
+        self._note_spans = None
+
+    def note_nodes(self):
+        return sequence_items(self._nodes.get('notes'))
+
+    def note_spans(self):
+        # (text, spans, column) for copying this part's notes as text (see note_text_spans), or None.
+        if self._note_spans is None:
+            spans = note_text_spans(self.text, self.note_nodes()) if self.text is not None else None
+            self._note_spans = (self.text, *spans) if spans is not None else False
+        return self._note_spans or None
+
+    @property
+    def track_no(self):
+        if self.is_loaded('track_no'):
+            return int(self['track_no'])
+        return scalar_int(self._nodes.get('track_no'))
+
+
+class UstxProject(LazyMapping):
+    from_sidecar = False
+
+    def __init__(self, node, text=None, path=None, source_signature=None):
+        super().__init__(node)
+        self.node_ref = node
+        self.text = text
+        self.path = path
+        # (mtime_ns, size) of the file the text was read from.
+        self.source_signature = source_signature
+        self.parts = [VoicePart(part_node, text) for part_node in sequence_items(self._nodes.get('voice_parts'))]
+        self._shared = set()
+        if 'voice_parts' in self._nodes:
+            self._values['voice_parts'] = list(self.parts)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if key in self._shared:
+            # First access through a view: give it its own top-level container so appends stay private.
+            self._shared.discard(key)
+            if isinstance(value, list):
+                value = list(value)
+            elif isinstance(value, dict):
+                value = dict(value)
+            self._values[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        super().__setitem__(key, value)
+
+    def view(self):
+        # A copy-on-write view: nodes, parsed parts and constructed values are shared with this project, while
+        # top-level lists and dicts are copied on first access. Items inside them are shared and must not be mutated.
+        view = copy.copy(self)
+        view._nodes = dict(self._nodes)
+        view._values = dict(self._values)
+        view._shared = set(view._values)
+        return view
+
+    def source_keys(self):
+        return [key_node.value for key_node, _ in self.node_ref.value]
+
+    def sequence_layout(self, key):
+        # Where a top-level sequence sits in the source text: {key_column, start, end, flow, item_column, items},
+        # items holding each item's span (see item_span). None when the key is missing or not a sequence, or when
+        # the document is a flow mapping, where no sequence can be rewritten in block style.
+        if self.node_ref.flow_style:
+            return None
+        for key_node, value_node in self.node_ref.value:
+            if key_node.value == key:
+                break
+        else:
+            return None
+        if not isinstance(value_node, SequenceNode):
+            return None
+        items = sequence_items(value_node)
+        return {
+            'key_column': key_node.start_mark.column,
+            'start': value_node.start_mark.index,
+            'end': value_node.end_mark.index,
+            'flow': bool(value_node.flow_style),
+            'item_column': items[0].start_mark.column if items else None,
+            'items': [item_span(self.text, item_node) for item_node in items],
+        }
+
+    def original_items(self, key):
+        # The sequence as it was read, for telling changed items apart. Parsed parts are returned as they are.
+        if key == 'voice_parts':
+            return self.parts
+        return construct_node(self.node(key)) or []
+
+    @property
+    def note_count(self):
+        return sum(len(part.note_array) for part in self.parts)
+
+    @property
+    def estimated_size(self):
+        # Composed YAML nodes take roughly ten times the size of the source text.
+        text_size = len(self.text) if self.text else 0
+        return text_size * 10 + sum(part.note_array.nbytes for part in self.parts)
+
+
+class UstxDumper(BaseDumper):
+
+    def ignore_aliases(self, data):
+        return True
+
+def represent_lazy_mapping(dumper, mapping):
+    return dumper.represent_dict(mapping.items())
+
+UstxDumper.add_multi_representer(LazyMapping, represent_lazy_mapping)
+
+def load_ustx_project(file_path, use_sidecar=True):
+    # A sidecar written from the file's current version is mapped instead of parsing the YAML (see ustx_sidecar).
+    if not file_path.lower().endswith(".ustx"):
+        file_path += ".ustx"
+    if use_sidecar:
+        from ustx_sidecar import load_sidecar
+        project, error = load_sidecar(file_path)
+        if not error:
+            return project, False
+    try:
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:
+            stat = os.fstat(f.fileno())
+            text = f.read()
+        root = yaml.compose(text, Loader=Loader)
+    except FileNotFoundError:
+        return None, "FileNotFoundError"
+    except yaml.YAMLError as e:
+        return None, f"YAMLError: {e}"
+    if not isinstance(root, MappingNode):
+        return None, "YAMLError: document is not a USTx project mapping"
+    return UstxProject(root, text=text, path=file_path, source_signature=(stat.st_mtime_ns, stat.st_size)), False
@@ -0,0 +1,351 @@
+import copy
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+import yaml
+from yaml.nodes import MappingNode
+
+from instrumentation import get_logger
+from ustx_project import NOTE_SPAN_FIELDS, Loader, PartNotes, UstxProject, VoicePart, construct_node, mapping_nodes, sequence_items
+
+logger = get_logger("ustx_sidecar")
+
+SIDECAR_SUFFIX = '.harmony-notes.bin'
+MAGIC = b'USTXNOTE'
+SIDECAR_VERSION = 1
+# magic, version, source mtime_ns, source size, metadata offset, metadata length
+HEADER = struct.Struct('<8sqqqqq')
+# Columns in file order. Note columns run over all voice parts in project order; lyric_index points into
+# the project's lyric table, whose UTF-8 strings end at lyric_offsets.
+COLUMNS = (
+    ('position', 'i'),
+    ('duration', 'i'),
+    ('tone', 'i'),
+    ('lyric_index', 'i'),
+    ('note_spans', 'q'),
+    ('lyric_offsets', 'q'),
+    ('key_starts', 'q'),
+    ('key_ids', 'q'),
+    ('lyric_data', 'B'),
+)
+# Top-level values the pipeline reads; everything else is taken from the YAML document when asked for.
+STORED_KEYS = ('name', 'resolution', 'bpm', 'beat_per_bar', 'beat_unit', 'time_signatures', 'tempos', 'tracks')
+PART_FIELDS = ('name', 'comment', 'track_no', 'position', 'duration')
+SEQUENCE_KEYS = ('tracks', 'voice_parts')
+# Key timelines are stored as detect_track_key_timeline finds them with its default settings.
+KEY_TIMELINE_SETTINGS = (16, 4)
+
+class StaleSidecarError(Exception):
+    pass
+
+
+def sidecar_path_for(ustx_file_path):
+    return os.path.splitext(os.path.abspath(ustx_file_path))[0] + SIDECAR_SUFFIX
+
+def key_timeline_columns(project):
+    from key_tracker import detect_track_key_timeline
+    from project_index import ProjectIndex
+
+    project_index = ProjectIndex(project.parts)
+    timelines = {}
+    starts = array('q')
+    key_ids = array('q')
+    for track_no, track in sorted(project_index.tracks.items()):
+        if not track.note_count:
+            continue
+        timeline = detect_track_key_timeline(project, project_index, track_no, *KEY_TIMELINE_SETTINGS)
+        timelines[str(track_no)] = [len(starts), len(timeline)]
+        starts.extend(timeline.starts.tolist())
+        key_ids.extend(timeline.key_ids.tolist())
+    return timelines, starts, key_ids
+
+def save_sidecar(project, sidecar_path=None):
+    # Writes the note slice of a project parsed from its .ustx: part fields, note columns, lyric table, the text
+    # layout the incremental writer needs and per-track key timelines. Returns (stats, error).
+    from ustx_writer import write_atomic
+
+    if project.from_sidecar or project.text is None or project.source_signature is None:
+        return None, "Only a project read from its .ustx file can be exported to a sidecar"
+    sidecar_path = sidecar_path or sidecar_path_for(project.path)
+    columns = {name: array(typecode) for name, typecode in COLUMNS}
+    lyric_ids = {}
+    voice_parts_layout = project.sequence_layout('voice_parts')
+    parts = []
+    for part_index, part in enumerate(project.parts):
+        note_array = part.note_array
+        global_ids = []
+        for lyric in note_array.lyrics:
+            if lyric not in lyric_ids:
+                lyric_ids[lyric] = len(lyric_ids)
+                columns['lyric_data'].frombytes(lyric.encode('utf-8'))
+                columns['lyric_offsets'].append(len(columns['lyric_data']))
+            global_ids.append(lyric_ids[lyric])
+        for name in ('position', 'duration', 'tone'):
+            columns[name].extend(getattr(note_array, name))
+        columns['lyric_index'].extend(global_ids[i] for i in note_array.lyric_index)
+        note_spans = part.note_spans()
+        if note_spans is None:
+            columns['note_spans'].extend([-1] * (NOTE_SPAN_FIELDS * len(note_array)))
+        else:
+            columns['note_spans'].extend(note_spans[1])
+        parts.append({
+            'keys': list(part),
+            'fields': {key: part[key] for key in PART_FIELDS if key in part},
+            'notes': len(note_array),
+            'column': note_spans[2] if note_spans is not None else None,
+            'span': voice_parts_layout['items'][part_index] if voice_parts_layout else None,
+        })
+    columns['lyric_offsets'].insert(0, 0)
+    key_timelines, columns['key_starts'], columns['key_ids'] = key_timeline_columns(project)
+
+    offsets = {}
+    offset = HEADER.size
+    for name, _ in COLUMNS:
+        offset += -offset % 8
+        offsets[name] = [offset, len(columns[name])]
+        offset += len(columns[name]) * columns[name].itemsize
+    meta = {
+        'keys': project.source_keys(),
+        'values': {key: construct_node(project.node(key)) for key in STORED_KEYS if project.node(key) is not None},
+        'layouts': {key: project.sequence_layout(key) for key in SEQUENCE_KEYS},
+        'parts': parts,
+        'text_length': len(project.text),
+        'key_timeline_settings': list(KEY_TIMELINE_SETTINGS),
+        'key_timelines': key_timelines,
+        'columns': offsets,
+    }
+    try:
+        meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    except (TypeError, ValueError) as e:
+        return None, f"Project settings cannot be stored in a sidecar: {e}"
+
+    def write_chunks(f):
+        f.write(HEADER.pack(MAGIC, SIDECAR_VERSION, *project.source_signature, offset, len(meta_bytes)))
+        for name, _ in COLUMNS:
+            f.write(b'\0' * (offsets[name][0] - f.tell()))
+            columns[name].tofile(f)
+        f.write(meta_bytes)
+        return f.tell()
+
+    try:
+        bytes_written = write_atomic(sidecar_path, write_chunks)
+    except OSError as e:
+        return None, f"Error saving sidecar: {e}"
+    return {'path': sidecar_path, 'bytes_written': bytes_written, 'notes': len(columns['tone'])}, None
+
+def load_sidecar(ustx_file_path):
+    # (project, error): the project mapped from its sidecar, which is only used when it was written from the
+    # file's current version (same mtime and size). Note columns are memoryviews into the mapping, not copies.
+    if not ustx_file_path.lower().endswith(".ustx"):
+        ustx_file_path += ".ustx"
+    sidecar_path = sidecar_path_for(ustx_file_path)
+    try:
+        stat = os.stat(ustx_file_path)
+        with open(sidecar_path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return None, "Sidecar is truncated"
+            magic, version, mtime_ns, size, meta_offset, meta_length = HEADER.unpack(header)
+            if magic != MAGIC or version != SIDECAR_VERSION:
+                return None, "Unsupported sidecar format"
+            if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size):
+                return None, "Sidecar is out of date"
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None, "FileNotFoundError"
+    except (OSError, ValueError) as e:
+        return None, f"Error reading sidecar: {e}"
+    try:
+        meta = json.loads(data[meta_offset:meta_offset + meta_length].decode('utf-8'))
+    except ValueError as e:
+        data.close()
+        return None, f"Corrupt sidecar: {e}"
+    try:
+        project = SidecarProject(SidecarSource(os.path.abspath(ustx_file_path), data, meta, (mtime_ns, size), meta_offset))
+    except (KeyError, TypeError, ValueError) as e:
+        error = f"Corrupt sidecar: {e}"
+    else:
+        logger.debug("Loaded %s from its sidecar", ustx_file_path)
+        return project, False
+    # Views made before the failure are freed with the exception, so the mapping can be closed here.
+    data.close()
+    return None, error
+
+
+class SidecarSource:
+    # The mapped sidecar of one project, plus its source text and YAML document once something needs them.
+
+    def __init__(self, path, data, meta, signature, columns_end):
+        # Columns must lie between the header and columns_end, where the metadata starts.
+        self.path = path
+        self.meta = meta
+        self.signature = signature
+        self.size = len(data)
+        view = memoryview(data)
+        self.columns = {}
+        for name, typecode in COLUMNS:
+            offset, count = meta['columns'][name]
+            itemsize = array(typecode).itemsize
+            if offset < HEADER.size or offset % itemsize or count < 0 or offset + count * itemsize > min(columns_end, self.size):
+                raise ValueError(f"column {name} lies outside the column data")
+            self.columns[name] = view[offset:offset + count * itemsize].cast(typecode)
+        note_count = sum(part['notes'] for part in meta['parts'])
+        note_columns = [self.columns[name] for name in ('position', 'duration', 'tone', 'lyric_index')]
+        if any(len(column) != note_count for column in note_columns) or len(self.columns['note_spans']) != NOTE_SPAN_FIELDS * note_count:
+            raise ValueError("column lengths do not match the part note counts")
+        self._text = None
+        self._document = None
+        self._lock = threading.Lock()
+
+    def text(self):
+        with self._lock:
+            if self._text is None:
+                with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                    stat = os.fstat(f.fileno())
+                    text = f.read()
+                if (stat.st_mtime_ns, stat.st_size) != self.signature or len(text) != self.meta['text_length']:
+                    raise StaleSidecarError(f"{self.path} changed after its sidecar was loaded")
+                self._text = text
+            return self._text
+
+    def document(self):
+        text = self.text()
+        with self._lock:
+            if self._document is None:
+                root = yaml.compose(text, Loader=Loader)
+                if not isinstance(root, MappingNode):
+                    raise StaleSidecarError(f"{self.path} is no longer a USTx project mapping")
+                self._document = root
+            return self._document
+
+    def part_node(self, index, span):
+        # A voice part's own lines are a YAML document by themselves, so only that part is parsed.
+        if span is not None:
+            text = self.text()
+            return sequence_items(yaml.compose(text[span[0]:span[1]], Loader=Loader))[0]
+        return sequence_items(mapping_nodes(self.document()).get('voice_parts'))[index]
+
+    def lyrics(self):
+        data = self.columns['lyric_data']
+        offsets = self.columns['lyric_offsets']
+        return [str(data[start:end], 'utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class SidecarPart(VoicePart):
+    # A voice part whose fields and note columns come from the sidecar. Anything else, such as its curves
+    # or the note mappings themselves, is read from its own lines of the source text when first needed.
+
+    def __init__(self, source, index, meta, note_array, note_spans):
+        self._nodes = dict.fromkeys(meta['keys'])
+        self._values = dict(meta['fields'])
+        self.source = source
+        self.index = index
+        self.span = meta['span']
+        self.column = meta['column']
+        self.note_array = note_array
+        self._note_spans = note_spans
+        self._node = None
+
+    @property
+    def node_ref(self):
+        if self._node is None:
+            self._node = self.source.part_node(self.index, self.span)
+        return self._node
+
+    @property
+    def text(self):
+        return self.source.text()
+
+    def _construct(self, key, node):
+        return construct_node(mapping_nodes(self.node_ref).get(key))
+
+    def node(self, key):
+        return mapping_nodes(self.node_ref).get(key) if key in self._nodes else None
+
+    def note_nodes(self):
+        return sequence_items(mapping_nodes(self.node_ref).get('notes'))
+
+    def note_spans(self):
+        if self.column is None:
+            return None
+        return self.source.text(), self._note_spans, self.column
+
+
+class SidecarProject(UstxProject):
+    # A project mapped from its sidecar. Track settings, part fields and note columns come from the sidecar,
+    # and the incremental writer works from the stored text layout; the YAML document is only composed
+    # when a value outside that slice is read.
+    from_sidecar = True
+
+    def __init__(self, source):
+        meta = source.meta
+        self.source = source
+        self.path = source.path
+        self.source_signature = source.signature
+        self._nodes = dict.fromkeys(meta['keys'])
+        self._values = {}
+        self._shared = set()
+        columns = source.columns
+        lyrics = source.lyrics()
+        self.parts = []
+        start = 0
+        for index, part_meta in enumerate(meta['parts']):
+            stop = start + part_meta['notes']
+            note_array = PartNotes.from_columns(
+                columns['position'][start:stop], columns['duration'][start:stop], columns['tone'][start:stop],
+                columns['lyric_index'][start:stop], lyrics,
+            )
+            note_spans = columns['note_spans'][start * NOTE_SPAN_FIELDS:stop * NOTE_SPAN_FIELDS]
+            self.parts.append(SidecarPart(source, index, part_meta, note_array, note_spans))
+            start = stop
+        if 'voice_parts' in self._nodes:
+            self._values['voice_parts'] = list(self.parts)
+
+    @property
+    def text(self):
+        return self.source.text()
+
+    @property
+    def node_ref(self):
+        return self.source.document()
+
+    def _construct(self, key, node):
+        values = self.source.meta['values']
+        if key in values:
+            # A copy, so changes made through one view never reach the stored originals.
+            return copy.deepcopy(values[key])
+        return construct_node(mapping_nodes(self.node_ref).get(key))
+
+    def node(self, key):
+        return mapping_nodes(self.node_ref).get(key) if key in self._nodes else None
+
+    def source_keys(self):
+        return list(self.source.meta['keys'])
+
+    def sequence_layout(self, key):
+        layout = self.source.meta['layouts'].get(key)
+        return None if layout is None else {**layout, 'items': [tuple(span) if span else None for span in layout['items']]}
+
+    def original_items(self, key):
+        if key == 'voice_parts':
+            return self.parts
+        values = self.source.meta['values']
+        return values[key] if key in values else super().original_items(key)
+
+    def stored_key_timeline(self, track_no, window_bars, min_segment_bars):
+        # (starts, key ids) detected when the sidecar was written, if it used these settings.
+        meta = self.source.meta
+        entry = meta['key_timelines'].get(str(track_no))
+        if entry is None or [window_bars, min_segment_bars] != meta['key_timeline_settings']:
+            return None
+        offset, count = entry
+        return self.source.columns['key_starts'][offset:offset + count], self.source.columns['key_ids'][offset:offset + count]
+
+    @property
+    def estimated_size(self):
+        # The columns live in the page cache, shared with every other process mapping the sidecar.
+        return self.source.size
@@ -0,0 +1,210 @@
+import os
+import shutil
+import tempfile
+import time
+
+import yaml
+
+from ustx_harms import HarmonyJobCancelled
+from ustx_project import LazyMapping, UstxDumper, UstxProject
+
+APPENDABLE_KEYS = ('tracks', 'voice_parts')
+# Unchanged text is encoded and written this many characters at a time.
+WRITE_BLOCK_CHARS = 1 << 20
+
+def read_umask():
+    # os.umask can only be read by setting it, so the old value is put straight back.
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+# New files get the mode a plain open() would have given them; mkstemp creates them 0o600.
+NEW_FILE_MODE = 0o666 & ~read_umask()
+
+def detect_line_break(text):
+    first_break = text.find('\n')
+    if first_break > 0 and text[first_break - 1] == '\r':
+        return '\r\n'
+    return '\n'
+
+def indent_lines(text, indent):
+    if not indent:
+        return text
+    prefix = ' ' * indent
+    return ''.join(prefix + line if line.strip() else line for line in text.splitlines(keepends=True))
+
+def item_indent(text, spans):
+    # Column of the "- " that starts the first block item with a known span, or None.
+    for span in spans:
+        if span is not None:
+            line = text[span[0]:span[1]]
+            return len(line) - len(line.lstrip(' '))
+    return None
+
+def dump_yaml_item(item, line_break):
+    return yaml.dump([item], Dumper=UstxDumper, allow_unicode=True, indent=2, sort_keys=False, line_break=line_break)
+
+def dump_part_with_note_text(part, indent, line_break):
+    # Harmony notes copied from the source text with their new tones; only the part's own fields go through
+    # the emitter. None when the source notes cannot be copied at this indent.
+    keys = list(part)
+    split = keys.index('notes')
+    note_text = part.note_text(indent + 4, line_break)
+    if note_text is None:
+        return None
+    text = dump_yaml_item({key: part[key] for key in keys[:split]}, line_break)
+    text += '  notes:' + line_break if note_text else '  notes: []' + line_break
+    text = indent_lines(text, indent) + note_text
+    if keys[split + 1:]:
+        # Dumped as a sequence item too, so long values wrap at the same columns as in a whole-part dump.
+        tail = dump_yaml_item({key: part[key] for key in keys[split + 1:]}, line_break)
+        text += indent_lines('  ' + tail[2:], indent)
+    return text
+
+def dump_sequence_item(item, indent, line_break):
+    if hasattr(item, 'note_text'):
+        text = dump_part_with_note_text(item, indent, line_break)
+        if text is not None:
+            return text
+    return indent_lines(dump_yaml_item(item, line_break), indent)
+
+def is_same_item(item, original):
+    # Parsed parts are compared by identity, so unchanged ones are never constructed; other items by value.
+    if item is original or isinstance(original, LazyMapping):
+        return item is original
+    return item == original
+
+def plan_splices(project):
+    # Returns [(start, end, items, indent, mode)] splices, or None when the change set needs a full dump.
+    # mode is 'append' after the last item, 'replace' for items swapped in place, 'rewrite' for a whole sequence.
+    if project.text is None:
+        return None
+    if list(project) != project.source_keys():
+        return None
+
+    splices = []
+    for key in APPENDABLE_KEYS:
+        if not project.is_loaded(key):
+            continue
+        layout = project.sequence_layout(key)
+        if layout is None:
+            return None
+        original_items = project.original_items(key)
+        current_items = project[key]
+        if len(current_items) < len(original_items):
+            return None
+        new_items = current_items[len(original_items):]
+
+        if original_items and not layout['flow']:
+            # Taken from the source line, as items may be indented past their "- ", e.g. "-   name: ..."
+            indent = item_indent(project.text, layout['items'])
+            if indent is None:
+                return None
+            for item, original, span in zip(current_items, original_items, layout['items']):
+                if is_same_item(item, original):
+                    continue
+                if span is None:
+                    return None
+                splices.append((span[0], span[1], [item], indent, 'replace'))
+            if new_items:
+                splices.append((layout['end'], layout['end'], new_items, indent, 'append'))
+        elif new_items:
+            # Empty or flow-style sequences are rewritten as a block sequence in place.
+            splices.append((layout['start'], layout['end'], list(original_items) + list(new_items), layout['key_column'], 'rewrite'))
+
+    splices.sort(key=lambda splice: (splice[0], splice[1]))
+    return splices
+
+def write_atomic(output_file_path, write_chunks):
+    directory = os.path.dirname(os.path.abspath(output_file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(output_file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            bytes_written = write_chunks(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(output_file_path):
+            shutil.copymode(output_file_path, temp_path)
+        else:
+            os.chmod(temp_path, NEW_FILE_MODE)
+        os.replace(temp_path, output_file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return bytes_written
+
+def serialize_incremental(project, splices, progress=None):
+    # Chunks are (emitted, data): emitted items as encoded bytes, unchanged text as (start, end) offsets into
+    # project.text, so the reused part of the file is only encoded while it is written.
+    text = project.text
+    line_break = detect_line_break(text)
+    item_total = sum(len(splice[2]) for splice in splices)
+    items_done = 0
+    chunks = []
+    cursor = 0
+    for start, end, items, indent, mode in splices:
+        chunks.append((False, (cursor, start)))
+        if mode == 'rewrite' or (mode == 'append' and start > 0 and text[start - 1] != '\n'):
+            chunks.append((True, line_break.encode('utf-8')))
+        for i, item in enumerate(items):
+            emitted = dump_sequence_item(item, indent, line_break)
+            if mode == 'rewrite' and i == len(items) - 1:
+                emitted = emitted.rstrip('\r\n')
+            chunks.append((True, emitted.encode('utf-8')))
+            items_done += 1
+            if progress:
+                progress('serialize', items_done, item_total)
+        cursor = end
+    chunks.append((False, (cursor, len(text))))
+    return chunks
+
+def serialize_full(project, progress=None):
+    data = yaml.dump(project, Dumper=UstxDumper, allow_unicode=True, indent=2, sort_keys=False, encoding='utf-8')
+    if progress:
+        progress('serialize', 1, 1)
+    return [(True, data)]
+
+def save_ustx_project(project, output_file_path, progress=None):
+    # progress(stage, done, total) is called per serialized item and per written chunk; it may raise to abort the save.
+    if not output_file_path.lower().endswith(".ustx"):
+        output_file_path += ".ustx"
+    start_time = time.perf_counter()
+    stats = {'mode': 'incremental', 'bytes_written': 0, 'bytes_reused': 0, 'bytes_emitted': 0, 'elapsed': 0.0}
+
+    def write_chunks(f):
+        # Progress counts emitted bytes plus reused characters, which is known before anything is encoded.
+        total = sum(len(chunk) if emitted else chunk[1] - chunk[0] for emitted, chunk in chunks)
+        done = 0
+        for emitted, chunk in chunks:
+            if emitted:
+                f.write(chunk)
+                stats['bytes_emitted'] += len(chunk)
+                done += len(chunk)
+                if progress:
+                    progress('write', done, total)
+                continue
+            start, end = chunk
+            for block_start in range(start, end, WRITE_BLOCK_CHARS):
+                block_end = min(block_start + WRITE_BLOCK_CHARS, end)
+                data = project.text[block_start:block_end].encode('utf-8')
+                f.write(data)
+                stats['bytes_reused'] += len(data)
+                done += block_end - block_start
+                if progress:
+                    progress('write', done, total)
+        return stats['bytes_emitted'] + stats['bytes_reused']
+
+    try:
+        # A project read from a sidecar loads its source text here, which fails if the file has changed since.
+        splices = plan_splices(project) if isinstance(project, UstxProject) else None
+        if splices is None:
+            stats['mode'] = 'full'
+        chunks = serialize_full(project, progress) if splices is None else serialize_incremental(project, splices, progress)
+        stats['bytes_written'] = write_atomic(output_file_path, write_chunks)
+    except HarmonyJobCancelled:
+        raise
+    except Exception as e:
+        return None, f"Error saving file: {e}"
+    stats['elapsed'] = time.perf_counter() - start_time
+    return stats, None
@@ -0,0 +1,187 @@
+import argparse
+import copy
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from batch import add_harmony_arguments, available_cores, harmony_options, output_path_for
+from instrumentation import configure, get_logger
+from pipeline import harmonize_file
+
+logger = get_logger("watch")
+
+SETTINGS_SUFFIX = '.harmony.json'
+
+class SettingsError(Exception):
+    pass
+
+
+class SettingsParser(argparse.ArgumentParser):
+    # Parses a project's stored settings with the same option definitions as the command line.
+
+    def error(self, message):
+        raise SettingsError(message)
+
+
+def settings_path_for(ustx_file_path):
+    return os.path.splitext(ustx_file_path)[0] + SETTINGS_SUFFIX
+
+def load_project_options(ustx_file_path, settings_parser, defaults):
+    # Options for one project: the command line defaults overridden by its .harmony.json, if there is one.
+    # Settings use the long option names, e.g. {"tracks": "all", "harmony_type": "both", "interval": 4}.
+    args = copy.copy(defaults)
+    settings_path = settings_path_for(ustx_file_path)
+    if os.path.exists(settings_path):
+        try:
+            with open(settings_path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SettingsError(f"{settings_path}: {e}")
+        if not isinstance(settings, dict):
+            raise SettingsError(f"{settings_path}: expected a JSON object")
+        argv = []
+        for key, value in settings.items():
+            name = key.replace('-', '_')
+            if not hasattr(defaults, name):
+                raise SettingsError(f"{settings_path}: unknown setting '{key}'")
+            if isinstance(value, bool):
+                setattr(args, name, value)
+            elif value is not None:
+                if isinstance(value, list):
+                    value = ','.join(str(item) for item in value)
+                argv += ['--' + name.replace('_', '-'), str(value)]
+        args = settings_parser.parse_args(argv, namespace=args)
+    return harmony_options(settings_parser, args)
+
+def is_source_file(file_path, suffix):
+    name = os.path.basename(file_path)
+    return name.lower().endswith('.ustx') and not name.startswith('.') and not name[:-5].endswith(suffix)
+
+def scan(directories, recursive, suffix):
+    # Signature per source project: its own mtime and size plus the mtime of its settings file.
+    signatures = {}
+    for directory in directories:
+        pattern = os.path.join(directory, '**', '*.ustx') if recursive else os.path.join(directory, '*.ustx')
+        for file_path in glob.glob(pattern, recursive=recursive):
+            if not is_source_file(file_path, suffix):
+                continue
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            try:
+                settings_mtime = os.stat(settings_path_for(file_path)).st_mtime_ns
+            except OSError:
+                settings_mtime = None
+            signatures[os.path.abspath(file_path)] = (stat.st_mtime_ns, stat.st_size, settings_mtime)
+    return signatures
+
+def is_up_to_date(file_path, signature, output_file_path):
+    try:
+        output_mtime = os.stat(output_file_path).st_mtime_ns
+    except OSError:
+        return False
+    return output_mtime >= max(signature[0], signature[2] or 0)
+
+def watch_job(ustx_file_path, output_file_path, options, cache_entries):
+    # With --memo-cache the project's SQLite cache takes over from the entries kept in this process.
+    from harmony_cache import ToneCache
+    tone_cache = None if options.get('memo_cache') else ToneCache(cache_entries)
+    try:
+        summary, error = harmonize_file(ustx_file_path, output_file_path, **options, tone_cache=tone_cache)
+    except Exception as e:
+        summary, error = {'input': ustx_file_path, 'output': output_file_path}, f"Unexpected error: {e}"
+    summary['status'] = 'error' if error else 'ok'
+    if error:
+        summary['error'] = error
+    # Only the entries this run used are kept, so the cache holds one generation per project.
+    return summary, tone_cache.used if tone_cache is not None else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch folders and regenerate harmony tracks whenever a USTx project is saved.")
+    parser.add_argument('directories', nargs='+', help="directories to watch")
+    parser.add_argument('-r', '--recursive', action='store_true', help="also watch subdirectories")
+    parser.add_argument('-o', '--output-dir', help="directory for generated projects (default: next to each input)")
+    parser.add_argument('--suffix', default='_harmony', help="suffix appended to output file names; files with it are never treated as sources (default: %(default)s)")
+    add_harmony_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=min(4, available_cores()), help="worker processes (default: up to 4)")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="seconds between folder scans (default: %(default)s)")
+    parser.add_argument('--debounce', type=float, default=2.0, help="seconds a project must stay unchanged before it is regenerated (default: %(default)s)")
+    parser.add_argument('--once', action='store_true', help="bring every output up to date, then exit")
+    parser.add_argument('--log-level', default='INFO', help="diagnostic log level on stderr (default: %(default)s)")
+    args = parser.parse_args(argv)
+    harmony_options(parser, args)
+
+    settings_parser = SettingsParser(add_help=False)
+    add_harmony_arguments(settings_parser)
+    configure(args.log_level, error_log=False)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = max(1, args.jobs)
+
+    seen = {}
+    pending = {}
+    running = {}
+    tone_caches = {}
+    first_scan = True
+    logger.info("Watching %s with %d worker(s)", ", ".join(args.directories), jobs)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=configure, initargs=(args.log_level, None, None, None, False)) as executor:
+        try:
+            while True:
+                now = time.monotonic()
+                signatures = scan(args.directories, args.recursive, args.suffix)
+                for file_path, signature in signatures.items():
+                    if seen.get(file_path) == signature:
+                        continue
+                    seen[file_path] = signature
+                    if first_scan:
+                        if not is_up_to_date(file_path, signature, output_path_for(file_path, args.output_dir, args.suffix)):
+                            pending[file_path] = now
+                    else:
+                        # Every further change pushes the deadline back, so a burst of saves runs once.
+                        pending[file_path] = now + args.debounce
+                for file_path in [file_path for file_path in seen if file_path not in signatures]:
+                    del seen[file_path]
+                    pending.pop(file_path, None)
+                    tone_caches.pop(file_path, None)
+                first_scan = False
+
+                busy = set(running.values())
+                for file_path in sorted(pending, key=pending.get):
+                    if len(running) >= jobs:
+                        break
+                    if pending[file_path] > now or file_path in busy:
+                        continue
+                    del pending[file_path]
+                    try:
+                        options = load_project_options(file_path, settings_parser, args)
+                    except SettingsError as e:
+                        logger.error("Skipping %s: %s", file_path, e)
+                        continue
+                    output_file_path = output_path_for(file_path, args.output_dir, args.suffix)
+                    future = executor.submit(watch_job, file_path, output_file_path, options, tone_caches.get(file_path))
+                    running[future] = file_path
+
+                if args.once and not pending and not running:
+                    break
+                if running:
+                    done, _ = wait(list(running), timeout=args.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    done = ()
+                    time.sleep(args.poll_interval)
+                for future in done:
+                    file_path = running.pop(future)
+                    summary, used_entries = future.result()
+                    if summary['status'] == 'ok':
+                        tone_caches[file_path] = used_entries
+                    print(json.dumps(summary, ensure_ascii=False), flush=True)
+        except KeyboardInterrupt:
+            logger.info("Stopping; waiting for %d running job(s)", len(running))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
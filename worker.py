@@ -1,12 +1,22 @@
-from PyQt6.QtCore import QRunnable, pyqtSlot
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
+
+from instrumentation import get_logger
+from pipeline import JobControl, harmonize_file
+from ustx_harms import HarmonyJobCancelled
+
+logger = get_logger("worker")
+
+class WorkerSignals(QObject):
+    progress = pyqtSignal(str, int, int)
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-from ustx_harms import get_ustx_data, get_track_names, get_key_from_notes, add_harmony_tracks_to_ustx, save_ustx_data, key_names
 
 class HarmonyGeneratorWorker(QRunnable):
 
-    def __init__(self, ustx_file_path, output_file_path, selected_track_indices, harmony_type, semitone_interval, manual_key_selection, key_name, key_mode):
+    def __init__(self, ustx_file_path, output_file_path, selected_track_indices, harmony_type, semitone_interval, manual_key_selection, key_name, key_mode, track_key_changes=False, chord_intervals=None, carry_curves=None, memo_cache=False, split_rests=None):
         super().__init__()
-        print(f"Initializing worker with ustx_file_path: {ustx_file_path}, output_file_path: {output_file_path}, selected_track_indices: {selected_track_indices}, harmony_type: {harmony_type}, semitone_interval: {semitone_interval}, manual_key_selection: {manual_key_selection}, key_name: {key_name}, key_mode: {key_mode}")
         self.ustx_file_path = ustx_file_path
         self.output_file_path = output_file_path
         self.selected_track_indices = selected_track_indices
@@ -15,50 +25,46 @@ class HarmonyGeneratorWorker(QRunnable):
         self.manual_key_selection = manual_key_selection
         self.key_name = key_name
         self.key_mode = key_mode
+        self.track_key_changes = track_key_changes
+        self.chord_intervals = chord_intervals
+        self.carry_curves = carry_curves
+        self.memo_cache = memo_cache
+        self.split_rests = split_rests
+        self.signals = WorkerSignals()
+        self.job = JobControl(progress=self.signals.progress.emit)
+
+    def cancel(self):
+        self.job.cancel()
 
     @pyqtSlot()
     def run(self):
-        print(f"HarmonyGeneratorWorker.run() started, ustx_file_path: {self.ustx_file_path}, output_file_path: {self.output_file_path}")
+        logger.debug(
+            "Harmony job: %s -> %s, tracks %s, harmony type %s, interval %s, chord %s, manual key %s (%s %s), track key changes %s",
+            self.ustx_file_path, self.output_file_path, self.selected_track_indices, self.harmony_type, self.semitone_interval, self.chord_intervals,
+            self.manual_key_selection, self.key_name, self.key_mode, self.track_key_changes
+        )
         try:
-            ustx_data, error_ustx = get_ustx_data(self.ustx_file_path)
-            if error_ustx:
-                print(f"Error loading USTx file: {error_ustx}")
-                return
-
-            track_names = get_track_names(ustx_data)
-            print(f"Loaded track names: {track_names}")
-
-            first_track_notes_for_key_detect = []
-            for voice_part in ustx_data.get('voice_parts', []):
-                if int(voice_part.get('track_no', 0)) == self.selected_track_indices[0]:
-                    first_track_notes_for_key_detect.extend(voice_part.get('notes', []))
-                    
-            if self.manual_key_selection:
-                if self.key_name not in key_names:
-                    print(f"Invalid key name: {self.key_name}")
-                    return
-                key_name = self.key_name
-                key_mode = self.key_mode
-                key_tone_index, _, _ = get_key_from_notes(first_track_notes_for_key_detect)
-            else:
-                key_tone_index, key_name, key_mode = get_key_from_notes(first_track_notes_for_key_detect)
-
-            print(f"Detected key: {key_name} {key_mode} {key_tone_index}")
-
-            modified_ustx_data = add_harmony_tracks_to_ustx(
-                ustx_data, self.selected_track_indices, self.harmony_type, track_names,
-                self.semitone_interval, key_tone_index, key_mode
+            summary, error = harmonize_file(
+                self.ustx_file_path, self.output_file_path, self.selected_track_indices, self.harmony_type,
+                self.semitone_interval, self.manual_key_selection, self.key_name, self.key_mode,
+                self.track_key_changes, verbose=True, job=self.job, chord_intervals=self.chord_intervals, carry_curves=self.carry_curves,
+                memo_cache=self.memo_cache, split_rests=self.split_rests
             )
-
-            save_error = save_ustx_data(modified_ustx_data, self.output_file_path)
-            if save_error:
-                print(f"Error saving file: {save_error}")
-                with open("error_log.txt", "a", encoding="utf-8") as f:
-                    f.write(f"Error saving file: {save_error}\n")
+            if error:
+                logger.error("%s: %s", self.ustx_file_path, error)
+                self.signals.error.emit(error)
             else:
-                print(f"Harmony generation complete")
+                logger.info("Detected key: %s, using %s", summary['detected_key'], summary['key'])
+                for segment in summary.get('key_timeline', []):
+                    logger.info("  from tick %s: %s", segment['position'], segment['key'])
+                for change in summary['harmony_changes']:
+                    logger.info("  %s %s: %s changed, %s added, %s removed", change['status'], change['track'], change['changed'], change['added'], change['removed'])
+                logger.info("Harmony generation complete (%s save: %s bytes in %.3f s)", summary['save_mode'], summary['bytes_written'], summary['timings']['save'])
+                self.signals.finished.emit(summary)
 
+        except HarmonyJobCancelled:
+            logger.info("Harmony generation cancelled")
+            self.signals.cancelled.emit()
         except Exception as e:
-            print(f"Unexpected error: {e}")
-            with open("error_log.txt", "a", encoding="utf-8") as f:
-                f.write(f"Unexpected error: {e}\n")
\ No newline at end of file
+            logger.exception("Unexpected error while harmonizing %s", self.ustx_file_path)
+            self.signals.error.emit(f"Unexpected error: {e}")
\ No newline at end of file